@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+import re
+
+import numpy as np
+
+# Local cost model for the generated queries, evaluated before a query is sent to the
+# database. The unit is an estimated number of db hits: nodes read by the anchor of each
+# MATCH plus relationships expanded from it. Subqueries ({ ... } blocks) run once per row of
+# the scope around them, so nested EXISTS/COUNT/COLLECT multiply.
+# Statistics come from graph_full: label cardinalities, average fanout per (label, edge type,
+# direction) and, for the idN symbols of the generators (idN is vertex N), the exact degree
+# of the vertex per edge type.
+
+PATH_PATTERN = re.compile(r"MATCH\s+((?:\([^()]*\)\s*<?-\[[^\]]*\]->?\s*)*\([^()]*\))")
+NODE_PATTERN = re.compile(r"\((\w*)(?::(\w+))?[^()]*\)")
+RELATION_PATTERN = re.compile(r"(<?)-\[\w*(?::(\w+))?[^\]]*\]-(>?)")
+# ( elementId(idN) = "..." ): node seek, ( idN.id = N ): label scan + filter (no index on id)
+ELEMENT_ID_PIN = re.compile(r"elementId\((\w+)\)\s*=")
+PROPERTY_ID_PIN = re.compile(r"\b(\w+)\.id\s*=\s*\d+")
+# WITH idN MATCH ... of the CALL subqueries imports a variable of the outer scope
+IMPORTED_VARIABLE = re.compile(r"WITH\s+(\w+)\s+MATCH")
+SYMBOL_VERTEX = re.compile(r"id(\d+)$")
+UNION_KEYWORD = re.compile(r"\bUNION(?:\s+ALL)?\b")
+BLOCK_PLACEHOLDER = re.compile(r"\{#(\d+)\}")
+
+
+def split_blocks(text):
+    # replaces every top level { ... } block by {#i}, returns (text, [block contents])
+    # braces inside string literals are ignored
+    outer = []
+    blocks = []
+    depth = 0
+    quote = None
+    start = 0
+    for position, character in enumerate(text):
+        if quote is not None:
+            if character == quote:
+                quote = None
+        elif character in "\"'":
+            quote = character
+        elif character == "{":
+            if depth == 0:
+                start = position
+            depth += 1
+        elif character == "}" and depth > 0:
+            depth -= 1
+            if depth == 0:
+                outer.append("{{#{}}}".format(len(blocks)))
+                blocks.append(text[start+1:position])
+            continue
+        if depth == 0:
+            outer.append(character)
+    return "".join(outer), blocks
+
+
+class QueryCostEstimator():
+    def __init__(self, graph, path_sampler):
+        self.graph = graph
+        self.path_sampler = path_sampler
+        # built on the first estimate, label_vertices() is a pass over every vertex
+        self.label_counts = None
+
+    def statistics(self):
+        if self.label_counts is not None:
+            return
+        graph = self.graph
+        self.num_vertices = graph.num_vertices()
+        self.edge_types = list(graph.gp["edge_types"])
+        self.type_index = {edge_type: index for index, edge_type in enumerate(self.edge_types)}
+        num_types = max(len(self.edge_types), 1)
+        self.num_types = num_types
+        edges = graph.get_edges([graph.ep["type_id"]]).astype(np.int64, copy=False)
+        sources, targets, type_ids = edges[:, 0], edges[:, 1], edges[:, 2]
+        # (vertex, type) keys sorted, the degree of a vertex per type is a bisection
+        self.out_keys = np.sort(sources * num_types + type_ids)
+        self.in_keys = np.sort(targets * num_types + type_ids)
+        # edges per (label, type) leaving/entering the label, and label cardinalities
+        label_counts = {}
+        self.out_counts = {None: np.bincount(type_ids, minlength=num_types)}
+        self.in_counts = {None: self.out_counts[None]}
+        for label, vertices in self.path_sampler.label_vertices().items():
+            mask = np.zeros(self.num_vertices, dtype=bool)
+            mask[vertices] = True
+            label_counts[label] = len(vertices)
+            self.out_counts[label] = np.bincount(type_ids[mask[sources]], minlength=num_types)
+            self.in_counts[label] = np.bincount(type_ids[mask[targets]], minlength=num_types)
+        self.label_counts = label_counts
+
+    def cardinality(self, label):
+        if label is None:
+            return self.num_vertices
+        return self.label_counts.get(label, 0)
+
+    def vertex_degree(self, vertex, edge_type, direction):
+        if direction == "-":
+            # an undirected relationship matches the edges of both directions
+            return self.vertex_degree(vertex, edge_type, ">") + self.vertex_degree(vertex, edge_type, "<")
+        keys = self.out_keys if direction == ">" else self.in_keys
+        if edge_type is None:
+            lower, upper = vertex * self.num_types, (vertex + 1) * self.num_types
+        elif edge_type not in self.type_index:
+            return 0
+        else:
+            lower = vertex * self.num_types + self.type_index[edge_type]
+            upper = lower + 1
+        return int(np.searchsorted(keys, upper) - np.searchsorted(keys, lower))
+
+    def fanout(self, label, edge_type, direction):
+        # average number of edges of edge_type per vertex of the label
+        if direction == "-":
+            return self.fanout(label, edge_type, ">") + self.fanout(label, edge_type, "<")
+        counts = self.out_counts if direction == ">" else self.in_counts
+        if label not in counts or self.cardinality(label) == 0:
+            return 0.0
+        if edge_type is None:
+            edges = counts[label].sum()
+        elif edge_type not in self.type_index:
+            return 0.0
+        else:
+            edges = counts[label][self.type_index[edge_type]]
+        return float(edges) / self.cardinality(label)
+
+    def estimate(self, query):
+        # estimated db hits of a generated query
+        if "TRANSACTIONS" in query:
+            # CALL { ... } IN TRANSACTIONS create/delete a handful of nodes
+            return 0.0
+        self.statistics()
+        return self.scope_cost(query, set())
+
+    def scope_cost(self, text, bound):
+        own, blocks = split_blocks(text)
+        cost = 0.0
+        # branches of a UNION are independent and all executed
+        for branch in UNION_KEYWORD.split(own):
+            pinned = set(ELEMENT_ID_PIN.findall(branch))
+            scanned = set(PROPERTY_ID_PIN.findall(branch)) - pinned
+            imported = set(IMPORTED_VARIABLE.findall(branch)) & bound
+            variables = set(bound)
+            rows = 1.0
+            for path in PATH_PATTERN.findall(branch):
+                path_cost, path_rows, path_variables = self.path_cost(path, bound | imported, pinned, scanned)
+                cost += rows * path_cost
+                rows *= path_rows
+                variables |= path_variables
+            for block in BLOCK_PLACEHOLDER.findall(branch):
+                cost += max(rows, 1.0) * self.scope_cost(blocks[int(block)], variables)
+        return cost
+
+    def path_cost(self, path, bound, pinned, scanned):
+        # (cost, rows, variables) of one MATCH path: anchored at its cheapest node, expanded
+        # to the right end, then from each of those rows to the left end
+        nodes = NODE_PATTERN.findall(path)
+        relations = [
+            (edge_type or None, "<" if left == "<" and right != ">" else ">" if right == ">" and left != "<" else "-")
+            for left, edge_type, right in RELATION_PATTERN.findall(path)
+        ]
+        anchors = []
+        for variable, label in nodes:
+            label = label or None
+            if variable in bound:
+                anchors.append((0.0, 1.0))
+            elif variable in pinned:
+                anchors.append((1.0, 1.0))
+            elif variable in scanned:
+                anchors.append((float(self.cardinality(label)), 1.0))
+            else:
+                anchors.append((float(self.cardinality(label)), float(self.cardinality(label))))
+        if len(anchors) == 0:
+            return 0.0, 1.0, set()
+        anchor = min(range(len(anchors)), key=lambda index: anchors[index])
+        cost, rows = anchors[anchor]
+        for step in range(anchor, len(relations)):
+            # left to right: the relation is followed in its own direction
+            cost, rows = self.expand(cost, rows, nodes[step], nodes[step+1], relations[step][0], relations[step][1], bound, pinned, scanned)
+        for step in range(anchor - 1, -1, -1):
+            direction = {">": "<", "<": ">"}.get(relations[step][1], "-")
+            cost, rows = self.expand(cost, rows, nodes[step+1], nodes[step], relations[step][0], direction, bound, pinned, scanned)
+        return cost, rows, set(variable for variable, _ in nodes if variable)
+
+    def expand(self, cost, rows, source, target, edge_type, direction, bound, pinned, scanned):
+        variable, label = source
+        known_vertex = SYMBOL_VERTEX.match(variable)
+        if known_vertex and (variable in bound or variable in pinned or variable in scanned) and int(known_vertex.group(1)) < self.num_vertices:
+            fanout = self.vertex_degree(int(known_vertex.group(1)), edge_type, direction)
+        else:
+            fanout = self.fanout(label or None, edge_type, direction)
+        cost += rows * fanout
+        if target[0] in bound or target[0] in pinned or target[0] in scanned:
+            # a fixed endpoint keeps at most the parallel edges
+            return cost, min(rows * fanout, rows)
+        return cost, rows * fanout
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+from query_ir import NodePattern, RelationshipPattern, PathPattern, Match, Subquery, Where, Return, Query
+
+# Tokenizer and parser of the Cypher the generators write, into query_ir trees:
+#   [OPTIONAL] MATCH path, ... [WHERE term AND ...] [CALL { ... }] [RETURN [DISTINCT] item, ...]
+#   [ORDER BY ...] [SKIP n] [LIMIT n]
+# with paths made of (symbol:Label|Label) nodes and -[symbol:TYPE*0..1]-> relationships, and
+# EXISTS { }, COUNT { } > 0 and NOT isEmpty( COLLECT { } ) terms parsed as subqueries.
+# Predicates, return items and the bodies of subqueries that are not a single query (UNION,
+# WITH, CALL) are kept as the text of the query. Anything else raises ValueError.
+# The text is scanned once by one compiled pattern, subquery bodies are parsed from the same
+# tokens. Parses are cached by text and shared: the trees must not be modified (see
+# query_ir.Query.replace).
+
+# key: the text, upper case for names (keywords are matched on it)
+Token = namedtuple("Token", ["kind", "text", "start", "end", "key"])
+
+# (spaces, token) per match: string, name, number or symbol
+TOKEN_PATTERN = re.compile(r"""(\s*)(
+    "(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'
+  | [^\W\d]\w*|`[^`]*`
+  | \d+(?:\.\d+)?
+  | \.\.|<>|<=|>=|\S
+)""", re.VERBOSE)
+
+OPENING = {"(": ")", "[": "]", "{": "}"}
+# keywords ending the WHERE terms of a query
+CLAUSE_KEYWORDS = {"CALL", "RETURN", "ORDER", "SKIP", "LIMIT", "UNION", "WITH", "MATCH", "OPTIONAL"}
+OTHER_KEYWORDS = {"ORDER", "SKIP", "LIMIT"}
+
+
+@lru_cache(maxsize=4096)
+def tokenize(text):
+    # findall and the kind from the first character: no match objects
+    tokens = []
+    position = 0
+    for spaces, token in TOKEN_PATTERN.findall(text):
+        start = position + len(spaces)
+        position = start + len(token)
+        first = token[0]
+        if first.isdigit():
+            tokens.append(Token("number", token, start, position, token))
+        elif first in "\"'":
+            tokens.append(Token("string", token, start, position, token))
+        elif first.isalpha() or first in "_`":
+            tokens.append(Token("name", token, start, position, token.upper()))
+        else:
+            tokens.append(Token("symbol", token, start, position, token))
+    return tuple(tokens)
+
+
+@lru_cache(maxsize=4096)
+def parse_query(text):
+    # query_ir.Query of a generated query
+    return Parser(text).query()
+
+
+@lru_cache(maxsize=4096)
+def parse_pattern(text):
+    # PathPatterns of a pattern, e.g. "(a:User)-[]->(b),(b)<-[:RATED]-()"
+    parser = Parser(text)
+    paths = parser.paths()
+    parser.expect_end()
+    return tuple(paths)
+
+
+def rename_symbols(text, names):
+    # text with the symbols (variables) in `names` renamed, in one pass over its tokens;
+    # strings, labels and property keys are left as they are
+    out = []
+    position = 0
+    previous = None
+    for token in tokenize(text):
+        if token.kind == "name" and token.text in names and (previous is None or previous.text not in (":", ".", "|")):
+            out.append(text[position:token.start])
+            out.append(names[token.text])
+            position = token.end
+        previous = token
+    out.append(text[position:])
+    return "".join(out)
+
+
+class Parser():
+    # parses tokens[start:end] of text, the whole text by default
+    def __init__(self, text, tokens=None, start=0, end=None, closings=None):
+        self.text = text
+        self.tokens = tokenize(text) if tokens is None else tokens
+        self.position = start
+        self.end = len(self.tokens) if end is None else end
+        self.closings = self.match_brackets() if closings is None else closings
+
+    def match_brackets(self):
+        # position of the closing bracket of each opening one, strings are single tokens
+        closings = {}
+        stack = []
+        for position, token in enumerate(self.tokens):
+            if token.kind != "symbol":
+                continue
+            if token.text in OPENING:
+                stack.append(position)
+            elif token.text in (")", "]", "}"):
+                if len(stack) == 0 or OPENING[self.tokens[stack[-1]].text] != token.text:
+                    self.position = position
+                    raise self.error("balanced brackets")
+                closings[stack.pop()] = position
+        if len(stack) > 0:
+            self.position = stack[-1]
+            raise self.error("balanced brackets")
+        return closings
+
+    def error(self, expected):
+        if self.position < len(self.tokens):
+            found = "'{}' at {}".format(self.tokens[self.position].text, self.tokens[self.position].start)
+        else:
+            found = "end of query"
+        return ValueError("Cannot parse {!r}: expected {}, found {}".format(self.text, expected, found))
+
+    def peek(self, offset=0):
+        position = self.position + offset
+        return self.tokens[position] if position < self.end else None
+
+    def at(self, *texts, offset=0):
+        # keywords and symbols never share a text, strings keep their quotes
+        position = self.position + offset
+        return position < self.end and self.tokens[position].key in texts
+
+    def accept(self, *texts):
+        if self.at(*texts):
+            self.position += 1
+            return True
+        return False
+
+    def expect(self, text):
+        if not self.accept(text):
+            raise self.error("'{}'".format(text))
+
+    def expect_end(self):
+        if self.position < self.end:
+            raise self.error("end of query")
+
+    def name(self):
+        token = self.peek()
+        if token is None or token.kind != "name":
+            raise self.error("a name")
+        self.position += 1
+        return token.text
+
+    def skip_block(self):
+        # from an opening bracket to after the matching closing one
+        self.position = self.closings[self.position] + 1
+
+    def source(self, start, end):
+        # text of tokens[start:end]
+        if start >= end:
+            return ""
+        return self.text[self.tokens[start].start:self.tokens[end - 1].end]
+
+    def query(self):
+        optional = self.accept("OPTIONAL")
+        self.expect("MATCH")
+        match = Match(self.paths(), optional)
+        where = self.where() if self.accept("WHERE") else None
+        calls = []
+        while self.at("CALL") and self.at("{", offset=1):
+            self.position += 1
+            calls.append(Subquery("CALL", self.block_body()))
+        ret = None
+        if self.accept("RETURN"):
+            distinct = self.accept("DISTINCT")
+            ret = Return(self.items(), distinct)
+        other = ""
+        if self.at(*OTHER_KEYWORDS):
+            other = self.source(self.position, self.end)
+            self.position = self.end
+        self.expect_end()
+        return Query(match, where, calls, ret, other)
+
+    def paths(self):
+        paths = [self.path()]
+        while self.accept(","):
+            paths.append(self.path())
+        return paths
+
+    def path(self):
+        nodes = [self.node()]
+        relationships = []
+        while self.at("-", "<"):
+            relationships.append(self.relationship())
+            nodes.append(self.node())
+        return PathPattern(nodes, relationships)
+
+    def node(self):
+        self.expect("(")
+        symbol = self.name() if self.peek() is not None and self.peek().kind == "name" else ""
+        labels = self.labels()
+        self.expect(")")
+        return NodePattern(symbol, labels)
+
+    def labels(self):
+        # :A:B is ["A", "B"], :A|B is ["A|B"]
+        labels = []
+        while self.accept(":"):
+            label = [self.name()]
+            while self.accept("|"):
+                label.append(self.name())
+            labels.append("|".join(label))
+        return labels
+
+    def relationship(self):
+        left = self.accept("<")
+        self.expect("-")
+        self.expect("[")
+        symbol = self.name() if self.peek() is not None and self.peek().kind == "name" else ""
+        types = self.labels()
+        length = ""
+        if self.at("*"):
+            start = self.position
+            self.position += 1
+            while self.peek() is not None and (self.peek().kind == "number" or self.at("..")):
+                self.position += 1
+            length = "".join(token.text for token in self.tokens[start:self.position])
+        self.expect("]")
+        self.expect("-")
+        right = self.accept(">")
+        if left and right:
+            raise self.error("one direction")
+        return RelationshipPattern(symbol, [type_ for label in types for type_ in label.split("|")], "<" if left else ">" if right else "-", length)
+
+    def block_body(self):
+        # { ... }: its content parsed as a query, or its text when it is not a single query
+        start = self.position
+        self.skip_block()
+        try:
+            return Parser(self.text, self.tokens, start + 1, self.position - 1, self.closings).query()
+        except ValueError:
+            return self.source(start + 1, self.position - 1)
+
+    def where(self):
+        # terms joined by AND at the top level, kept as one term when there is an OR or XOR
+        start = self.position
+        terms = []
+        term_start = self.position
+        has_or = False
+        while self.position < self.end:
+            key = self.tokens[self.position].key
+            if key in CLAUSE_KEYWORDS and not (key == "WITH" and self.tokens[self.position - 1].key in ("STARTS", "ENDS")):
+                # WITH of STARTS WITH / ENDS WITH is an operator
+                break
+            if key == "AND":
+                terms.append((term_start, self.position))
+                self.position += 1
+                term_start = self.position
+            elif key in ("OR", "XOR"):
+                has_or = True
+                self.position += 1
+            elif key in OPENING:
+                self.skip_block()
+            else:
+                self.position += 1
+        terms.append((term_start, self.position))
+        if any(term_start >= term_end for term_start, term_end in terms):
+            raise self.error("a predicate")
+        if has_or:
+            return Where([self.source(start, self.position)])
+        return Where([self.term(term_start, term_end) for term_start, term_end in terms])
+
+    def term(self, start, end):
+        # EXISTS { }, COUNT { } > 0, NOT isEmpty( COLLECT { } ) or the text of the predicate
+        words = [token.key for token in self.tokens[start:start + 4]]
+        if words[:2] == ["EXISTS", "{"]:
+            kind, body_start, tail = "EXISTS", start + 1, []
+        elif words[:2] == ["COUNT", "{"]:
+            kind, body_start, tail = "COUNT", start + 1, [">", "0"]
+        elif words == ["NOT", "ISEMPTY", "(", "COLLECT"] and start + 4 < end and self.tokens[start + 4].text == "{":
+            kind, body_start, tail = "COLLECT", start + 4, [")"]
+        else:
+            return self.source(start, end)
+        position = self.position
+        self.position = body_start
+        body = self.block_body()
+        body_end = self.position
+        self.position = position
+        if [token.text for token in self.tokens[body_end:end]] != tail:
+            return self.source(start, end)
+        return Subquery(kind, body)
+
+    def items(self):
+        items = []
+        start = self.position
+        while self.position < self.end and self.tokens[self.position].key not in OTHER_KEYWORDS:
+            key = self.tokens[self.position].key
+            if key == ",":
+                items.append(self.source(start, self.position))
+                self.position += 1
+                start = self.position
+            elif key in OPENING:
+                self.skip_block()
+            else:
+                self.position += 1
+        items.append(self.source(start, self.position))
+        if "" in items:
+            raise self.error("a return item")
+        return items
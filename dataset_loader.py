@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+import json
+
+import numpy as np
+import pandas as pd
+
+import graph_tool.all as gt
+from tqdm import tqdm
+
+from schema_scanner import Neo4jSchemaScanner
+
+# Offline replacement of Neo4jSchemaScanner.scan: builds the schema and graph_full from
+# exported files instead of a live database. Supported exports:
+#   CSV   apoc.export.csv.*  (_id, _labels, <properties>, _start, _end, _type)
+#         neo4j-admin import (name:ID(space), :LABEL, <name:type>, :START_ID, :END_ID, :TYPE)
+#   JSONL apoc.export.json.* ({"type": "node", ...} / {"type": "relationship", ...} per line)
+# Nodes and relationships may be in one file or in two. Files are read in chunks of
+# scan_batch_size rows with pandas, three times: schema, nodes, relationships.
+
+# header of the apoc csv export -> column role
+APOC_COLUMNS = {"_id": "id", "_labels": "labels", "_start": "source", "_end": "target", "_type": "type"}
+# ":KIND" of a neo4j-admin header -> column role
+ADMIN_COLUMNS = {"ID": "id", "LABEL": "labels", "START_ID": "source", "END_ID": "target", "TYPE": "type"}
+# ":type" of a neo4j-admin property header -> pandas dtype
+ADMIN_TYPES = {
+    "int": "Int64", "long": "Int64", "short": "Int64", "byte": "Int64",
+    "float": "float64", "double": "float64",
+    "boolean": "boolean",
+    "string": "string",
+}
+
+
+def value_type(value):
+    # valueType() of a parsed value
+    if isinstance(value, (bool, np.bool_)):
+        return "BOOLEAN NOT NULL"
+    if isinstance(value, (int, np.integer)):
+        return "INTEGER NOT NULL"
+    if isinstance(value, (float, np.floating)):
+        return "FLOAT NOT NULL"
+    if isinstance(value, str):
+        return "STRING NOT NULL"
+    if isinstance(value, dict):
+        return "MAP NOT NULL"
+    if isinstance(value, list):
+        element_types = set(value_type(element) for element in value)
+        if len(element_types) == 1:
+            return "LIST<{}> NOT NULL".format(element_types.pop())
+        return "LIST<ANY> NOT NULL"
+    return "ANY NOT NULL"
+
+
+def parse_csv_column(column):
+    # untyped csv property column (read as strings) -> booleans, integers, floats, json lists
+    values = column.dropna()
+    if len(values) == 0:
+        return column
+    if values.str.lower().isin(["true", "false"]).all():
+        return column.str.lower().map({"true": True, "false": False}).astype("boolean")
+    if values.str.fullmatch(r"-?\d+").all():
+        return pd.to_numeric(column).astype("Int64")
+    if pd.to_numeric(values, errors="coerce").notna().all():
+        return pd.to_numeric(column)
+    if (values.str.startswith("[") & values.str.endswith("]")).all():
+        # apoc writes list properties as json arrays
+        try:
+            return column.map(json.loads, na_action="ignore")
+        except ValueError:
+            return column
+    return column
+
+
+def column_types(column):
+    # value types of one property column in the order they appear, vectorized for the
+    # numeric dtypes
+    values = column.dropna()
+    if len(values) == 0:
+        return []
+    if pd.api.types.is_bool_dtype(values.dtype):
+        return ["BOOLEAN NOT NULL"]
+    if pd.api.types.is_integer_dtype(values.dtype):
+        return ["INTEGER NOT NULL"]
+    if pd.api.types.is_float_dtype(values.dtype):
+        return ["FLOAT NOT NULL"]
+    return list(values.map(value_type).unique())
+
+
+class DatasetLoader(Neo4jSchemaScanner):
+    def __init__(self, nodes_path, relationships_path=None, id_property=""):
+        self.nodes_path = nodes_path
+        self.relationships_path = relationships_path
+        # node property holding the export id in the database, see pin_nodes
+        self.id_property = id_property
+        # names of the neo4j-admin :ID columns ("" for an unnamed one)
+        self.id_columns = []
+        self.init_scanning_configs()
+        # there is no database to write n.id to, vertices get dense indices
+        self.read_only_scan = 1
+        # export id -> neo4j_id, only used when the export ids are not integers
+        self.export_id_index = {}
+        self.numeric_ids = None
+
+    def paths(self):
+        if self.relationships_path and self.relationships_path != self.nodes_path:
+            return [self.nodes_path, self.relationships_path]
+        return [self.nodes_path]
+
+    def scan(self, graph_full=None):
+        if graph_full is None:
+            graph_full = gt.Graph(directed=True)
+        self.graph_full = graph_full
+        print("===LOADING DATASET {}===".format(", ".join(self.paths())))
+        self.scan_dataset_schema()
+        self.print_schema_info()
+        self.init_graph_maps(-1)
+        self.pin_nodes()
+        self.load_dataset_nodes()
+        self.load_dataset_relations()
+        self.fill_connectivity(self.connectivity_counts)
+        if self.node_connectivity:
+            self.scan_connectivity_matrix()
+        self.scan_degree_statistics()
+        print("Graph filled")
+        print("===============")
+        return self.node_labels, self.edge_labels, self.node_properties, self.connectivity_matrix, self.properties_types, self.graph_full
+
+    def pin_nodes(self):
+        # How the generated predicates find the database node of a vertex (see
+        # PropertyStore.export_node_predicate):
+        #   id_property set:        n.<id_property> = <its value>, a property (ideally indexed)
+        #                           that holds the export id in the database
+        #   neo4j-admin export:     n.<name> = <export id>, the property written by the import
+        #                           for the name of a name:ID column
+        #   apoc export:            id(n) = <export id> (elementId(n) for non numeric ids), the
+        #                           ids of the exported database, i.e. the database under test
+        pin_properties = [self.id_property] if self.id_property else [name for name in self.id_columns if name]
+        pin_ids = ""
+        if not self.id_property and len(self.id_columns) == 0:
+            pin_ids = "id" if self.numeric_ids else "element_id"
+        if len(pin_properties) == 0 and not pin_ids:
+            print("Warning: the export has no node ids known to the database, generated queries do not pin nodes")
+        self.graph_full.gp["pin_properties"] = self.graph_full.new_graph_property("object")
+        self.graph_full.gp["pin_properties"] = pin_properties
+        self.graph_full.gp["pin_ids"] = self.graph_full.new_graph_property("string")
+        self.graph_full.gp["pin_ids"] = pin_ids
+
+    def read_export(self, path):
+        # yields (nodes, node properties, relations) frames per chunk, nodes/relations have
+        # the columns id, labels and id, source, target, type
+        if path.endswith(".csv"):
+            header = pd.read_csv(path, nrows=0).columns
+            roles = {}
+            property_columns = {}
+            id_columns = set()
+            dtypes = {}
+            for column in header:
+                if column in APOC_COLUMNS:
+                    roles[APOC_COLUMNS[column]] = (column, "")
+                    dtypes[column] = str
+                    continue
+                name, _, kind = column.partition(":")
+                id_space = kind[kind.find("(")+1:-1] if "(" in kind else ""
+                kind = kind.split("(")[0]
+                if kind in ADMIN_COLUMNS:
+                    roles[ADMIN_COLUMNS[kind]] = (column, id_space)
+                    dtypes[column] = str
+                    if kind == "ID":
+                        if name not in self.id_columns:
+                            self.id_columns.append(name)
+                        if name:
+                            # the id column is also a property of the node, a string like
+                            # the ones written by the import (default --id-type)
+                            property_columns[column] = name
+                            id_columns.add(column)
+                    continue
+                property_columns[column] = name
+                # untyped columns are read as strings and parsed per chunk
+                dtypes[column] = ADMIN_TYPES.get(kind, str)
+            for chunk in pd.read_csv(path, chunksize=self.scan_batch_size, dtype=dtypes, low_memory=False):
+                for column in property_columns:
+                    if dtypes[column] is str and column not in id_columns:
+                        chunk[column] = parse_csv_column(chunk[column])
+                yield self.normalize_csv_chunk(chunk, roles, property_columns)
+        else:
+            for chunk in pd.read_json(path, lines=True, chunksize=self.scan_batch_size, dtype=False):
+                yield self.normalize_json_chunk(chunk)
+
+    @staticmethod
+    def prefixed_ids(chunk, role):
+        column, id_space = role
+        ids = chunk[column].astype(str)
+        # ids of a neo4j-admin id space are only unique inside the space
+        return id_space + ":" + ids if id_space else ids
+
+    def normalize_csv_chunk(self, chunk, roles, property_columns):
+        is_relation = chunk[roles["source"][0]].notna() if "source" in roles else pd.Series(False, index=chunk.index)
+        node_rows = chunk[~is_relation]
+        nodes = pd.DataFrame(index=node_rows.index)
+        if "id" in roles:
+            nodes["id"] = self.prefixed_ids(node_rows, roles["id"])
+        else:
+            nodes["id"] = node_rows.index.astype(str)
+        if "labels" in roles:
+            # ":Movie:Person" (apoc) or "Movie;Person" (neo4j-admin)
+            nodes["labels"] = node_rows[roles["labels"][0]].fillna("").str.split(r"[:;]", regex=True).map(
+                lambda labels: [label for label in labels if label]
+            )
+        else:
+            nodes["labels"] = [[] for _ in range(len(node_rows))]
+        properties = node_rows[list(property_columns.keys())].rename(columns=property_columns)
+        properties = properties.loc[:, properties.notna().any()]
+
+        relation_rows = chunk[is_relation]
+        relations = pd.DataFrame(index=relation_rows.index)
+        if len(relation_rows) > 0:
+            relations["source"] = self.prefixed_ids(relation_rows, roles["source"])
+            relations["target"] = self.prefixed_ids(relation_rows, roles["target"])
+            relations["type"] = relation_rows[roles["type"][0]].astype(str)
+            if "id" in roles and relation_rows[roles["id"][0]].notna().all():
+                relations["id"] = pd.to_numeric(relation_rows[roles["id"][0]], errors="coerce")
+        return nodes, properties, relations
+
+    @staticmethod
+    def normalize_json_chunk(chunk):
+        chunk = chunk.reset_index(drop=True)
+        node_rows = chunk[chunk["type"] == "node"].reset_index(drop=True)
+        nodes = pd.DataFrame({
+            "id": node_rows["id"].astype(str),
+            "labels": node_rows["labels"].map(lambda labels: labels if isinstance(labels, list) else []),
+        })
+        # max_level=0: map and list values stay python objects
+        properties = pd.json_normalize(
+            node_rows["properties"].map(lambda properties: properties if isinstance(properties, dict) else {}).tolist(),
+            max_level=0
+        )
+        relation_rows = chunk[chunk["type"] == "relationship"].reset_index(drop=True)
+        relations = pd.DataFrame(index=relation_rows.index)
+        if len(relation_rows) > 0:
+            relations["source"] = relation_rows["start"].str.get("id").astype(str)
+            relations["target"] = relation_rows["end"].str.get("id").astype(str)
+            relations["type"] = relation_rows["label"].astype(str)
+            relations["id"] = pd.to_numeric(relation_rows["id"], errors="coerce")
+        return nodes, properties, relations
+
+    def scan_dataset_schema(self):
+        # same outputs as scan_properties_types_batched, from the exported values
+        label_properties_types = {}
+        edge_labels = set()
+        numeric_ids = True
+        self.node_count = 0
+        self.edge_count = 0
+        for path in self.paths():
+            for nodes, properties, relations in tqdm(self.read_export(path)):
+                self.node_count += len(nodes)
+                self.edge_count += len(relations)
+                if len(relations) > 0:
+                    edge_labels.update(relations["type"].unique())
+                if len(nodes) == 0:
+                    continue
+                numeric_ids = numeric_ids and bool(nodes["id"].str.fullmatch(r"-?\d+").all())
+                frame = properties.assign(__labels=nodes["labels"]).explode("__labels")
+                for label in frame["__labels"].dropna().unique():
+                    label_properties_types.setdefault(label, {})
+                for label, group in frame.groupby("__labels"):
+                    for key in properties.columns:
+                        types = column_types(group[key])
+                        if len(types) > 0:
+                            # a dict keeps the types in the order they were seen
+                            label_properties_types[label].setdefault(key, {}).update(dict.fromkeys(types))
+        # decided on the whole id column, export_node_ids maps every chunk the same way
+        self.numeric_ids = numeric_ids
+        self.node_labels = sorted(label_properties_types.keys())
+        self.edge_labels = sorted(edge_labels)
+        self.node_properties = {}
+        self.set_properties_types({
+            label: {key: list(types) for key, types in label_properties_types[label].items()}
+            for label in self.node_labels
+        })
+
+    def export_node_ids(self, ids, create=False):
+        # neo4j_id of each export id: the id itself when every node id is an integer (see
+        # scan_dataset_schema), otherwise a dense number in order of discovery. -1 for unknown ids.
+        if self.numeric_ids:
+            numbers = pd.to_numeric(ids, errors="coerce")
+            return numbers.fillna(-1).to_numpy(dtype=np.int64)
+        if create:
+            for export_id in ids[~ids.isin(self.export_id_index)].unique():
+                self.export_id_index[export_id] = len(self.export_id_index)
+        return ids.map(self.export_id_index).fillna(-1).to_numpy(dtype=np.int64)
+
+    def load_dataset_nodes(self):
+        print("Adding vertices with their labels and properties")
+        for path in self.paths():
+            for nodes, properties, _ in tqdm(self.read_export(path)):
+                if len(nodes) == 0:
+                    continue
+                neo4j_ids = self.export_node_ids(nodes["id"], create=True)
+                vertices = self.node_vertices(neo4j_ids, create=True)
+                # the distinct label lists of the chunk are interned once
+                codes, label_sets = pd.factorize(nodes["labels"].map(tuple))
+                label_set_ids = self.label_set_ids(list(label_sets))[codes]
+                self.property_store.add_frame(vertices, self.graph_full.gp["label_sets"], label_set_ids, properties.reset_index(drop=True))
+                self.graph_full.vp["label_set"].a[vertices] = label_set_ids
+                if not self.numeric_ids:
+                    # the export ids, elementId() of the nodes when gp["pin_ids"] is "element_id"
+                    element_ids = self.graph_full.vp["element_id"]
+                    for vertice, export_id in zip(vertices, nodes["id"]):
+                        element_ids[self.graph_full.vertex(vertice)] = export_id
+                self.mirror_node_count += len(nodes)
+        if self.graph_full.num_vertices() > 0:
+            self.largest_node_id = int(self.graph_full.vp["neo4j_id"].a.max())
+
+    def load_dataset_relations(self):
+        print("Adding edges")
+        connectivity_counts = {}
+        skipped = 0
+        next_relation_id = 0
+        # label set of each vertex (see Neo4jSchemaScanner.label_set_ids)
+        label_sets = self.graph_full.gp["label_sets"]
+        vertex_label_set = self.graph_full.vp["label_set"].a
+        edge_types = self.graph_full.gp["edge_types"]
+        for path in self.paths():
+            for _, _, relations in tqdm(self.read_export(path)):
+                if len(relations) == 0:
+                    continue
+                if "id" not in relations or relations["id"].isna().any():
+                    relation_ids = np.arange(next_relation_id, next_relation_id + len(relations))
+                else:
+                    relation_ids = relations["id"].to_numpy(dtype=np.int64)
+                next_relation_id = max(next_relation_id, int(relation_ids.max()) + 1)
+                sources = self.node_vertices(self.export_node_ids(relations["source"]))
+                targets = self.node_vertices(self.export_node_ids(relations["target"]))
+                # relationships whose endpoints are not in the node export are dropped
+                known = (sources >= 0) & (targets >= 0)
+                skipped += int((~known).sum())
+                sources, targets, relation_ids = sources[known], targets[known], relation_ids[known]
+                codes, types = pd.factorize(relations["type"][known])
+                for edge_type in types:
+                    if edge_type not in edge_types:
+                        edge_types.append(edge_type)
+                type_ids = np.array([edge_types.index(edge_type) for edge_type in types], dtype=np.int64)[codes]
+                # same insertion as add_relations, the columns are built without python rows
+                self.graph_full.add_edge_list(
+                    np.column_stack([sources, targets, type_ids, relation_ids]),
+                    eprops=[self.graph_full.ep["type_id"], self.graph_full.ep["rel_id"]]
+                )
+                self.mirror_edge_count += len(relation_ids)
+                # (label set, type, label set) counts, expanded to single labels like
+                # scan_connectivity_aggregated
+                label_set_counts = pd.DataFrame({
+                    "source": vertex_label_set[sources],
+                    "type": codes,
+                    "target": vertex_label_set[targets],
+                }).value_counts()
+                for (source_set, type_code, target_set), edge_count in label_set_counts.items():
+                    for source_label in label_sets[source_set]:
+                        for target_label in label_sets[target_set]:
+                            key = (source_label, types[type_code], target_label)
+                            connectivity_counts[key] = connectivity_counts.get(key, 0) + int(edge_count)
+        if skipped > 0:
+            print("{} relationships with an unknown endpoint were skipped".format(skipped))
+        self.largest_edge_id = next_relation_id - 1
+        self.connectivity_counts = connectivity_counts
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+import os
+import threading
+from collections import namedtuple
+
+# Pool of ready made subquery fragments: a sampled path of graph_full (a query_ir.PathPattern)
+# and the predicates pinning its symbols to the path vertices, e.g.
+#   path:       (id3:User)-[:RATED]->(id150:Movie)
+#   conditions: ["( id3.id = 3 )", "( id150.id = 150 )"]
+#   symbols:    ["id3", "id150"]
+# A background thread keeps the pool at `capacity` fragments built by a fork of the generator
+# (own random stream and path sampler, see build_fragment). A fragment is handed out up to
+# `max_uses` times and then evicted, the thread replaces it. The generator assembles nested
+# subqueries from them (RandomCypherGenerator_subqueries_with_graph.fragment_subquery)
+# instead of sampling a path and formatting it for every level.
+# Fragments are shared by the queries built from them and never modified.
+# The fragments depend on when the thread ran, so a generator forked with a seed does not
+# use the pool (fork(seed, fragment_pool=False)) and its queries replay exactly.
+# A failing build_fragment is reported and retried; after `max_failures` failures in a row
+# the thread stops and take() raises the last error instead of waiting on an empty pool.
+Fragment = namedtuple("Fragment", ["path", "conditions", "symbols"])
+
+
+class FragmentPool():
+    def __init__(self, generator, capacity, max_uses, max_failures=100):
+        self.generator = generator
+        self.capacity = capacity
+        self.max_uses = max_uses
+        self.max_failures = max_failures
+        self.pid = None
+
+    def start(self):
+        # the thread starts on first use, again in a forked process (threads are not forked)
+        if self.pid == os.getpid():
+            return
+        self.pid = os.getpid()
+        self.builder = self.generator.fork(fragment_pool=False)
+        # [fragment, uses]
+        self.fragments = []
+        self.error = None
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.fill, daemon=True)
+        self.thread.start()
+
+    def fill(self):
+        failures = 0
+        while True:
+            with self.condition:
+                while len(self.fragments) >= self.capacity:
+                    self.condition.wait()
+            try:
+                fragment = self.builder.build_fragment()
+            except Exception as e:
+                failures += 1
+                print("Fragment failed: {}".format(str(e)))
+                if failures >= self.max_failures:
+                    with self.condition:
+                        self.error = e
+                    return
+                continue
+            failures = 0
+            with self.condition:
+                self.fragments.append([fragment, 0])
+                self.condition.notify_all()
+
+    def take(self, rng):
+        # random fragment of the pool, None while it is still empty
+        self.start()
+        with self.condition:
+            if self.error is not None:
+                raise RuntimeError("fragment pool stopped after {} failures".format(self.max_failures)) from self.error
+            if len(self.fragments) == 0:
+                return None
+            position = rng.randint(0, len(self.fragments) - 1)
+            entry = self.fragments[position]
+            entry[1] += 1
+            if entry[1] >= self.max_uses:
+                self.fragments[position] = self.fragments[-1]
+                self.fragments.pop()
+                self.condition.notify_all()
+            return entry[0]
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+import configparser
+from types import MappingProxyType
+
+import numpy as np
+
+from property_store import PropertyStore
+from graph_index import PathSampler
+from cost_estimator import QueryCostEstimator
+
+# Everything a query generator reads but never writes: the parsed graphgenie.ini, the schema,
+# graph_full and the indexes built on it.
+# It is built once by the top level generator and shared by reference with every nested
+# generator (EXISTS, COUNT, COLLECT, UNION and WITH branches), so creating one of them does
+# not read the config file or rebuild anything.
+
+# (section, key, type) of the settings copied to the generators as attributes
+GENERATION_SETTINGS = [
+    ('default', 'graphdb', str),
+    ('default', 'language', str),
+    ('default', 'verbose', int),
+    ('testing_configs', '_node_num', int),
+    ('query_generation_args', 'min_node_num', int),
+    ('query_generation_args', 'max_node_num', int),
+    ('query_generation_args', 'variable_pathlen_rate', float),
+    ('query_generation_args', 'node_symbol_rate', float),
+    ('query_generation_args', 'edge_symbol_rate', float),
+    ('query_generation_args', 'node_label_rate', float),
+    ('query_generation_args', 'edge_label_rate', float),
+    ('query_generation_args', 'multi_node_label_rate', float),
+    ('query_generation_args', 'multi_edge_label_rate', float),
+    ('query_generation_args', 'cyclic_rate', float),
+    ('query_generation_args', 'random_symbol_len', int),
+    ('query_generation_args', 'cyclic_symbol', str),
+    ('query_generation_args', 'multi_node_labels', int),
+    ('query_generation_args', 'multi_edge_labels', int),
+    # estimated db hits above which a query is generated again (0: no estimation)
+    ('query_generation_args', 'cost_budget', float),
+    ('query_generation_args', 'cost_budget_action', str),
+    ('query_generation_args', 'cost_budget_retries', int),
+    # subquery fragments kept ready (0: no pool) and times each one is used
+    ('query_generation_args', 'fragment_pool_size', int),
+    ('query_generation_args', 'fragment_max_uses', int),
+]
+
+
+class GenerationContext():
+    def __init__(self, node_labels, edge_labels, node_properties, connectivity_matrix, property_types_dict, graph_full, config_path='graphgenie.ini'):
+        config = configparser.ConfigParser()
+        config.read(config_path)
+        self.config = config
+        self.settings = MappingProxyType({key: value_type(config[section][key]) for section, key, value_type in GENERATION_SETTINGS})
+        self.node_labels = node_labels
+        self.edge_labels = edge_labels
+        self.node_properties = node_properties
+        self.connectivity_matrix = connectivity_matrix
+        self.property_types_dict = property_types_dict
+        self.graph_full = graph_full
+        self.property_store = PropertyStore.from_graph(graph_full)
+        self.path_sampler = PathSampler(
+            graph_full,
+            no_revisit=int(config['query_generation_args']['path_no_revisit']),
+            max_attempts=int(config['query_generation_args']['path_sample_attempts']),
+            batch_size=int(config['query_generation_args']['path_batch_size']),
+            max_depth=self.settings['max_node_num'],
+            property_store=self.property_store,
+            supernode_mode=config['query_generation_args']['supernode_mode'],
+            supernode_degree=config['query_generation_args']['supernode_degree'],
+            supernode_exponent=float(config['query_generation_args']['supernode_exponent']),
+            verbose=self.settings['verbose']
+        )
+        self.cost_estimator = QueryCostEstimator(graph_full, self.path_sampler) if self.settings['cost_budget'] > 0 else None
+        self._frozen = True
+
+    def __setattr__(self, name, value):
+        # the context is shared by all generators, none of them may change it
+        if getattr(self, '_frozen', False):
+            raise AttributeError("GenerationContext is read-only, cannot set {}".format(name))
+        object.__setattr__(self, name, value)
+
+
+class RandomStream():
+    # the choice/randint/uniform/shuffle calls of the random module on a numpy Generator, so
+    # each generator (worker) draws from its own stream and a seed replays the same queries
+    def __init__(self, seed=None):
+        # seed: None, an int or a numpy SeedSequence (see spawn)
+        self.generator = np.random.default_rng(seed)
+
+    @staticmethod
+    def spawn(seed, number):
+        # independent SeedSequences of `number` workers derived from one seed
+        return np.random.SeedSequence(seed).spawn(number)
+
+    def random(self):
+        return float(self.generator.random())
+
+    def randint(self, a, b):
+        # a <= N <= b
+        return int(self.generator.integers(a, b, endpoint=True))
+
+    def choice(self, seq):
+        if len(seq) == 0:
+            raise IndexError("Cannot choose from an empty sequence")
+        return seq[int(self.generator.integers(len(seq)))]
+
+    def uniform(self, a, b):
+        return float(self.generator.uniform(a, b))
+
+    def shuffle(self, x):
+        self.generator.shuffle(x)
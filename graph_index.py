@@ -0,0 +1,587 @@
+#!/usr/bin/env python3
+import copy
+import numpy as np
+import scipy.sparse as sp
+
+from property_store import PropertyStore
+
+# Index structures over graph_full used by the scanners and the generators.
+
+
+class SparseAdjacency():
+    # One CSR matrix per edge type: row = source vertex, column = target vertex,
+    # value = number of parallel edges. Replaces the dense (N x N) matrix per edge type.
+    # Pairs are accumulated as COO chunks (add_pairs) and converted once (finalize).
+    def __init__(self, num_vertices, edge_types):
+        self.num_vertices = num_vertices
+        self.edge_types = list(edge_types)
+        self.edge_type_index = {edge_type: index for index, edge_type in enumerate(self.edge_types)}
+        self.chunks = {edge_type: [] for edge_type in self.edge_types}
+        self.matrices = {}
+        # derived matrices (all types, transposed, undirected) built on first use
+        self.views = {}
+
+    @staticmethod
+    def from_graph(graph):
+        # vectorized build from graph_full (ep["type_id"] / gp["edge_types"])
+        edges = graph.get_edges([graph.ep["type_id"]])
+        adjacency = SparseAdjacency(graph.num_vertices(), graph.gp["edge_types"])
+        adjacency.add_typed_pairs(edges[:, 0], edges[:, 1], edges[:, 2])
+        adjacency.finalize()
+        return adjacency
+
+    def add_pairs(self, edge_type, sources, targets):
+        if edge_type not in self.chunks:
+            self.edge_type_index[edge_type] = len(self.edge_types)
+            self.edge_types.append(edge_type)
+            self.chunks[edge_type] = []
+        self.chunks[edge_type].append((np.asarray(sources, dtype=np.int64), np.asarray(targets, dtype=np.int64)))
+
+    def add_typed_pairs(self, sources, targets, type_ids):
+        # one chunk of mixed edge types, split without a python loop over the edges
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        type_ids = np.asarray(type_ids)
+        for type_id in np.unique(type_ids):
+            selected = type_ids == type_id
+            self.add_pairs(self.edge_types[type_id], sources[selected], targets[selected])
+
+    def finalize(self):
+        for edge_type, chunks in self.chunks.items():
+            if len(chunks) == 0:
+                sources = targets = np.zeros(0, dtype=np.int64)
+            else:
+                sources = np.concatenate([chunk[0] for chunk in chunks])
+                targets = np.concatenate([chunk[1] for chunk in chunks])
+            matrix = sp.coo_matrix(
+                (np.ones(len(sources), dtype=np.uint32), (sources, targets)),
+                shape=(self.num_vertices, self.num_vertices)
+            ).tocsr()
+            # duplicated (source, target) pairs are summed by the conversion
+            matrix.sum_duplicates()
+            self.matrices[edge_type] = matrix
+        self.chunks = {edge_type: [] for edge_type in self.edge_types}
+        self.views = {}
+
+    def matrix(self, edge_type=None, direction=">"):
+        # edge_type None: all types, direction ">" out edges, "<" in edges, "-" both
+        if (edge_type, direction) in self.views:
+            return self.views[(edge_type, direction)]
+        if direction == ">":
+            if edge_type is None:
+                empty = sp.csr_matrix((self.num_vertices, self.num_vertices), dtype=np.uint32)
+                matrix = sum(self.matrices.values(), empty).tocsr()
+            else:
+                matrix = self.matrices[edge_type]
+        elif direction == "<":
+            matrix = self.matrix(edge_type, ">").transpose().tocsr()
+        else:
+            matrix = (self.matrix(edge_type, ">") + self.matrix(edge_type, "<")).tocsr()
+        self.views[(edge_type, direction)] = matrix
+        return matrix
+
+    def neighbours(self, vertex, edge_type=None, direction=">"):
+        matrix = self.matrix(edge_type, direction)
+        return matrix.indices[matrix.indptr[vertex]:matrix.indptr[vertex+1]]
+
+    def degree(self, vertex=None, edge_type=None, direction=">"):
+        # number of edges (parallel edges included), for all vertices when vertex is None
+        matrix = self.matrix(edge_type, direction)
+        if vertex is None:
+            return np.asarray(matrix.sum(axis=1)).ravel()
+        return int(matrix.data[matrix.indptr[vertex]:matrix.indptr[vertex+1]].sum())
+
+    def edge_count(self, source, target, edge_type):
+        return int(self.matrices[edge_type][source, target])
+
+
+def degree_statistics(graph):
+    # degree distribution of graph_full: {"out"/"in"/"total": {"mean", "max", "p50", ...}}
+    edges = graph.get_edges().astype(np.int64, copy=False)
+    num_vertices = graph.num_vertices()
+    out_degrees = np.bincount(edges[:, 0], minlength=num_vertices)
+    in_degrees = np.bincount(edges[:, 1], minlength=num_vertices)
+    stats = {}
+    for name, degrees in (("out", out_degrees), ("in", in_degrees), ("total", out_degrees + in_degrees)):
+        if len(degrees) == 0:
+            degrees = np.zeros(1, dtype=np.int64)
+        stats[name] = {"mean": float(degrees.mean()), "max": int(degrees.max())}
+        for percentile in (50, 90, 99, 99.9):
+            stats[name]["p{:g}".format(percentile)] = float(np.percentile(degrees, percentile))
+    return stats
+
+
+class DepthIndex():
+    # depth[v]: number of vertices of the longest walk starting at v, capped at max_depth.
+    # Computed bottom-up with one segmented max over the CSR neighbour list per level:
+    #   depth_1(v) = 1, depth_k(v) = 1 + max(depth_k-1(u) for u in neighbours(v))
+    # Walks may go through a vertex twice, so for simple paths the depth is an upper bound.
+    # Vertices are kept sorted by decreasing depth: the vertices with depth >= k are a prefix,
+    # globally and in the bucket of each label.
+    def __init__(self, indptr, neighbours, max_depth):
+        self.max_depth = max_depth
+        num_vertices = len(indptr) - 1
+        depth = np.ones(num_vertices, dtype=np.int32)
+        has_edges = np.diff(indptr) > 0
+        segments = indptr[:-1][has_edges]
+        for _ in range(max_depth - 1):
+            if len(segments) == 0:
+                break
+            # segments of vertices without neighbours are skipped, so each reduceat range
+            # is exactly the neighbour list of one vertex
+            deeper = depth.copy()
+            deeper[has_edges] = np.minimum(np.maximum.reduceat(depth[neighbours], segments) + 1, max_depth)
+            if np.array_equal(deeper, depth):
+                break
+            depth = deeper
+        self.depth = depth
+        self.order, self.at_least = self.sorted_by_depth(np.arange(num_vertices))
+        # {label: (vertices by decreasing depth, at_least)}, see label_buckets()
+        self.buckets = None
+
+    def sorted_by_depth(self, vertices):
+        # (vertices by decreasing depth, at_least[k] = number of them with depth >= k)
+        depths = self.depth[vertices]
+        order = vertices[np.argsort(-depths, kind="stable")]
+        counts = np.bincount(depths, minlength=self.max_depth + 2)
+        at_least = np.cumsum(counts[::-1])[::-1]
+        return order, at_least
+
+    def label_buckets(self, label_vertices):
+        # one bucket per node label, built on first use
+        # label_vertices: {label: vertices}, see PathSampler.label_vertices()
+        if self.buckets is None:
+            self.buckets = {
+                label: self.sorted_by_depth(vertices)
+                for label, vertices in label_vertices.items()
+            }
+        return self.buckets
+
+    def vertices(self, min_depth, label=None, label_vertices=None):
+        # all vertices (of the label) with depth >= min_depth
+        order, at_least = self.order, self.at_least
+        if label is not None:
+            buckets = self.label_buckets(label_vertices)
+            if label not in buckets:
+                return np.zeros(0, dtype=np.int64)
+            order, at_least = buckets[label]
+        return order[:at_least[min(max(min_depth, 0), self.max_depth + 1)]]
+
+    def random_vertices(self, min_depths, rng, label=None, label_vertices=None):
+        # one random vertex with depth >= min_depths[i] per entry, -1 when there is none
+        order, at_least = self.order, self.at_least
+        if label is not None:
+            buckets = self.label_buckets(label_vertices)
+            if label not in buckets:
+                return np.full(len(min_depths), -1, dtype=np.int64)
+            order, at_least = buckets[label]
+        counts = at_least[np.clip(min_depths, 0, self.max_depth + 1)]
+        vertices = np.full(len(min_depths), -1, dtype=np.int64)
+        available = counts > 0
+        vertices[available] = order[rng.integers(counts[available])]
+        return vertices
+
+
+class PathSampler():
+    # Bounded random walks over graph_full. Each step draws a random neighbour from a CSR
+    # neighbour list, so a path costs O(path length) instead of a traversal of everything
+    # reachable from the start vertex.
+    # direction ">" follows out edges, "<" in edges, "-" both.
+    # no_revisit: a walk never visits a vertex twice (the paths are simple, as with the DFS).
+    # A few random neighbours are probed first, the O(degree) filter only runs when they
+    # were all visited already.
+    # Start vertices and steps are guided by a DepthIndex: a walk of k vertices starts at a
+    # vertex of depth >= k and only steps to neighbours deep enough for the rest of the walk,
+    # so it cannot dead-end. Retries are only left for no_revisit walks that run into a cycle.
+    # Paths from a random start are served from a pool filled batch_size walks at a time by
+    # sample_batch, which advances all walks of a batch with one numpy step.
+    # sample_pattern walks a label/edge type pattern such as
+    # (:User)-[:RATED]->(:Movie)-[:IN_GENRE]->() over per (edge type, target label) neighbour
+    # lists, edge_types_of gives the edge type of each hop of a path.
+    # Supernodes (total degree above supernode_degree, a number or a percentile such as "p99"
+    # of gp["degree_stats"]) make the generated queries expensive:
+    #   supernode_mode = cap:    their edges are left out of every neighbour list
+    #   supernode_mode = weight: a vertex is kept as a start or a hop with probability
+    #                            min(1, (supernode_degree / degree) ** supernode_exponent)
+    probes = 8
+
+    def __init__(self, graph, no_revisit=True, max_attempts=1000, batch_size=1, max_depth=8, seed=None, property_store=None,
+                 supernode_mode="none", supernode_degree="p99", supernode_exponent=1.0, verbose=0):
+        self.graph = graph
+        self.no_revisit = no_revisit
+        self.max_attempts = max_attempts
+        self.batch_size = batch_size
+        self.max_depth = max_depth
+        self.property_store = property_store
+        self.supernode_mode = supernode_mode
+        self.supernode_degree = supernode_degree
+        self.supernode_exponent = supernode_exponent
+        self.verbose = verbose
+        self.rng = np.random.default_rng(seed)
+        self.rebuild()
+
+    def fork(self, seed=None):
+        # sampler with its own random stream and path pools, sharing the neighbour lists and
+        # indexes (built here first so the forks do not each build them)
+        self.depth_index(">")
+        sampler = copy.copy(self)
+        sampler.rng = np.random.default_rng(seed)
+        sampler.pools = {}
+        return sampler
+
+    def rebuild(self):
+        # call after graph_full changed (e.g. SchemaScanner.refresh)
+        self.edges = None
+        self.csrs = {}
+        self.typed_csrs = {}
+        self.depth_indexes = {}
+        self.pools = {}
+        self.labels = None
+        self.pattern_masks = {}
+
+    def edge_arrays(self):
+        # (sources, targets, edge indices) of graph_full, also sets the total degree and the
+        # acceptance probability of every vertex
+        if self.edges is None:
+            num_vertices = self.graph.num_vertices()
+            edges = self.graph.get_edges([self.graph.edge_index]).astype(np.int64, copy=False)
+            sources, targets, edge_ids = edges[:, 0], edges[:, 1], edges[:, 2]
+            self.degrees = np.bincount(sources, minlength=num_vertices) + np.bincount(targets, minlength=num_vertices)
+            self.supernode_threshold = self.degree_threshold()
+            self.acceptance = np.ones(num_vertices)
+            if self.supernode_mode == "cap":
+                kept = (self.degrees[sources] <= self.supernode_threshold) & (self.degrees[targets] <= self.supernode_threshold)
+                sources, targets, edge_ids = sources[kept], targets[kept], edge_ids[kept]
+            elif self.supernode_mode == "weight":
+                self.acceptance = np.minimum(1.0, (self.supernode_threshold / np.maximum(self.degrees, 1)) ** self.supernode_exponent)
+            self.edges = (sources, targets, edge_ids)
+        return self.edges
+
+    def degree_threshold(self):
+        # supernode_degree as a number of edges, at least one
+        threshold = str(self.supernode_degree)
+        if not threshold.startswith("p"):
+            return max(float(threshold), 1.0)
+        stats = self.graph.gp["degree_stats"] if "degree_stats" in self.graph.graph_properties else {}
+        if threshold in stats.get("total", {}):
+            return max(stats["total"][threshold], 1.0)
+        return max(float(np.percentile(self.degrees, float(threshold[1:]))), 1.0) if len(self.degrees) > 0 else 1.0
+
+    def accepted(self, vertices):
+        # rejection step of supernode_mode = weight, always true otherwise
+        if self.supernode_mode != "weight":
+            return np.ones(len(vertices), dtype=bool)
+        return self.rng.random(len(vertices)) < self.acceptance[vertices]
+
+    def csr(self, direction=">"):
+        # (indptr, neighbours, edge indices) of every vertex
+        if direction in self.csrs:
+            return self.csrs[direction]
+        num_vertices = self.graph.num_vertices()
+        sources, targets, edge_ids = self.edge_arrays()
+        if direction == "<":
+            sources, targets = targets, sources
+        elif direction == "-":
+            sources, targets = np.concatenate([sources, targets]), np.concatenate([targets, sources])
+            edge_ids = np.concatenate([edge_ids, edge_ids])
+        self.csrs[direction] = self.build_csr(num_vertices, sources, targets, edge_ids)
+        return self.csrs[direction]
+
+    @staticmethod
+    def build_csr(num_vertices, sources, targets, edge_ids):
+        # neighbour lists are sorted, so the edges between two vertices are found by bisection
+        order = np.lexsort((targets, sources))
+        indptr = np.zeros(num_vertices + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=num_vertices), out=indptr[1:])
+        return indptr, targets[order], edge_ids[order]
+
+    def typed_csr(self, edge_type=None, direction=">", target_label=None):
+        # neighbour lists restricted to edges of edge_type and to neighbours with target_label,
+        # None: no restriction. Built on first use.
+        if edge_type is None and target_label is None:
+            return self.csr(direction)
+        key = (edge_type, direction, target_label)
+        if key not in self.typed_csrs:
+            indptr, neighbours, edge_ids = self.csr(direction)
+            sources = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+            selected = np.ones(len(neighbours), dtype=bool)
+            if edge_type is not None:
+                edge_types = list(self.graph.gp["edge_types"])
+                type_id = edge_types.index(edge_type) if edge_type in edge_types else -1
+                selected &= self.graph.ep["type_id"].a[edge_ids] == type_id
+            if target_label is not None:
+                selected &= self.label_mask(target_label)[neighbours]
+            self.typed_csrs[key] = self.build_csr(len(indptr) - 1, sources[selected], neighbours[selected], edge_ids[selected])
+        return self.typed_csrs[key]
+
+    def label_vertices(self):
+        # {label: vertices}, one pass over the property store on first use
+        if self.labels is None:
+            if self.property_store is None:
+                self.property_store = PropertyStore.from_graph(self.graph)
+            labels = {}
+            for vertice in range(self.graph.num_vertices()):
+                for label in self.property_store.labels(vertice):
+                    labels.setdefault(label, []).append(vertice)
+            self.labels = {label: np.array(vertices, dtype=np.int64) for label, vertices in labels.items()}
+        return self.labels
+
+    def label_mask(self, label):
+        mask = np.zeros(self.graph.num_vertices(), dtype=bool)
+        mask[self.label_vertices().get(label, [])] = True
+        return mask
+
+    def edge_types_of(self, path, direction=">"):
+        # edge type of each hop of a path, a random one among parallel edges, None when two
+        # consecutive vertices are not adjacent. O(log degree) per hop.
+        indptr, neighbours, edge_ids = self.csr(direction)
+        edge_types = self.graph.gp["edge_types"]
+        type_ids = self.graph.ep["type_id"].a
+        hops = []
+        for source, target in zip(path[:-1], path[1:]):
+            lower, upper = indptr[int(source)], indptr[int(source) + 1]
+            first = lower + np.searchsorted(neighbours[lower:upper], int(target), side="left")
+            last = lower + np.searchsorted(neighbours[lower:upper], int(target), side="right")
+            if first == last:
+                hops.append(None)
+            else:
+                hops.append(edge_types[type_ids[edge_ids[first + self.rng.integers(last - first)]]])
+        return hops
+
+    def depth_index(self, direction=">"):
+        if direction not in self.depth_indexes:
+            indptr, neighbours, _ = self.csr(direction)
+            self.depth_indexes[direction] = DepthIndex(indptr, neighbours, self.max_depth)
+        return self.depth_indexes[direction]
+
+    def start_vertices(self, direction=">", min_length=2, label=None):
+        # vertices (of the label) that start a walk of min_length vertices, min_length=2: the
+        # vertices with an edge in `direction`
+        return self.depth_index(direction).vertices(min_length, label, self.label_vertices() if label is not None else None)
+
+    def walk(self, start, length, direction=">", no_revisit=None):
+        # path of at most `length` vertices starting at `start`, shorter on a dead end
+        if no_revisit is None:
+            no_revisit = self.no_revisit
+        indptr, neighbours, _ = self.csr(direction)
+        depth = self.depth_index(direction).depth
+        path = [int(start)]
+        visited = {path[0]}
+        while len(path) < length:
+            lower, upper = indptr[path[-1]], indptr[path[-1] + 1]
+            if upper == lower:
+                break
+            # depth needed by the next vertex to complete the walk
+            needed = min(length - len(path), self.max_depth)
+            for _ in range(self.probes):
+                vertex = int(neighbours[lower + self.rng.integers(upper - lower)])
+                if depth[vertex] >= needed and (not no_revisit or vertex not in visited) and self.accepted([vertex])[0]:
+                    break
+            else:
+                candidates = neighbours[lower:upper]
+                if no_revisit:
+                    candidates = candidates[~np.isin(candidates, path)]
+                if len(candidates) == 0:
+                    break
+                deep_enough = candidates[depth[candidates] >= needed]
+                if len(deep_enough) > 0:
+                    candidates = deep_enough
+                vertex = int(self.weighted_choice(candidates))
+                if not self.accepted([vertex])[0]:
+                    # only supernodes left: a shorter walk (and a retry) instead
+                    break
+            path.append(vertex)
+            visited.add(vertex)
+        return path
+
+    def sample(self, min_length, max_length=None, start=None, direction=">", no_revisit=None, label=None):
+        # path of min_length..max_length vertices, from `start` or from a random vertex (with
+        # `label`) deep enough for it. Gives up after max_attempts walks and returns the
+        # longest one.
+        if max_length is None or max_length < min_length:
+            max_length = min_length
+        if no_revisit is None:
+            no_revisit = self.no_revisit
+        index = self.depth_index(direction)
+        if start is None and self.batch_size > 1:
+            path = self.pooled_sample(min_length, max_length, direction, no_revisit, label)
+            if path is not None:
+                return path
+        longest = [] if start is None else [int(start)]
+        if start is not None and index.depth[int(start)] < min(min_length, self.max_depth):
+            # no walk from this vertex is long enough
+            return self.walk(start, min_length, direction, no_revisit)
+        for _ in range(self.max_attempts):
+            length = int(self.rng.integers(min_length, max_length + 1))
+            if start is None:
+                first = self.random_starts(np.array([min(length, self.max_depth)]), direction, label)[0]
+                if first < 0:
+                    first = self.random_starts(np.array([min(min_length, self.max_depth)]), direction, label)[0]
+                if first < 0:
+                    break
+            else:
+                first = start
+                length = min(length, max(int(index.depth[int(start)]), min_length))
+            path = self.walk(first, length, direction, no_revisit)
+            if len(path) >= min_length:
+                return path
+            if len(path) > len(longest):
+                longest = path
+        if self.verbose:
+            print("COULD NOT FIND A PATH")
+        return longest
+
+    def random_starts(self, min_depths, direction=">", label=None):
+        # DepthIndex.random_vertices, with supernode_mode = weight rejected starts are redrawn
+        index = self.depth_index(direction)
+        label_vertices = self.label_vertices() if label is not None else None
+        starts = index.random_vertices(min_depths, self.rng, label, label_vertices)
+        for _ in range(self.probes - 1):
+            rejected = np.flatnonzero((starts >= 0) & ~self.accepted(np.maximum(starts, 0)))
+            if len(rejected) == 0:
+                break
+            starts[rejected] = index.random_vertices(min_depths[rejected], self.rng, label, label_vertices)
+        return starts
+
+    def weighted_choice(self, candidates, vertices=None):
+        # random candidate, weighted by the acceptance probability of its vertex with
+        # supernode_mode = weight. vertices: the vertex of each candidate when the candidates
+        # are not vertices themselves (e.g. positions in a neighbour list).
+        if self.supernode_mode != "weight":
+            return candidates[self.rng.integers(len(candidates))]
+        weights = self.acceptance[candidates if vertices is None else vertices]
+        return candidates[self.rng.choice(len(candidates), p=weights / weights.sum())]
+
+    def pooled_sample(self, min_length, max_length, direction, no_revisit, label=None):
+        # next path of the pool, None when no batch produced a long enough walk
+        key = (min_length, max_length, direction, bool(no_revisit), label)
+        pool = self.pools.setdefault(key, [])
+        if len(pool) == 0:
+            index = self.depth_index(direction)
+            for _ in range(max(1, self.max_attempts // self.batch_size)):
+                # same length distribution as sample(): a random target length per walk
+                lengths = self.rng.integers(min_length, max_length + 1, size=self.batch_size)
+                starts = self.random_starts(np.minimum(lengths, self.max_depth), direction, label)
+                if (starts < 0).all():
+                    return None
+                lengths, starts = lengths[starts >= 0], starts[starts >= 0]
+                paths = self.sample_batch(starts, lengths, direction, no_revisit)
+                walked = (paths >= 0).sum(axis=1)
+                selected = walked >= min_length
+                if selected.any():
+                    break
+            else:
+                return None
+            pool.extend(path[:length] for path, length in zip(paths[selected].tolist(), walked[selected].tolist()))
+        return pool.pop()
+
+    def sample_batch(self, starts, lengths, direction=">", no_revisit=None):
+        # Walks of at most lengths[i] vertices (or one length for all) from every start vertex,
+        # advanced together: each step is a handful of numpy operations over all live walks.
+        # Returns a (len(starts), max(lengths)) array of vertices, -1 after the end of a walk.
+        # With no_revisit a walk ends when `probes` random neighbours were all unusable.
+        if no_revisit is None:
+            no_revisit = self.no_revisit
+        indptr, neighbours, _ = self.csr(direction)
+        depth = self.depth_index(direction).depth
+        starts = np.asarray(starts, dtype=np.int64)
+        lengths = np.broadcast_to(np.asarray(lengths, dtype=np.int64), starts.shape)
+        length = int(lengths.max()) if len(starts) > 0 else 0
+        paths = np.full((len(starts), length), -1, dtype=np.int64)
+        if length == 0:
+            return paths
+        paths[:, 0] = starts
+        rows = np.arange(len(starts))
+        for step in range(1, length):
+            rows = rows[lengths[rows] > step]
+            current = paths[rows, step - 1]
+            lower = indptr[current]
+            degrees = indptr[current + 1] - lower
+            has_edges = degrees > 0
+            rows, lower, degrees = rows[has_edges], lower[has_edges], degrees[has_edges]
+            needed = np.minimum(lengths[rows] - step, self.max_depth)
+            chosen = np.full(len(rows), -1, dtype=np.int64)
+            pending = np.arange(len(rows))
+            for probe in range(self.probes):
+                candidates = neighbours[lower[pending] + self.rng.integers(degrees[pending])]
+                accepted = self.accepted(candidates)
+                fresh = (depth[candidates] >= needed[pending]) & accepted
+                if probe == self.probes - 1:
+                    # last probe: a shallower neighbour still beats ending the walk
+                    fresh = accepted
+                if no_revisit:
+                    fresh &= ~(paths[rows[pending], :step] == candidates[:, None]).any(axis=1)
+                chosen[pending[fresh]] = candidates[fresh]
+                pending = pending[~fresh]
+                if len(pending) == 0:
+                    break
+            extended = chosen >= 0
+            rows = rows[extended]
+            paths[rows, step] = chosen[extended]
+            if len(rows) == 0:
+                break
+        return paths
+
+    def pattern_mask(self, node_labels, edge_steps):
+        # masks[i]: vertices that can match node i and continue until the end of the pattern,
+        # one segmented max over the typed neighbour lists per step, from the last node back
+        key = (tuple(node_labels), tuple(edge_steps))
+        if key not in self.pattern_masks:
+            num_vertices = self.graph.num_vertices()
+            masks = [None] * len(node_labels)
+            masks[-1] = self.label_mask(node_labels[-1]) if node_labels[-1] is not None else np.ones(num_vertices, dtype=bool)
+            for step in range(len(edge_steps) - 1, -1, -1):
+                edge_type, direction = edge_steps[step]
+                indptr, neighbours, _ = self.typed_csr(edge_type, direction, node_labels[step + 1])
+                has_edges = np.diff(indptr) > 0
+                mask = np.zeros(num_vertices, dtype=bool)
+                if has_edges.any():
+                    mask[has_edges] = np.maximum.reduceat(masks[step + 1][neighbours], indptr[:-1][has_edges])
+                if node_labels[step] is not None:
+                    mask &= self.label_mask(node_labels[step])
+                masks[step] = mask
+            self.pattern_masks[key] = masks
+        return self.pattern_masks[key]
+
+    def sample_pattern(self, node_labels, edge_steps, start=None, no_revisit=None):
+        # Path matching a pattern, e.g. (:User)-[:RATED]->(:Movie)-[:IN_GENRE]->():
+        #   node_labels = ["User", "Movie", None], edge_steps = [("RATED", ">"), ("IN_GENRE", ">")]
+        # None matches any label/type. Every step picks a random neighbour among the ones that
+        # still complete the pattern (probed first, filtered only when the probes miss), so
+        # only no_revisit can make a walk fail.
+        # Returns (vertices, edge indices), ([], []) when nothing matches.
+        if no_revisit is None:
+            no_revisit = self.no_revisit
+        masks = self.pattern_mask(node_labels, edge_steps)
+        candidates = np.flatnonzero(masks[0])
+        if start is not None:
+            candidates = candidates[candidates == int(start)]
+        if len(candidates) == 0:
+            return [], []
+        for _ in range(self.max_attempts):
+            path = [int(self.weighted_choice(candidates))]
+            edges = []
+            for step, (edge_type, direction) in enumerate(edge_steps):
+                indptr, neighbours, edge_ids = self.typed_csr(edge_type, direction, node_labels[step + 1])
+                lower, upper = indptr[path[-1]], indptr[path[-1] + 1]
+                if upper == lower:
+                    break
+                for _ in range(self.probes):
+                    position = lower + self.rng.integers(upper - lower)
+                    vertex = int(neighbours[position])
+                    if masks[step + 1][vertex] and (not no_revisit or vertex not in path) and self.accepted([vertex])[0]:
+                        break
+                else:
+                    usable = np.flatnonzero(masks[step + 1][neighbours[lower:upper]])
+                    if no_revisit:
+                        usable = usable[~np.isin(neighbours[lower + usable], path)]
+                    if len(usable) == 0:
+                        break
+                    # usable holds offsets into the neighbour list, weighted by their vertices.
+                    # The weighted choice already has the distribution of the accepted probes.
+                    position = lower + self.weighted_choice(usable, neighbours[lower + usable])
+                path.append(int(neighbours[position]))
+                edges.append(int(edge_ids[position]))
+            else:
+                return path, edges
+        return [], []
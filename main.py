@@ -8,6 +8,7 @@ import configparser
 import datetime
 
 from schema_scanner import *
+from dataset_loader import DatasetLoader
 from query_generator import *
 from query_mutator_sequential import *
 from query_generator_subqueries_with_graph import *
@@ -33,7 +34,10 @@ if __name__ == "__main__":
 
 
 
-    schema_scanner = Neo4jSchemaScanner(ip, port, username, password)
+    if config['dataset']['nodes_path']:
+        schema_scanner = DatasetLoader(config['dataset']['nodes_path'], config['dataset']['relationships_path'], config['dataset']['id_property'])
+    else:
+        schema_scanner = Neo4jSchemaScanner(ip, port, username, password)
     node_labels, edge_labels, node_properties, connectivity_matrix, properties_types,graph_full = schema_scanner.scan(graph_full)
     
     print("CONNECTIVITY MATRIX:",connectivity_matrix)
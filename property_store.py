@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+import json
+
+import numpy as np
+
+# Node labels and properties of graph_full.
+# Two layouts are supported, both live in internal property maps of the graph so they are
+# saved and loaded with it:
+#   object:   vp["labels"] (python list) and vp["properties"] (python dict) per vertex
+#   columnar: interned label ids, one typed column per property key with a mask of the
+#             vertices that have a value, strings in a pool shared by all columns
+# Edge types are always interned in ep["type_id"] / gp["edge_types"].
+# Use PropertyStore.from_graph(graph) to get the reader matching the graph.
+
+# valueType() of the scanner -> property map value type of the column
+COLUMN_TYPES = {
+    "INTEGER NOT NULL": "int64_t",
+    "FLOAT NOT NULL": "double",
+    "BOOLEAN NOT NULL": "bool",
+    "STRING NOT NULL": "string",
+}
+
+
+class PropertyStore():
+    def __init__(self, graph):
+        self.graph = graph
+
+    @staticmethod
+    def from_graph(graph):
+        if "columns" in graph.graph_properties:
+            return ColumnarPropertyStore(graph)
+        return ObjectPropertyStore(graph)
+
+    def edge_type(self, edge):
+        return self.graph.gp["edge_types"][self.graph.ep["type_id"][edge]]
+
+    def edge_types(self):
+        return self.graph.gp["edge_types"]
+
+    def is_mirrored(self, vertice):
+        return bool(self.graph.vp["mirrored"][vertice])
+
+    def properties(self, vertice):
+        return {key: self.value(vertice, key) for key in self.keys(vertice)}
+
+    def node_predicate(self, symbol, vertice):
+        # predicate pinning `symbol` to the database node mirrored by `vertice`
+        if "pin_properties" in self.graph.graph_properties:
+            return self.export_node_predicate(symbol, vertice)
+        if "element_id" in self.graph.vertex_properties:
+            # read-only scan: nothing was written to the database
+            return "( elementId({}) = \"{}\" )".format(symbol, self.graph.vp["element_id"][vertice])
+        return "( {}.id = {} )".format(symbol, int(vertice))
+
+    def export_node_predicate(self, symbol, vertice):
+        # graph_full loaded from an export (dataset_loader): the node is found by the first of
+        # gp["pin_properties"] it has a value for (the export id stored as a property), else by
+        # its export id when those are the ids of the database: gp["pin_ids"] is "id" (id(n)),
+        # "element_id" (elementId(n)) or "" (not known to the database, no predicate)
+        for key in self.graph.gp["pin_properties"]:
+            value = self.value(vertice, key)
+            if isinstance(value, (str, int, float, np.integer, np.floating)) and not isinstance(value, (bool, np.bool_)):
+                value = json.dumps(value.item() if isinstance(value, np.generic) else value)
+                return "( {}.`{}` = {} )".format(symbol, key, value)
+        if self.graph.gp["pin_ids"] == "id":
+            return "( id({}) = {} )".format(symbol, int(self.graph.vp["neo4j_id"][vertice]))
+        if self.graph.gp["pin_ids"] == "element_id":
+            return "( elementId({}) = {} )".format(symbol, json.dumps(self.graph.vp["element_id"][vertice]))
+        return "True"
+
+
+class ObjectPropertyStore(PropertyStore):
+    def init_maps(self, label_properties_types=None):
+        self.graph.vp["labels"] = self.graph.new_vertex_property("object")
+        self.graph.vp["properties"] = self.graph.new_vertex_property("object")
+        self.graph.vp["mirrored"] = self.graph.new_vertex_property("bool")
+
+    def add_nodes(self, nodes):
+        for node in nodes:
+            vertice = self.graph.vertex(node["vertex"])
+            self.graph.vp["labels"][vertice] = node["labels"]
+            self.graph.vp["properties"][vertice] = node["properties"]
+            self.graph.vp["mirrored"][vertice] = True
+
+    def add_frame(self, vertices, label_sets, label_set_ids, properties):
+        # bulk form of add_nodes: label_sets[label_set_ids[row]] are the labels and the
+        # properties DataFrame (one column per key, missing values are NA) the properties of
+        # vertices[row]. The layout keeps python objects per vertex, so the rows are built here.
+        keys = list(properties.columns)
+        present = properties.notna().to_numpy()
+        values = properties.to_numpy(dtype=object)
+        for row, (vertice, label_set_id) in enumerate(zip(vertices, label_set_ids)):
+            vertice = self.graph.vertex(vertice)
+            self.graph.vp["labels"][vertice] = list(label_sets[label_set_id])
+            self.graph.vp["properties"][vertice] = {keys[column]: values[row, column] for column in np.flatnonzero(present[row])}
+        self.graph.vp["mirrored"].a[vertices] = True
+
+    def clear_node(self, vertice):
+        self.graph.vp["labels"][vertice] = None
+        self.graph.vp["properties"][vertice] = None
+        self.graph.vp["mirrored"][vertice] = False
+
+    def labels(self, vertice):
+        return self.graph.vp["labels"][vertice] or []
+
+    def keys(self, vertice):
+        return list((self.graph.vp["properties"][vertice] or {}).keys())
+
+    def value(self, vertice, key):
+        return (self.graph.vp["properties"][vertice] or {}).get(key)
+
+    def properties(self, vertice):
+        return self.graph.vp["properties"][vertice] or {}
+
+
+class ColumnarPropertyStore(PropertyStore):
+    def __init__(self, graph):
+        self.graph = graph
+        if "columns" in graph.graph_properties:
+            self.load_index()
+
+    def init_maps(self, label_properties_types):
+        # label_properties_types: {label: {key: [value types]}} from the schema scan, it decides
+        # the column type. A key with several types, or a non scalar type, is kept as a string.
+        self.graph.gp["label_names"] = self.graph.new_graph_property("object")
+        self.graph.gp["label_names"] = []
+        self.graph.gp["string_pool"] = self.graph.new_graph_property("object")
+        self.graph.gp["string_pool"] = []
+        # {key: column value type}
+        self.graph.gp["columns"] = self.graph.new_graph_property("object")
+        self.graph.gp["columns"] = {}
+        self.graph.vp["label_ids"] = self.graph.new_vertex_property("vector<int32_t>")
+        # first label of each vertex (-1 without label), usable as a numpy array
+        self.graph.vp["label_id"] = self.graph.new_vertex_property("int32_t", val=-1)
+        self.graph.vp["mirrored"] = self.graph.new_vertex_property("bool")
+        key_types = {}
+        for properties_types in label_properties_types.values():
+            for key, types in properties_types.items():
+                key_types.setdefault(key, set()).update(types)
+        for key, types in key_types.items():
+            column_type = COLUMN_TYPES.get(types.pop(), "string") if len(types) == 1 else "string"
+            self.add_column(key, column_type)
+        self.load_index()
+
+    def load_index(self):
+        self.label_names = self.graph.gp["label_names"]
+        self.label_index = {label: index for index, label in enumerate(self.label_names)}
+        self.string_pool = self.graph.gp["string_pool"]
+        self.string_index = {value: index for index, value in enumerate(self.string_pool)}
+        self.columns = self.graph.gp["columns"]
+
+    def add_column(self, key, column_type):
+        # strings are stored as their id in the pool
+        map_type = "int32_t" if column_type == "string" else column_type
+        self.graph.vp["col_" + key] = self.graph.new_vertex_property(map_type)
+        self.graph.vp["mask_" + key] = self.graph.new_vertex_property("bool")
+        self.graph.gp["columns"][key] = column_type
+
+    @staticmethod
+    def column_type_of(value):
+        # column type of a key that was not in the schema scan
+        if isinstance(value, (bool, np.bool_)):
+            return "bool"
+        if isinstance(value, (int, np.integer)):
+            return "int64_t"
+        if isinstance(value, (float, np.floating)):
+            return "double"
+        return "string"
+
+    @staticmethod
+    def fits(column_type, value):
+        # value can be stored in the column without being changed
+        if column_type == "string":
+            return True
+        if isinstance(value, (bool, np.bool_)):
+            return column_type == "bool"
+        if column_type == "int64_t":
+            return isinstance(value, (int, np.integer)) and -2**63 <= value < 2**63
+        if column_type == "double":
+            return isinstance(value, (int, np.integer, float, np.floating))
+        return False
+
+    def promote_column(self, key, value):
+        # a key whose values do not all fit its column type (no type catalog, or types that
+        # changed since the scan): an integer column becomes a double one for a float, any
+        # other column a string one, the stored values are converted
+        values, mask = self.column(key)
+        vertices = np.flatnonzero(mask)
+        column_type = self.columns[key]
+        if column_type == "int64_t" and isinstance(value, (float, np.floating)):
+            self.add_column(key, "double")
+            self.graph.vp["col_" + key].a[vertices] = values[vertices]
+        else:
+            converted = [self.intern_string(str(bool(stored) if column_type == "bool" else stored.item())) for stored in values[vertices]]
+            self.add_column(key, "string")
+            self.graph.vp["col_" + key].a[vertices] = converted
+        self.graph.vp["mask_" + key].a[vertices] = True
+
+    def intern_label(self, label):
+        if label not in self.label_index:
+            self.label_index[label] = len(self.label_names)
+            self.label_names.append(label)
+        return self.label_index[label]
+
+    def intern_string(self, value):
+        if value not in self.string_index:
+            self.string_index[value] = len(self.string_pool)
+            self.string_pool.append(value)
+        return self.string_index[value]
+
+    def add_nodes(self, nodes):
+        if len(nodes) == 0:
+            return
+        vertices = np.array([node["vertex"] for node in nodes], dtype=np.int64)
+        label_ids = self.graph.vp["label_ids"]
+        first_label = np.full(len(nodes), -1, dtype=np.int32)
+        column_rows = {}
+        column_values = {}
+        for row, node in enumerate(nodes):
+            ids = [self.intern_label(label) for label in node["labels"]]
+            label_ids[self.graph.vertex(node["vertex"])] = ids
+            if len(ids) > 0:
+                first_label[row] = ids[0]
+            for key, value in node["properties"].items():
+                if value is None:
+                    continue
+                if key not in self.columns:
+                    self.add_column(key, self.column_type_of(value))
+                elif not self.fits(self.columns[key], value):
+                    self.promote_column(key, value)
+                column_rows.setdefault(key, []).append(row)
+                column_values.setdefault(key, []).append(value)
+        self.graph.vp["label_id"].a[vertices] = first_label
+        self.graph.vp["mirrored"].a[vertices] = True
+        # one vectorized assignment per column and page
+        for key, rows in column_rows.items():
+            column_vertices = vertices[rows]
+            values = column_values[key]
+            if self.columns[key] == "string":
+                values = [self.intern_string(value if isinstance(value, str) else str(value)) for value in values]
+            self.graph.vp["col_" + key].a[column_vertices] = np.array(values)
+            self.graph.vp["mask_" + key].a[column_vertices] = True
+
+    def add_frame(self, vertices, label_sets, label_set_ids, properties):
+        # bulk form of add_nodes: label_sets[label_set_ids[row]] are the labels and the
+        # properties DataFrame (one column per key, missing values are NA) the properties of
+        # vertices[row]. Every column is converted and assigned with numpy operations.
+        if len(vertices) == 0:
+            return
+        vertices = np.asarray(vertices, dtype=np.int64)
+        label_set_ids = np.asarray(label_set_ids, dtype=np.int64)
+        interned = [[self.intern_label(label) for label in label_set] for label_set in label_sets]
+        label_ids = self.graph.vp["label_ids"]
+        for vertice, label_set_id in zip(vertices, label_set_ids):
+            label_ids[self.graph.vertex(vertice)] = interned[label_set_id]
+        first_label = np.array([ids[0] if len(ids) > 0 else -1 for ids in interned] + [-1], dtype=np.int32)
+        self.graph.vp["label_id"].a[vertices] = first_label[label_set_ids]
+        self.graph.vp["mirrored"].a[vertices] = True
+        for key in properties.columns:
+            present = properties[key].notna().to_numpy()
+            if not present.any():
+                continue
+            values = properties[key][present]
+            column_type = self.frame_column_type(values)
+            if key not in self.columns:
+                self.add_column(key, column_type)
+            elif self.columns[key] not in (column_type, "string") and not (self.columns[key] == "double" and column_type == "int64_t"):
+                # same widening as add_nodes: to double for floats in an integer column, to
+                # string otherwise
+                self.promote_column(key, values.iloc[0] if column_type == "double" else "")
+            column_vertices = vertices[present]
+            if self.columns[key] == "string":
+                values = values.map(lambda value: self.intern_string(value if isinstance(value, str) else str(value)))
+            self.graph.vp["col_" + key].a[column_vertices] = values.to_numpy(dtype=self.graph.vp["col_" + key].a.dtype)
+            self.graph.vp["mask_" + key].a[column_vertices] = True
+
+    def frame_column_type(self, values):
+        # column type of the (not missing) values of a DataFrame column
+        kind = values.dtype.kind
+        if kind == "b":
+            return "bool"
+        if kind in "iu":
+            return "int64_t"
+        if kind == "f":
+            return "double"
+        column_types = set(values.map(self.column_type_of).unique())
+        return column_types.pop() if len(column_types) == 1 else "string"
+
+    def clear_node(self, vertice):
+        self.graph.vp["label_ids"][vertice] = []
+        self.graph.vp["label_id"][vertice] = -1
+        self.graph.vp["mirrored"][vertice] = False
+        for key in self.columns:
+            self.graph.vp["mask_" + key][vertice] = False
+
+    def labels(self, vertice):
+        return [self.label_names[label_id] for label_id in self.graph.vp["label_ids"][vertice]]
+
+    def keys(self, vertice):
+        return [key for key in self.columns if self.graph.vp["mask_" + key][vertice]]
+
+    def value(self, vertice, key):
+        if key not in self.columns or not self.graph.vp["mask_" + key][vertice]:
+            return None
+        value = self.graph.vp["col_" + key][vertice]
+        if self.columns[key] == "string":
+            return self.string_pool[value]
+        if self.columns[key] == "bool":
+            return bool(value)
+        return value
+
+    def column(self, key):
+        # (values, mask) as numpy arrays indexed by vertex, strings are pool ids
+        return self.graph.vp["col_" + key].a, self.graph.vp["mask_" + key].a.astype(bool)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+import hashlib
+import itertools
+from functools import lru_cache
+
+from query_ir import NodePattern, RelationshipPattern, PathPattern, Match, Subquery, Where, Return, Query
+from cypher_parser import parse_query, rename_symbols
+
+# Canonical form of a query, the same for queries that only differ by
+#   - the names of their variables: renamed _v0, _v1, ... in the order they appear
+#   - the direction a path is written in: (a)-[]->(b) and (b)<-[]-(a)
+#   - the order of the paths of a MATCH, of the AND terms of a WHERE, of the labels of a
+#     node (:A:B) and of the types of a relationship ([:A|B])
+# e.g. MATCH (abc:User)-[]->(xyz) WHERE xyz.id = 1 AND abc IS NOT NULL RETURN count(abc)
+# and  MATCH (s1)<-[]-(s0:User) WHERE s0 IS NOT NULL AND s1.id = 1 RETURN count(s0)
+# are both MATCH (_v0:User)-[]->(_v1) WHERE _v0 IS NOT NULL AND _v1.id = 1 RETURN count(_v0)
+# Only rewrites that keep the meaning are applied: queries with different forms may still be
+# equivalent, queries with the same form always are. Queries the parser does not read are
+# compared on their text with the spaces normalized.
+# The mutators run only one query of each form (see CypherQueryMutator.deduplicate).
+
+# orientations tried for the paths whose two directions read the same without names
+MAX_ORIENTATIONS = 16
+
+
+@lru_cache(maxsize=4096)
+def canonical_key(query):
+    # hash of the canonical form, the same in every process; cached by text, the mutators ask
+    # for the key of a mutant when counting the distinct ones and again when filtering them
+    return hashlib.blake2b(canonical_form(query).encode(), digest_size=16).hexdigest()
+
+
+def canonical_form(query):
+    try:
+        query_ir = parse_query(query)
+    except ValueError:
+        return " ".join(query.split())
+    return canonical_query(query_ir, {})
+
+
+def canonical_query(query, names):
+    # canonical text of a Query, `names` are the canonical names of the variables of the
+    # scopes around it; the smallest text over the orientations of the ambiguous paths
+    choices = []
+    for path in query.match.paths:
+        path = sorted_labels(path)
+        forward, backward = anonymous(path), anonymous(path.reversed())
+        if forward < backward:
+            choices.append((forward, [path]))
+        elif backward < forward:
+            choices.append((backward, [path.reversed()]))
+        else:
+            choices.append((forward, [path, path.reversed()]))
+    choices.sort(key=lambda choice: choice[0])
+    orientations = itertools.islice(itertools.product(*[paths for _, paths in choices]), MAX_ORIENTATIONS)
+    return min(canonical_level(query, paths, dict(names)) for paths in orientations)
+
+
+def canonical_level(query, paths, names):
+    for path in paths:
+        for symbol in symbols_of(path):
+            if symbol not in names:
+                names[symbol] = "_v{}".format(len(names))
+    match = Match([renamed_path(path, names) for path in paths], query.match.optional)
+    where = None
+    if query.where is not None:
+        where = Where(sorted(canonical_term(term, names) for term in query.where.terms))
+    calls = [Subquery("CALL", canonical_body(call.body, names)) for call in query.calls]
+    ret = None
+    if query.ret is not None:
+        ret = Return([rename_symbols(item, names) for item in query.ret.items], query.ret.distinct)
+    return Query(match, where, calls, ret, rename_symbols(query.other, names)).cypher()
+
+
+def canonical_term(term, names):
+    if isinstance(term, Subquery):
+        out = []
+        Subquery(term.kind, canonical_body(term.body, names)).render(out)
+        return "".join(out)
+    return " ".join(rename_symbols(term, names).split())
+
+
+def canonical_body(body, names):
+    # variables declared in a subquery are local to it
+    if isinstance(body, Query):
+        return canonical_query(body, names)
+    return " ".join(rename_symbols(body, names).split())
+
+
+def sorted_labels(path):
+    nodes = [NodePattern(node.symbol, sorted("|".join(sorted(label.split("|"))) for label in node.labels)) for node in path.nodes]
+    relationships = [
+        RelationshipPattern(relationship.symbol, sorted(relationship.types), relationship.direction, relationship.length)
+        for relationship in path.relationships
+    ]
+    return PathPattern(nodes, relationships)
+
+
+def anonymous(path):
+    # the path without its variables
+    out = []
+    PathPattern(
+        [NodePattern("", node.labels) for node in path.nodes],
+        [RelationshipPattern("", relationship.types, relationship.direction, relationship.length) for relationship in path.relationships]
+    ).render(out)
+    return "".join(out)
+
+
+def symbols_of(path):
+    # variables in the order they are written
+    symbols = []
+    for node, relationship in zip(path.nodes, path.relationships + [None]):
+        if node.symbol:
+            symbols.append(node.symbol)
+        if relationship is not None and relationship.symbol:
+            symbols.append(relationship.symbol)
+    return symbols
+
+
+def renamed_path(path, names):
+    return PathPattern(
+        [NodePattern(names.get(node.symbol, node.symbol), node.labels) for node in path.nodes],
+        [
+            RelationshipPattern(names.get(relationship.symbol, relationship.symbol), relationship.types, relationship.direction, relationship.length)
+            for relationship in path.relationships
+        ]
+    )
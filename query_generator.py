@@ -2,7 +2,8 @@
 import string
 import re
 import configparser
-from random import randint, choice
+from itertools import accumulate
+from random import randint, choice, choices
 
 # this is a lightweight cypher query generator
 
@@ -30,7 +31,7 @@ class RandomCypherGenerator():
     _return = ""
     _other = ""
 
-    def __init__(self, node_labels, edge_labels, node_properties, connectivity_matrix):
+    def __init__(self, node_labels, edge_labels, node_properties, connectivity_matrix, connectivity_counts=None):
         config = configparser.ConfigParser()
         config.read('graphgenie.ini')
         self.graphdb = config['default']['graphdb']
@@ -54,7 +55,82 @@ class RandomCypherGenerator():
         self.edge_labels = edge_labels
         self.node_properties = node_properties
         self.connectivity_matrix = connectivity_matrix
-        pass
+        self.init_transition_tables(connectivity_counts)
+
+    # transition tables: the next node label (and the edge type) is drawn with a weight equal to
+    # the number of (label, edge type, label) edges in the database
+    # connectivity_counts: {(source label, edge type, target label): number of edges} from the
+    # scanner, without it the 0/1 connectivity_matrix is used (uniform choice, no self connection)
+    def init_transition_tables(self, connectivity_counts):
+        if connectivity_counts is None:
+            connectivity_counts = {}
+            for i, source_label in enumerate(self.node_labels):
+                for j, target_label in enumerate(self.node_labels):
+                    if self.connectivity_matrix[i][j]!=0:
+                        connectivity_counts[(source_label, None, target_label)] = 1
+        # {label: [(edge type, other label, count)]} of the edges leaving/entering the label
+        self.out_transitions = {}
+        self.in_transitions = {}
+        for (source_label, edge_type, target_label), count in connectivity_counts.items():
+            if count <= 0:
+                continue
+            self.out_transitions.setdefault(source_label, []).append((edge_type, target_label, count))
+            self.in_transitions.setdefault(target_label, []).append((edge_type, source_label, count))
+        self.has_edge_type_counts = any(edge_type is not None for (_, edge_type, _) in connectivity_counts)
+        # {(prev label, direction, edge type): (labels, cumulative weights)}
+        self.label_tables = {}
+        # {(label, direction): (edge types, cumulative weights)}
+        self.edge_type_tables = {}
+        # precomputed for every label, direction and edge type of its transitions, label
+        # alternatives such as "A|B" (multi_node_labels) are added on first use
+        for direction in (">", "<", "-"):
+            self.edge_type_table("", direction)
+            for node_label in self.node_labels:
+                self.label_table(node_label, direction)
+                for edge_type in set(edge_type for edge_type, _, _ in self.transitions(node_label, direction)):
+                    self.label_table(node_label, direction, edge_type)
+                self.edge_type_table(node_label, direction)
+
+    @classmethod
+    def from_scanner(cls, schema_scanner):
+        # generator over the outputs of a finished SchemaScanner.scan, weighted by its edge counts
+        return cls(schema_scanner.node_labels, schema_scanner.edge_labels, schema_scanner.node_properties,
+                   schema_scanner.connectivity_matrix, schema_scanner.connectivity_counts)
+
+    def transitions(self, node_label, direction):
+        # (edge type, other label, count) of the edges of node_label followed in `direction`
+        if direction==">":
+            return self.out_transitions.get(node_label, [])
+        elif direction=="<":
+            return self.in_transitions.get(node_label, [])
+        return self.out_transitions.get(node_label, []) + self.in_transitions.get(node_label, [])
+
+    def label_table(self, prev_node_label, prev_node_direction, prev_edge_type=None):
+        key = (prev_node_label, prev_node_direction, prev_edge_type)
+        if key not in self.label_tables:
+            weights = {}
+            for each_prev_node_label in prev_node_label.split('|'):
+                for edge_type, label, count in self.transitions(each_prev_node_label, prev_node_direction):
+                    if prev_edge_type is None or edge_type is None or edge_type==prev_edge_type:
+                        weights[label] = weights.get(label, 0) + count
+            labels = [label for label in self.node_labels if label in weights]
+            self.label_tables[key] = (labels, list(accumulate(weights[label] for label in labels)))
+        return self.label_tables[key]
+
+    def edge_type_table(self, node_label, direction):
+        key = (node_label, direction)
+        if key not in self.edge_type_tables:
+            weights = {}
+            if node_label:
+                transitions = [t for each_label in node_label.split('|') for t in self.transitions(each_label, direction)]
+            else:
+                transitions = [t for each_label in self.out_transitions for t in self.out_transitions[each_label]]
+            for edge_type, _, count in transitions:
+                if edge_type is not None:
+                    weights[edge_type] = weights.get(edge_type, 0) + count
+            edge_types = [edge_type for edge_type in self.edge_labels if edge_type in weights]
+            self.edge_type_tables[key] = (edge_types, list(accumulate(weights[edge_type] for edge_type in edge_types)))
+        return self.edge_type_tables[key]
 
     # call before each run of test
     def init(self):
@@ -114,31 +190,31 @@ class RandomCypherGenerator():
             edge_type += "|{}".format(choice(self.edge_labels))
         return edge_type
 
-    # given the previous node, use connectivity matrix to find connectable node labels
-    def connectable_node_labels(self, prev_node_label, prev_node_direction):
+    # given the previous node, use the transition tables to find connectable node labels
+    def connectable_node_labels(self, prev_node_label, prev_node_direction, prev_edge_type=None):
         if self.graphdb!="neo4j":
             return self.node_labels
         if prev_node_label==None or prev_node_label=="" or "%" in self.node_labels:
             return self.node_labels
-        possible_node_labels = []
-        for each_prev_node_label in prev_node_label.split('|'):
-            prev_node_index = self.node_labels.index(each_prev_node_label)
-            for each_label in self.node_labels:
-                each_label_index = self.node_labels.index(each_label)
-                if prev_node_direction==">":
-                    if self.connectivity_matrix[prev_node_index][each_label_index]!=0:
-                        possible_node_labels.append(each_label)
-                elif prev_node_direction=="<":
-                    if self.connectivity_matrix[each_label_index][prev_node_index]!=0:
-                        possible_node_labels.append(each_label)
-                else:
-                    if self.connectivity_matrix[prev_node_index][each_label_index]!=0 or self.connectivity_matrix[each_label_index][prev_node_index]!=0:
-                        possible_node_labels.append(each_label)
-        return possible_node_labels
+        return self.label_table(prev_node_label, prev_node_direction, prev_edge_type)[0]
+
+    # connectable node label drawn by edge count
+    def random_connectable_node_label(self, prev_node_label, prev_node_direction, prev_edge_type=None):
+        if self.graphdb!="neo4j" or prev_node_label==None or prev_node_label=="" or "%" in self.node_labels:
+            return choice(self.node_labels)
+        labels, cum_weights = self.label_table(prev_node_label, prev_node_direction, prev_edge_type)
+        return choices(labels, cum_weights=cum_weights)[0]
+
+    # edge type drawn by the number of edges of that type around the node label
+    def random_edge_type(self, node_label, direction):
+        edge_types, cum_weights = self.edge_type_table(node_label, direction) if self.has_edge_type_counts else ([], [])
+        if len(edge_types)==0:
+            return choice(self.edge_labels)
+        return choices(edge_types, cum_weights=cum_weights)[0]
 
     # to generate random path unit
-    def random_path_unit(self, prev_node_label=None, prev_node_direction=None):
-        connectable_node_labels = self.connectable_node_labels(prev_node_label, prev_node_direction)
+    def random_path_unit(self, prev_node_label=None, prev_node_direction=None, prev_edge_type=None):
+        connectable_node_labels = self.connectable_node_labels(prev_node_label, prev_node_direction, prev_edge_type)
         path_unit_candidates = [
             "({node_sym})-[{edge_sym}]-",
             "({node_sym})<-[{edge_sym}]-",
@@ -151,14 +227,15 @@ class RandomCypherGenerator():
         if self.random_choice(self.node_label_rate) and random_node_sym!="" and len(connectable_node_labels)!=0:
             node_labels = ""
             if self.graphdb=="neo4j" and self.multi_node_labels:
-                node_labels = self.random_node_multi_labels() if self.random_choice(self.multi_node_label_rate) else choice(connectable_node_labels)
+                node_labels = self.random_node_multi_labels() if self.random_choice(self.multi_node_label_rate) else self.random_connectable_node_label(prev_node_label, prev_node_direction, prev_edge_type)
             else:
-                node_labels = choice(connectable_node_labels)
+                node_labels = self.random_connectable_node_label(prev_node_label, prev_node_direction, prev_edge_type)
             random_node_sym = "{}:{}".format(random_node_sym, node_labels)
         # determine whether we need edge label
         if self.random_choice(self.edge_label_rate) and random_edge_sym!="":
             # do not support multiple edge labels
-            random_edge_sym = "{}:{}".format(random_edge_sym, choice(self.edge_labels))
+            node_label = random_node_sym.split(':')[1] if ':' in random_node_sym else ""
+            random_edge_sym = "{}:{}".format(random_edge_sym, self.random_edge_type(node_label, self.cypher_get_unit_direction(random_unit)))
         return random_unit.format(node_sym=random_node_sym, edge_sym=random_edge_sym)
 
     def cypher_get_unit_direction(self, path_unit):
@@ -169,6 +246,13 @@ class RandomCypherGenerator():
         else:
             return "-"
 
+    def parse_path_unit_edge_type(self, path_unit):
+        # extract KNOWS from (a)-[b:KNOWS]->, None without edge type
+        the_edge = path_unit.split('[')[1].split(']')[0]
+        if ':' not in the_edge:
+            return None
+        return the_edge.split(':')[1]
+
     def parse_path_unit_node_label(self, path_unit):
         the_node = path_unit.split('-')[0]
         if ':' not in the_node:
@@ -183,6 +267,7 @@ class RandomCypherGenerator():
         path = ""
         prev_node_label = ""
         prev_node_direction = "-"
+        prev_edge_type = None
         # given the number of nodes, we generate each node unit
         # it takes previous node label and edge information and checks the connectivity
         # connectivity: before testing, we have parsed the target dataset to pre-analyze
@@ -190,10 +275,11 @@ class RandomCypherGenerator():
         # note: if supporting update/insert clauses later, we need incremental updates to
         # the connectivity matrix
         for i in range(nodes_num):
-            new_path_unit = self.random_path_unit(prev_node_label, prev_node_direction)
-            # update the previous node label and edge direction after generation
+            new_path_unit = self.random_path_unit(prev_node_label, prev_node_direction, prev_edge_type)
+            # update the previous node label, edge type and edge direction after generation
             prev_node_label = self.parse_path_unit_node_label(new_path_unit)
             prev_node_direction = self.cypher_get_unit_direction(new_path_unit)
+            prev_edge_type = self.parse_path_unit_edge_type(new_path_unit)
             if self.random_choice(self.variable_pathlen_rate):
                 variable_length_expressions = ["*..1]", "*0..1]", "*0..0]", "*1..1]"]
                 new_path_unit = new_path_unit.replace(']', choice(variable_length_expressions))
@@ -1,9 +1,14 @@
 #!/usr/bin/env python3
 import string
 import re
-import configparser
-from random import randint, choice,uniform,shuffle
+import copy
+from concurrent.futures import ThreadPoolExecutor
 import graph_tool.all as gt
+import numpy as np
+
+from generation_context import GenerationContext, RandomStream
+from fragment_pool import Fragment, FragmentPool
+from query_ir import NodePattern, RelationshipPattern, PathPattern, Match, Subquery, Where, Return, Query
 
 # this is a lightweight cypher query generator
 
@@ -31,43 +36,75 @@ class RandomCypherGenerator_subqueries_with_graph():
     _return = ""
     _other = ""
 
-    def __init__(self, node_labels, edge_labels, node_properties, connectivity_matrix, property_types_dict,graph_full ):
-        config = configparser.ConfigParser()
-        config.read('graphgenie.ini')
-        self.graphdb = config['default']['graphdb']
-        self.language = config['default']['language']
-        self._node_num = int(config['testing_configs']['_node_num'])
-        self.min_node_num = int(config['query_generation_args']['min_node_num'])
-        self.max_node_num = int(config['query_generation_args']['max_node_num'])
-        self.variable_pathlen_rate = float(config['query_generation_args']['variable_pathlen_rate'])
-        self.node_symbol_rate = float(config['query_generation_args']['node_symbol_rate'])
-        self.edge_symbol_rate = float(config['query_generation_args']['edge_symbol_rate'])
-        self.node_label_rate = float(config['query_generation_args']['node_label_rate'])
-        self.edge_label_rate = float(config['query_generation_args']['edge_label_rate'])
-        self.multi_node_label_rate = float(config['query_generation_args']['multi_node_label_rate'])
-        self.multi_edge_label_rate = float(config['query_generation_args']['multi_edge_label_rate'])
-        self.cyclic_rate = float(config['query_generation_args']['cyclic_rate'])
-        self.random_symbol_len = int(config['query_generation_args']['random_symbol_len'])
-        self.cyclic_symbol = config['query_generation_args']['cyclic_symbol']
-        self.multi_node_labels = int(config['query_generation_args']['multi_node_labels'])
-        self.multi_edge_labels = int(config['query_generation_args']['multi_edge_labels'])
-        self.node_labels = node_labels
-        self.edge_labels = edge_labels
-        self.node_properties = node_properties
-        self.connectivity_matrix = connectivity_matrix
-        self.property_types_dict = property_types_dict
-        self.graph_full = graph_full
+    # shapes of the body of each kind of subquery, None: CALL has a single one
+    subquery_shapes = {
+        "EXISTS": ["nested","union","with"],
+        "COUNT": ["simple","union","with"],
+        "COLLECT": ["simple","union"],
+        "CALL": [None],
+    }
+
+    def __init__(self, node_labels, edge_labels, node_properties, connectivity_matrix, property_types_dict,graph_full,context=None ):
+        if context is None:
+            context = GenerationContext(node_labels, edge_labels, node_properties, connectivity_matrix, property_types_dict, graph_full)
+        self.use_context(context)
+        # all random draws of this generator and of its nested generators (see generate_batch)
+        self.rng = RandomStream()
+        # ready made path fragments for the nested subqueries (see fragment_pool)
+        self.fragment_pool = FragmentPool(self, self.fragment_pool_size, self.fragment_max_uses) if self.fragment_pool_size > 0 else None
+        # nested generator of each nesting level, reused by every subquery of that level
+        self.depth = 0
+        self.level_builders = []
+        self.number_nested_predicates = 0
         self.subquery_max_branching = 4
-        # We create a view with only vertices with at least one edge.
-        self.graph_full_view = gt.GraphView(self.graph_full, vfilt=lambda v: v.out_degree() > 0)
+        self.last_query_cost = None
+        self.last_query_metadata = None
         print(f"INIT:{node_labels}, edge_labels{edge_labels},connectivity_matrix{connectivity_matrix},property_types_dict{property_types_dict},")
-        
+
+    # share the parsed config, schema, graphs and indexes of the context (see generation_context)
+    def use_context(self, context):
+        self.context = context
+        self.__dict__.update(context.settings)
+        self.node_labels = context.node_labels
+        self.edge_labels = context.edge_labels
+        self.node_properties = context.node_properties
+        self.connectivity_matrix = context.connectivity_matrix
+        self.property_types_dict = context.property_types_dict
+        self.graph_full = context.graph_full
+        self.property_store = context.property_store
+        self.path_sampler = context.path_sampler
+        self.cost_estimator = context.cost_estimator
+
+    # nested generator of a subquery one level below this one. There is one per level, shared
+    # by the whole family: a level only runs while the level above waits for it, so its
+    # object is free again when the next subquery of that level is generated.
+    def nested_generator(self):
+        generator = self.level_generator(self.depth + 1)
+        generator.recursion_level = self.number_nested_predicates
+        return generator
+
+    # nested generator of the given nesting level (1: subqueries of the top level query)
+    def level_generator(self, depth):
+        while len(self.level_builders) < depth:
+            self.level_builders.append(RandomCypherGenerator_subqueries_nested(self, len(self.level_builders) + 1))
+        return self.level_builders[depth - 1]
+
+    # generator sharing the context, with its own random stream and path sampler.
+    # fragment_pool=False builds every level itself, the queries of a seeded fork then replay exactly
+    def fork(self, seed=None, fragment_pool=True):
+        generator = copy.copy(self)
+        generator.rng = RandomStream(seed)
+        generator.path_sampler = self.path_sampler.fork(generator.rng.generator)
+        generator.fragment_pool = None
+        if self.fragment_pool_size > 0 and fragment_pool:
+            generator.fragment_pool = FragmentPool(generator, self.fragment_pool_size, self.fragment_max_uses)
+        generator.level_builders = []
+        generator.init()
+        return generator
 
     # call before each run of test
     def init(self):
-        config = configparser.ConfigParser()
-        config.read('graphgenie.ini')
-        self._node_num = int(config['testing_configs']['_node_num'])
+        self._node_num = self.context.settings['_node_num']
         self._path_vectors = []
         self._last_vector_length = 0
         self.stuck = 0
@@ -82,6 +119,12 @@ class RandomCypherGenerator_subqueries_with_graph():
         self._predicate = ""
         self._return = ""
         self._condition = ""
+        # parts of the query as query_ir trees (see generate_query)
+        self._path_ir = None
+        self._where = None
+        self._calls = []
+        self._return_ir = None
+        self.last_query_ir = None
         self.symbols = []
         self.symbolsids = []
         self.node_symbols = []
@@ -90,6 +133,7 @@ class RandomCypherGenerator_subqueries_with_graph():
         self.name_label_types_dict = {}
         self.nodes_num = 0
         self.created_in_transactions = False
+        self.query_type = ""
 
         self.property_to_test = ""
         
@@ -97,7 +141,7 @@ class RandomCypherGenerator_subqueries_with_graph():
     # this is a random choice api for a given rate
     # e.g., if given_rate = 0.3, then 30% returns true and 70% return false
     def random_choice(self, given_rate):
-        if randint(1,100)<=given_rate*100:
+        if self.rng.randint(1,100)<=given_rate*100:
             return True
         else:
             return False
@@ -105,28 +149,28 @@ class RandomCypherGenerator_subqueries_with_graph():
     # this is a random symbol generator
     # note: we only consider lowercase letters in ascii
     def random_symbol(self):
-        return ''.join(choice(string.ascii_lowercase) for _ in range(self.random_symbol_len))
+        return ''.join(self.rng.choice(string.ascii_lowercase) for _ in range(self.random_symbol_len))
 
     # _match indicates the query is a graph-matching query rather than add/update/delete queries
     # cypher: `match` or `optional match` clause
     def match_generator(self):
         match_candidates = ["MATCH"]#, "OPTIONAL MATCH"]
-        self._match = choice(match_candidates)
+        self._match = self.rng.choice(match_candidates)
 
     def random_node_multi_labels(self):
         label_num = len(self.node_labels)
-        random_num = randint(2, label_num)
-        node_label = choice(self.node_labels)
+        random_num = self.rng.randint(2, label_num)
+        node_label = self.rng.choice(self.node_labels)
         for i in range(random_num-1):
-            node_label += "|{}".format(choice(self.node_labels))
+            node_label += "|{}".format(self.rng.choice(self.node_labels))
         return node_label
 
     def random_edge_types(self):
         type_num = len(self.edge_labels)
-        random_num = randint(2, type_num)
-        edge_type = choice(self.edge_labels)
+        random_num = self.rng.randint(2, type_num)
+        edge_type = self.rng.choice(self.edge_labels)
         for i in range(random_num-1):
-            edge_type += "|{}".format(choice(self.edge_labels))
+            edge_type += "|{}".format(self.rng.choice(self.edge_labels))
         return edge_type
 
     # given the previous node, use connectivity matrix to find connectable node labels
@@ -159,21 +203,21 @@ class RandomCypherGenerator_subqueries_with_graph():
             "({node_sym})<-[{edge_sym}]-",
             "({node_sym})-[{edge_sym}]->"
             ]
-        random_unit = choice(path_unit_candidates)
+        random_unit = self.rng.choice(path_unit_candidates)
         random_node_sym = self.random_symbol() if self.random_choice(self.node_symbol_rate) else ""
         random_edge_sym = self.random_symbol() if self.random_choice(self.edge_symbol_rate) else ""
         # determine whether we need node label
         if self.random_choice(self.node_label_rate) and random_node_sym!="" and len(connectable_node_labels)!=0:
             node_labels = ""
             if self.graphdb=="neo4j" and self.multi_node_labels:
-                node_labels = self.random_node_multi_labels() if self.random_choice(self.multi_node_label_rate) else choice(connectable_node_labels)
+                node_labels = self.random_node_multi_labels() if self.random_choice(self.multi_node_label_rate) else self.rng.choice(connectable_node_labels)
             else:
-                node_labels = choice(connectable_node_labels)
+                node_labels = self.rng.choice(connectable_node_labels)
             random_node_sym = "{}:{}".format(random_node_sym, node_labels)
         # determine whether we need edge label
         if self.random_choice(self.edge_label_rate) and random_edge_sym!="":
             # do not support multiple edge labels
-            random_edge_sym = "{}:{}".format(random_edge_sym, choice(self.edge_labels))
+            random_edge_sym = "{}:{}".format(random_edge_sym, self.rng.choice(self.edge_labels))
         return random_unit.format(node_sym=random_node_sym, edge_sym=random_edge_sym)
 
     def cypher_get_unit_direction(self, path_unit):
@@ -212,7 +256,7 @@ class RandomCypherGenerator_subqueries_with_graph():
             prev_node_direction = self.cypher_get_unit_direction(new_path_unit)
             if self.random_choice(self.variable_pathlen_rate):
                 variable_length_expressions = ["*..1]", "*0..1]", "*0..0]", "*1..1]"]
-                new_path_unit = new_path_unit.replace(']', choice(variable_length_expressions))
+                new_path_unit = new_path_unit.replace(']', self.rng.choice(variable_length_expressions))
             path += new_path_unit
         # to strip the tail edge
         path = ")".join(path.split(")")[:-1])+")"
@@ -220,7 +264,7 @@ class RandomCypherGenerator_subqueries_with_graph():
         if self.random_choice(self.cyclic_rate):
             cyclic_str = "{cyc_sym}{node_label}".format(
                 cyc_sym = self.cyclic_symbol,
-                node_label= ":"+choice(self.node_labels) if self.random_choice(self.node_label_rate) else ""
+                node_label= ":"+self.rng.choice(self.node_labels) if self.random_choice(self.node_label_rate) else ""
             )
             path = ("({cyc})-{path}-({cyc})".format(cyc=cyclic_str, path="-".join(path.split("-")[1:-1])))
         self._path = path
@@ -321,8 +365,8 @@ class RandomCypherGenerator_subqueries_with_graph():
             # Min: Long.MIN_VALUE, Max: Long.MAX_VALUE in java so
             # Min: -2^63, Max: 2^63-1
             OPERATORS_INTEGER = ["=", ">", "<", ">=", "<="]
-            operator = choice(OPERATORS_INTEGER)
-            right_side = randint(-2**63, 2**63-1)
+            operator = self.rng.choice(OPERATORS_INTEGER)
+            right_side = self.rng.randint(-2**63, 2**63-1)
             return( f"{left_side} {operator} {right_side}", None)
             
         elif "FLOAT" in property_type:
@@ -330,8 +374,8 @@ class RandomCypherGenerator_subqueries_with_graph():
             # Double.MIN_VALUE Double.MAX_VALUE
             # Min: 4.9e-324, Max: 1.7976931348623157e+308
             OPERATORS_FLOAT = ["=", ">", "<", ">=", "<="]
-            operator = choice(OPERATORS_FLOAT)
-            right_side = uniform(4.9e-324, 1.7976931348623157e+308)
+            operator = self.rng.choice(OPERATORS_FLOAT)
+            right_side = self.rng.uniform(4.9e-324, 1.7976931348623157e+308)
             return( f"{left_side} {operator} {right_side}", None)
 
         elif "DATE" in property_type:
@@ -372,7 +416,7 @@ class RandomCypherGenerator_subqueries_with_graph():
 
     def predicate_generator_property_test(self,id_to_test=None):
         if id_to_test == None:
-            id_to_test = choice(self.symbolsids) if len(self.symbolsids)>0 else ""
+            id_to_test = self.rng.choice(self.symbolsids) if len(self.symbolsids)>0 else ""
         conditions = []
         
             
@@ -380,87 +424,65 @@ class RandomCypherGenerator_subqueries_with_graph():
         if id_to_test != "":
             id_int  = int(id_to_test[2:]) #id1 -> 1
             
-            predicate_placeholder = "( {id}.{property} {operator} {value} )"
-
-            property_to_test = "id"
-            value = id_int
+            # ( idN.id = N ), or ( elementId(idN) = "..." ) when the scan did not write n.id
+            predicate = self.property_store.node_predicate(id_to_test, id_int)
             #
             # Have to keep this commented for now. This leads to an issue when generating the equality as for example dates will not match, some need the " others dont..
             # node = self.graph_full.vertex(id_int)
             # property_to_test = choice(list(self.graph_full.vertex_properties["properties"][node].keys()))
             
             # value = self.graph_full.vertex_properties["properties"][node][property_to_test]
-
-            predicate = predicate_placeholder.format(id=id_to_test,property=property_to_test,operator="=",value=value)
             
         else: predicate = "True"
         return predicate
         
     def predicate_generator(self,type_of_subquery="random",iterations_left=0):
         
-        pattern = "WHERE {}"
-        
         ## Properties tests
         # should_test_propertyQ = self.random_choice(0.5) # For later, when 
     
         ### New code based on the graph
         # number_of_test = randint(0,4)
-        id_to_test = choice(self.symbolsids) if len(self.symbolsids)>0 else ""
+        id_to_test = self.rng.choice(self.symbolsids) if len(self.symbolsids)>0 else ""
 
         conditions = []
         for symbol in  self.symbolsids:
             predicate_test = self.predicate_generator_property_test(id_to_test=symbol)
             conditions.append(predicate_test)
                 
-        predicate = " AND ".join(conditions) if len(conditions)>0 else "True"
-        condition = predicate
+        if len(conditions)==0:
+            conditions = ["True"]
+        predicate = conditions
 
         ## Subqueries   
              
         subqueries = []
-        self.number_nested_predicates =  randint(0,4) # TODO: Add a parameter for this
+        self.number_nested_predicates =  self.rng.randint(0,4) # TODO: Add a parameter for this
         print(f"type of subquery received is: {type_of_subquery}")
         #Choose type of subquery to generate
         if type_of_subquery == "random":
-            type_of_subquery = choice(["EXISTS","COUNT","COLLECT","CALL"])
+            type_of_subquery = self.rng.choice(["EXISTS","COUNT","COLLECT","CALL"])
+        self.query_type = type_of_subquery
         # type_of_subquery ="CALL" #"COLLECT" #TODO: Remove this line
         
         if  iterations_left>0:
         # EXISTs subqueries
             if type_of_subquery == "EXISTS":
-                pattern = "WHERE {conditions} AND EXISTS {subquery}"
-
                 # choose randomly between nested subqueries, UNION subqueries, WITH subqueries:
-                choosed_subquery_type = choice(["nested","union","with"])
+                choosed_subquery_type = self.rng.choice(self.subquery_shapes["EXISTS"])
                 if choosed_subquery_type == "nested" and iterations_left > 0:
                 
-                    nested_generator = RandomCypherGenerator_subqueries_nested(node_labels=self.node_labels,edge_labels=self.edge_labels,node_properties=self.node_properties,
-                                                                            connectivity_matrix=self.connectivity_matrix, property_types_dict=self.property_types_dict,
-                                                                                recursion_level=self.number_nested_predicates,graph_full=self.graph_full,graph_full_view=self.graph_full_view
-                                                                                )
-                    for _ in range(randint(1,self.subquery_max_branching)): # Number of nested subqueries
+                    for _ in range(self.rng.randint(1,self.subquery_max_branching)): # Number of nested subqueries
                         
-                        predicate_subqueries =  nested_generator.predicate_generator_recursiv( iterations_left=iterations_left-1) 
-                        if predicate_subqueries[0] != "{":
-                            predicate_subqueries = "{{ {} }}".format(predicate_subqueries)
-                        subqueries.append(predicate_subqueries)
-                elif choosed_subquery_type == "union":
-                    # Generate subqueries with union
-                    for _ in range(randint(1,self.subquery_max_branching)):
-                        subquery_for_union = self.union_generator()
-                        subqueries.append(subquery_for_union)
-                elif choosed_subquery_type == "with":
-                    #Generate subqueries with with
-                    for _ in range(randint(1,self.subquery_max_branching)):
-                        subquery_for_with = self.with_generator()
-                        if subquery_for_with[0] != "{":
-                            subquery_for_with = "{{ {} }}".format(subquery_for_with)
-
-                        subqueries.append(subquery_for_with)
+                        predicate_subqueries =  self.fragment_subquery(iterations_left=iterations_left-1) 
+                        subqueries.append(Subquery("EXISTS", predicate_subqueries))
+                else:
+                    # Generate subqueries with union or with
+                    for _ in range(self.rng.randint(1,self.subquery_max_branching)):
+                        subqueries.append(self.shaped_subquery("EXISTS", choosed_subquery_type))
 
                 
-                subquery = " AND EXISTS ".join(subqueries)
-                self._predicate = pattern.format(conditions=condition,subquery=subquery)
+                self.set_predicate(conditions + subqueries)
                 print("Choosen query type: ",type_of_subquery, "Subquery type: ",choosed_subquery_type)
                 return self._predicate 
             
@@ -468,108 +490,76 @@ class RandomCypherGenerator_subqueries_with_graph():
                 #Generate subqueries with count
                 
 
-                pattern = "WHERE {conditions} AND COUNT {{ {subquery} }} > 0"
-
-                nested_generator = RandomCypherGenerator_subqueries_nested(node_labels=self.node_labels,edge_labels=self.edge_labels,node_properties=self.node_properties,
-                                                                            connectivity_matrix=self.connectivity_matrix, property_types_dict=self.property_types_dict,
-                                                                                recursion_level=self.number_nested_predicates,graph_full=self.graph_full,graph_full_view=self.graph_full_view
-                                                                                )
-                
                 #Choose type of COUNT subquery to generate:
-                choosed_subquery_type = choice(["simple","union","with"])
+                choosed_subquery_type = self.rng.choice(self.subquery_shapes["COUNT"])
                 
                 if choosed_subquery_type == "simple":
-                    subquery_for_count = nested_generator.predicate_generator_recursiv( iterations_left=iterations_left-1)
-                    subquery_for_count = subquery_for_count.lstrip("{").rstrip("}")
-                    subquery = subquery_for_count
-                    self._predicate = pattern.format(conditions=condition,subquery=subquery)
+                    subquery_for_count = self.fragment_subquery(iterations_left=iterations_left-1)
+                    self.set_predicate(conditions + [Subquery("COUNT", subquery_for_count)])
                     print("Choosen query type: ",type_of_subquery, "Subquery type: ",choosed_subquery_type)
                     return self._predicate 
                 
-                elif choosed_subquery_type == "union":
-                    
-                    subquery_for_union = self.union_generator(union_keyword=" UNION ALL ")
-                    subquery_for_union = subquery_for_union.lstrip("{").rstrip("}")
-                    subquery = subquery_for_union
-                    self._predicate = pattern.format(conditions=condition,subquery=subquery)
-                    print("Choosen query type: ",type_of_subquery, "Subquery type: ",choosed_subquery_type)
-                    return self._predicate
-                    
-                elif choosed_subquery_type == "with":
-                    
-                    subquery_for_with = self.with_generator()
-
-                    subquery = subquery_for_with
-                    self._predicate = pattern.format(conditions=condition,subquery=subquery)
+                else:
+                    # union or with
+                    self.set_predicate(conditions + [self.shaped_subquery("COUNT", choosed_subquery_type)])
                     print("Choosen query type: ",type_of_subquery, "Subquery type: ",choosed_subquery_type)
                     return self._predicate
 
-                subquery = self.return_generator()
-                self._predicate = pattern.format(conditions=condition,subquery=subquery)
-                return self._predicate 
 
             elif type_of_subquery == "COLLECT":
                 
                # Generate subqueries with COLLECT
                 
 
-                pattern = "WHERE {conditions} AND NOT isEmpty( COLLECT {{ {subquery} }} ) "
-
-                nested_generator = RandomCypherGenerator_subqueries_nested(node_labels=self.node_labels,edge_labels=self.edge_labels,node_properties=self.node_properties,
-                                                                            connectivity_matrix=self.connectivity_matrix, property_types_dict=self.property_types_dict,
-                                                                                recursion_level=self.number_nested_predicates,graph_full=self.graph_full,graph_full_view=self.graph_full_view
-                                                                                )
-                
                 #Choose type of COUNT subquery to generate:
-                choosed_subquery_type = choice(["simple","union"])
+                choosed_subquery_type = self.rng.choice(self.subquery_shapes["COLLECT"])
                 # choosed_subquery_type = "union"
                 # choos ed_subquery_type = "with" #TODO: Remove this line
                 
                 if choosed_subquery_type == "simple":
-                    subquery_for_count = nested_generator.predicate_generator_recursiv(iterations_left=0,needs_return=True)
-                    subquery_for_count = subquery_for_count.lstrip("{").rstrip("}")
-                    subquery = subquery_for_count
-                    self._predicate = pattern.format(conditions=condition,subquery=subquery)
+                    subquery_for_count = self.fragment_subquery(iterations_left=0,needs_return=True)
+                    self.set_predicate(conditions + [Subquery("COLLECT", subquery_for_count)])
                     print("Choosen query type: ",type_of_subquery, "Subquery type: ",choosed_subquery_type)
                     return self._predicate
                 
                 elif choosed_subquery_type == "union":
                     print("COLLECT UNION")
-                    subquery_for_union = self.union_generator(union_keyword=" UNION ALL ",max_number_unions=2,max_number_nested_subqueries=1,needs_return=True,return_name=self.random_symbol())
-                    subquery_for_union = subquery_for_union.lstrip("{").rstrip("}")
-                    subquery = subquery_for_union
-                    self._predicate = pattern.format(conditions=condition,subquery=subquery)
+                    self.set_predicate(conditions + [self.shaped_subquery("COLLECT", choosed_subquery_type)])
                     print("Choosen query type: ",type_of_subquery, "Subquery type: ",choosed_subquery_type)
                     return self._predicate
                     
             elif type_of_subquery == "CALL":
-                # Will start with CALL used without unwind
-                pattern = "WHERE {conditions} CALL {{ {subquery} }} "
-                 
-                choosed_identifier = choice(self.symbolsids[:-1]) if len(self.symbolsids) > 1 else self.symbolsids[0]
-                choosed_identifier_int = choosed_identifier.split("id")[1]
-
-                # Find path of length 1 from the node
-                path = self.get_random_path_in_graph(choosed_identifier_int,1)[:2]
-                path_built = self.path_generator_graph(path) # This will be correctly formated (a)-[b]->(c)
-
-                # Choose which attribute from the choosen node to return
-                return_attribute = choice( list(self.graph_full.vertex_properties["properties"][path[1]].keys()))
-                subquery_pattern= "WITH {choosed_identifier} MATCH {path_built} RETURN {choosed_identifier}.{return_attribute} AS {return_attribute}"
-
-                subquery=  subquery_pattern.format(choosed_identifier=choosed_identifier,path_built=path_built,return_attribute=return_attribute)
-                
-                self._predicate = pattern.format(conditions=condition,subquery=subquery)
+                self.set_predicate(conditions, calls=[self.call_subquery(self.symbolsids)])
 
                 print("Choosen query type: ",type_of_subquery, " Not in transaction")
                 return self._predicate
                 
         else:
-            predicate = "{} IS NOT NULL AND True".format(choice(self.symbolsids)) if len(self.symbolsids)>0 else "True"
+            predicate = ["{} IS NOT NULL".format(self.rng.choice(self.symbolsids)), "True"] if len(self.symbolsids)>0 else ["True"]
+            self.query_type = "NO SUBQUERIES"
             print("="*10,"Choosen query type: NO SUBQUERIES:", self.symbolsids, " iterations left: ",iterations_left)
-        self._predicate = pattern.format(predicate)
+        return self.set_predicate(predicate)
+
+    # WHERE clause (and CALL clauses) of this level as a tree and as text
+    def set_predicate(self, terms, calls=()):
+        self._where = Where(terms)
+        self._calls = list(calls)
+        out = []
+        self._where.render(out)
+        for call in self._calls:
+            out.append(" ")
+            call.render(out)
+        self._predicate = "".join(out)
         return self._predicate
 
+    # body of a subquery written as { body }
+    @staticmethod
+    def unwrap(subquery):
+        subquery = subquery.strip()
+        if subquery.startswith("{") and subquery.endswith("}"):
+            return subquery[1:-1].strip()
+        return subquery
+
     # note: we focus on testing `count`
     def return_generator(self):
         _return = "{return_keyword} {return_staff}"
@@ -577,11 +567,13 @@ class RandomCypherGenerator_subqueries_with_graph():
         # TODO: to support count(DISTINCT ), max(), min()
         test_returns = ["count({})"]
         if len(self.symbolsids)>0:# and self.random_choice(0.5):
-            return_staff = choice(self.symbolsids)
+            return_staff = self.rng.choice(self.symbolsids)
         else:
-            return_staff = choice(test_returns).format(choice(self.symbols)) if len(self.symbols)>0 else "count(1)"
+            return_staff = self.rng.choice(test_returns).format(self.rng.choice(self.symbols)) if len(self.symbols)>0 else "count(1)"
+        return_keyword = self.rng.choice(return_keywords)
+        self._return_ir = Return([return_staff], distinct=return_keyword == "RETURN DISTINCT")
         self._return = _return.format(
-            return_keyword = choice(return_keywords),
+            return_keyword = return_keyword,
             return_staff = return_staff
         )
 
@@ -592,40 +584,28 @@ class RandomCypherGenerator_subqueries_with_graph():
         skip_keywords = ["", "SKIP 0", "SKIP 0", "SKIP 0", "SKIP 0", "SKIP 0", "SKIP 0", "SKIP 0",]
         limit_keywords = ["", "LIMIT 1", "LIMIT 2", "LIMIT 3", "LIMIT 4","LIMIT 5"]
         self._other = _other.format(
-            order_by = choice(order_by_keywords),
-            skip = choice(skip_keywords),
-            limit = choice(limit_keywords)
+            order_by = self.rng.choice(order_by_keywords),
+            skip = self.rng.choice(skip_keywords),
+            limit = self.rng.choice(limit_keywords)
         )
 
 
     def get_random_path_in_graph(self,starting_vertice=None,path_len = None):
-        # TODO: optimize selection of starting vertice using additional graph metrics to guarantee finding a long enough path.
-        found = False
+        # Bounded random walk of path_len..max_node_num vertices (see graph_index.PathSampler),
+        # from starting_vertice or from a random vertex with an out edge.
         if path_len is None:
             path_len = self.min_node_num
-        i=0
-        choosen_path = []
-        while not found:
-            if starting_vertice == None:
-                starting_vertice = choice(self.graph_full_view.get_vertices())
-            visitorResult = VisitorResult()
-            visitor = VisitorExample(self.graph_full.vertex_properties["properties"],visitorResult,path_min=1,path_max=self.max_node_num)
-            gt.dfs_search(self.graph_full, starting_vertice,visitor )
-            for path in visitorResult.final_path[::-1]:
-                if len(path) >= path_len:
-                    found = True
-                    choosen_path = path
-                    break
-
-            if i > 1000:
-                print("COULD NOT FIND A PATH")
-                # shuffle(visitorResult.final_path.sort(key=len,reverse=True)) # We can add additional randomness here
-                visitorResult.final_path.sort(key=len,reverse=True)
-                choosen_path = visitorResult.final_path[0]
-                found = True                
-            i+=1
-        
-        return choosen_path
+        if starting_vertice is not None:
+            starting_vertice = int(starting_vertice)
+        path = self.path_sampler.sample(path_len, self.max_node_num, starting_vertice)
+        return [self.graph_full.vertex(vertice) for vertice in path]
+
+    def get_pattern_path_in_graph(self,node_labels,edge_steps,starting_vertice=None):
+        # Path matching a label/edge type pattern, e.g. (:User)-[:RATED]->(:Movie)-[:IN_GENRE]->()
+        # is node_labels=["User","Movie",None], edge_steps=[("RATED",">"),("IN_GENRE",">")]
+        # (see graph_index.PathSampler.sample_pattern). Empty when nothing matches.
+        path, _ = self.path_sampler.sample_pattern(node_labels, edge_steps, starting_vertice)
+        return [self.graph_full.vertex(vertice) for vertice in path]
         
     def path_generator_graph(self,path_param=None):
         if path_param is None:
@@ -633,42 +613,13 @@ class RandomCypherGenerator_subqueries_with_graph():
         else:
             graph_path = path_param
         # print("PATH:",path)
-        
-        path = ""
-        path_units= "({node_sym})-[{edge_sym}]->"
-        for i in range(len(graph_path)-1):
-            
-            node = graph_path[i]
-            next_node = graph_path[i+1]
-            
-            # print("ICIIIIII:",self.graph_full.vertex_properties["properties"])
-            random_node_sym1 = "id"+str(self.graph_full.vertex_properties["properties"][node]["id"])# if self.random_choice(self.node_symbol_rate) else ""
-            random_node_label1 = ":"+choice(self.graph_full.vertex_properties["labels"][node]) #if self.random_choice(self.multi_node_label_rate) else ""
-            random_node_sym = "{}{}".format(random_node_sym1,random_node_label1 )
-            edge_label = self.graph_full.edge_properties["properties"][self.graph_full.edge(node,next_node)]    
-            #if self.random_choice(self.multi_edge_label_rate):
-            #     random_edge_label = edge_label
-            # else: 
-            #     random_edge_label = ""
-            random_edge_label = edge_label
-        
-            if random_node_sym == ":":
-                random_node_sym = ""
-            
-            random_edge_sym = ":{}".format(random_edge_label )
-            if path_param is None:
-                self.symbolsids.append(random_node_sym1)
-
-            path += path_units.format(node_sym=random_node_sym,edge_sym=random_edge_sym)
-        
-        random_node_sym1 = "id"+str(self.graph_full.vertex_properties["properties"][next_node]["id"]) #self.random_symbol() if self.random_choice(self.node_symbol_rate) else ""
-        random_node_label1 = ":"+choice(self.graph_full.vertex_properties["labels"][next_node]) #if self.random_choice(self.multi_node_label_rate) else ""
-        random_node_sym = "{}{}".format(random_node_sym1,random_node_label1 )
+        path_ir = self.path_pattern_graph(graph_path)
         if path_param is None:
-            self.symbolsids.append(random_node_sym1)
-        
-        path_final = "({node_sym})".format(node_sym=random_node_sym)
-        path = path + path_final
+            self.symbolsids += path_ir.node_symbols()
+            self._path_ir = path_ir
+        out = []
+        path_ir.render(out)
+        path = "".join(out)
         if path_param is None:
             self._path = path
 
@@ -676,14 +627,110 @@ class RandomCypherGenerator_subqueries_with_graph():
         # print("\n\n\n\n HERE PATH:",path)
         # self.path_parser() # TODO: Unsure..?
 
+    # (idN:Label)-[:TYPE]->(idM:Label) of the vertices of graph_path: a label of each vertex and
+    # the edge type of each hop from the sampler's sorted neighbour lists
+    def path_pattern_graph(self, graph_path):
+        edge_labels = self.path_sampler.edge_types_of(graph_path)
+        nodes = [NodePattern("id"+str(int(node)), [self.rng.choice(self.property_store.labels(node))]) for node in graph_path]
+        relationships = [RelationshipPattern(None, [edge_label] if edge_label is not None else [], ">") for edge_label in edge_labels]
+        return PathPattern(nodes, relationships)
+
+    # a sampled path with the predicates pinning its symbols (see fragment_pool)
+    def build_fragment(self):
+        vertices = self.path_sampler.sample(self.min_node_num, self.max_node_num)
+        path = self.path_pattern_graph(vertices)
+        symbols = path.node_symbols()
+        conditions = [self.property_store.node_predicate(symbol, int(vertice)) for symbol, vertice in zip(symbols, vertices)]
+        return Fragment(path, conditions, symbols)
+
+    # fragment from the pool, built here when there is no pool or it is still empty
+    def fragment(self):
+        fragment = self.fragment_pool.take(self.rng) if self.fragment_pool is not None else None
+        return fragment if fragment is not None else self.build_fragment()
+
+    # kind of a random subquery and the shape of its body, drawn as in predicate_generator
+    def subquery_shape(self):
+        kind = self.rng.choice(["EXISTS","COUNT","COLLECT","CALL"])
+        shapes = self.subquery_shapes[kind]
+        return kind, self.rng.choice(shapes) if len(shapes) > 1 else shapes[0]
+
+    # CALL { WITH idN MATCH (idN)-[]->(idM) RETURN idN.attr AS attr } on a symbol of symbolsids
+    def call_subquery(self, symbolsids):
+        # Will start with CALL used without unwind
+        choosed_identifier = self.rng.choice(symbolsids[:-1]) if len(symbolsids) > 1 else symbolsids[0]
+        choosed_identifier_int = choosed_identifier.split("id")[1]
+
+        # Find path of length 1 from the node
+        path = self.get_random_path_in_graph(choosed_identifier_int,2)[:2]
+        path_built = self.path_pattern_graph(path) # This will be correctly formated (a)-[b]->(c)
+
+        # Choose which attribute from the choosen node to return
+        return_attribute = self.rng.choice(self.property_store.keys(path[1]))
+        subquery_pattern= "WITH {choosed_identifier} {subquery}"
+        subquery = Query(Match([path_built]), ret=Return(["{}.{} AS {}".format(choosed_identifier, return_attribute, return_attribute)]))
+
+        subquery=  subquery_pattern.format(choosed_identifier=choosed_identifier,subquery=subquery.cypher())
+        return Subquery("CALL", subquery)
+
+    # subquery of a UNION or WITH body (nested generators of the levels below this one), or a
+    # CALL clause on one of symbolsids
+    def shaped_subquery(self, kind, shape, symbolsids=()):
+        if kind == "CALL":
+            return self.call_subquery(symbolsids)
+        if shape == "with":
+            return Subquery(kind, self.unwrap(self.with_generator()))
+        if kind == "COLLECT":
+            body = self.union_generator(union_keyword=" UNION ALL ",max_number_unions=2,max_number_nested_subqueries=1,needs_return=True,return_name=self.random_symbol())
+        elif kind == "COUNT":
+            body = self.union_generator(union_keyword=" UNION ALL ")
+        else:
+            body = self.union_generator()
+        return Subquery(kind, self.unwrap(body))
+
+    # Body of a nested subquery: MATCH path WHERE conditions AND <subquery> with up to
+    # iterations_left - 1 levels of subqueries below it (the depth of the recursive
+    # predicate_generator_recursiv it replaces), one fragment per level. Each level draws
+    # the subquery below it like predicate_generator (subquery_shape): a nested EXISTS or simple
+    # COUNT body continues the chain, a simple COLLECT body ends it with a RETURN, and a UNION
+    # or WITH body or a CALL clause ends it with a subquery built by the generator of that
+    # level (shaped_subquery on level_generator).
+    # Built without recursion: the fragments and the subquery shapes are drawn from the
+    # outermost level in, the Query tree is then assembled from the innermost level out. It is
+    # rendered once, with the rest of the query, into a single buffer (query_ir.Query.cypher).
+    def fragment_subquery(self, iterations_left, needs_return=False):
+        levels = []
+        subquery_type, last = None, None
+        for level in range(max(iterations_left, 1)):
+            fragment = self.fragment()
+            return_symbol = self.rng.choice(fragment.symbols) if subquery_type == "COLLECT" else None
+            levels.append((fragment, subquery_type, return_symbol))
+            if level >= iterations_left - 1 or subquery_type == "COLLECT":
+                break
+            subquery_type, shape = self.subquery_shape()
+            if shape not in ("nested", "simple"):
+                generator = self if level == 0 else self.level_generator(self.depth + level)
+                last = generator.shaped_subquery(subquery_type, shape, fragment.symbols)
+                break
+        inner = last
+        for fragment, subquery_type, return_symbol in reversed(levels):
+            terms = list(fragment.conditions)
+            calls = []
+            if inner is not None:
+                (calls if inner.kind == "CALL" else terms).append(inner)
+            query = Query(Match([fragment.path]), Where(terms), calls)
+            if return_symbol is not None:
+                query.ret = Return([return_symbol])
+            inner = Subquery(subquery_type, query)
+        if needs_return:
+            query.ret = Return([self.rng.choice(levels[0][0].symbols)])
+        return query
+
     def union_generator(self,union_keyword=" UNION ",max_number_unions=4,max_number_nested_subqueries=2,needs_return=False,return_name="",iterations_left=0):
         #Generate subqueries with union
         subqueries = []
-        nested_generator = RandomCypherGenerator_subqueries_nested(node_labels=self.node_labels,edge_labels=self.edge_labels,node_properties=self.node_properties,
-                                                                       connectivity_matrix=self.connectivity_matrix, property_types_dict=self.property_types_dict,
-                                                                         recursion_level=self.number_nested_predicates,graph_full=self.graph_full,graph_full_view=self.graph_full_view)
-        self.number_nested_predicates = randint(0,max_number_nested_subqueries)
-        number_of_unions = randint(1,max_number_unions)   
+        nested_generator = self.nested_generator()
+        self.number_nested_predicates = self.rng.randint(0,max_number_nested_subqueries)
+        number_of_unions = self.rng.randint(1,max_number_unions)   
         for _ in range(number_of_unions): # Number of union
             
             subquery_for_union = nested_generator.predicate_generator_recursiv(iterations_left=iterations_left,needs_return=needs_return,return_name=return_name)
@@ -704,11 +751,9 @@ class RandomCypherGenerator_subqueries_with_graph():
     def with_generator(self):
         #Generate subqueries with with random symbols not used in this level nor nested levels.
         subqueries = []
-        nested_generator = RandomCypherGenerator_subqueries_nested(node_labels=self.node_labels,edge_labels=self.edge_labels,node_properties=self.node_properties,
-                                                                       connectivity_matrix=self.connectivity_matrix, property_types_dict=self.property_types_dict,
-                                                                         recursion_level=self.number_nested_predicates,graph_full=self.graph_full,graph_full_view=self.graph_full_view)
-        self.number_nested_predicates = randint(0,4)
-        number_of_withs = randint(0,4)
+        nested_generator = self.nested_generator()
+        self.number_nested_predicates = self.rng.randint(0,4)
+        number_of_withs = self.rng.randint(0,4)
         with_subquery = "WITH \"{variable}\" AS {name} {subquery}"   
          # Number of with
             
@@ -729,7 +774,7 @@ class RandomCypherGenerator_subqueries_with_graph():
 
     def call_in_transaction_generator(self,query_type="create"):
         # This query will create a subquery that will be called in a transaction to create a few entries
-        numbers = str(list(range(1,randint(2,5))))
+        numbers = str(list(range(1,self.rng.randint(2,5))))
         print("Choosen query type: ","CALL", "  IN transaction")
 
         if query_type == "create" and not self.created_in_transactions:
@@ -751,11 +796,86 @@ class RandomCypherGenerator_subqueries_with_graph():
 
 
     def random_query_generator(self,force_query_type="random",number_nested_subqueries=2):
+        # Queries whose estimated cost (cost_estimator.py) is above cost_budget are not returned:
+        # reshape: generated again with one nesting level less each time
+        # regenerate: generated again with the same shape
+        # After cost_budget_retries the cheapest query is returned.
+        if self.cost_estimator is None:
+            query = self.generate_query(force_query_type, number_nested_subqueries)
+            self.last_query_metadata = self.query_metadata(number_nested_subqueries)
+            return query
+        cheapest = None
+        for _ in range(self.cost_budget_retries + 1):
+            query = self.generate_query(force_query_type, number_nested_subqueries)
+            cost = self.cost_estimator.estimate(query)
+            if cheapest is None or cost < cheapest[1]:
+                cheapest = (query, cost, number_nested_subqueries, self.query_state())
+            if cost <= self.cost_budget:
+                break
+            if self.verbose:
+                print("Estimated cost {:.0f} above budget {:.0f}".format(cost, self.cost_budget))
+            if self.cost_budget_action == "reshape":
+                number_nested_subqueries = max(number_nested_subqueries - 1, 0)
+        query, cost, nesting, state = cheapest
+        # symbolsids, query_type, ... describe the query returned, not the last one generated
+        self.__dict__.update(state)
+        self.last_query_metadata = self.query_metadata(nesting)
+        self.last_query_cost = cost
+        return query
+
+    # attributes of the generator describing the query it generated last (see init_query)
+    query_state_attributes = (
+        "_match", "_path", "_predicate", "_return", "_other", "_condition",
+        "_path_ir", "_where", "_calls", "_return_ir", "last_query_ir",
+        "symbols", "symbolsids", "node_symbols", "edge_symbols", "name_label_dict", "name_label_types_dict",
+        "nodes_num", "created_in_transactions", "query_type", "property_to_test",
+    )
+
+    def query_state(self):
+        # init_query gives each query new lists and dicts, they are not changed afterwards
+        return {name: getattr(self, name) for name in self.query_state_attributes}
+
+    def query_metadata(self, nesting):
+        # what the testers need besides the text of the query just generated
+        return {
+            "symbolsids": list(self.symbolsids),
+            "query_type": self.query_type,
+            "nesting": nesting if self.query_type not in ("NO SUBQUERIES", "CALLS IN TRANSACTION") else 0,
+            # query_ir.Query of the query, None for CALL { } IN TRANSACTIONS
+            "ir": self.last_query_ir,
+        }
+
+    # n queries generated by `workers` forks of this generator in threads, worker w draws from
+    # stream w of the seed and generates the w-th contiguous slice of the batch, so the same
+    # (seed, workers) gives the same queries in the same order (a seeded batch does not use the
+    # fragment pool).
+    # Returns (queries, metadata) with the metadata of query_metadata plus its estimated cost.
+    def generate_batch(self, n, seed=None, workers=1, force_query_type="random", number_nested_subqueries=2):
+        streams = RandomStream.spawn(seed, workers)
+        sizes = [len(chunk) for chunk in np.array_split(np.arange(n), workers)]
+        def generate_slice(stream, size):
+            generator = self.fork(stream, fragment_pool=seed is None)
+            queries, metadata = [], []
+            for _ in range(size):
+                queries.append(generator.random_query_generator(force_query_type, number_nested_subqueries))
+                metadata.append(dict(generator.last_query_metadata, cost=generator.last_query_cost))
+            return queries, metadata
+        if workers == 1:
+            slices = [generate_slice(streams[0], sizes[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                slices = list(executor.map(generate_slice, streams, sizes))
+        queries = [query for slice_queries, _ in slices for query in slice_queries]
+        metadata = [each for _, slice_metadata in slices for each in slice_metadata]
+        return queries, metadata
+
+    def generate_query(self,force_query_type="random",number_nested_subqueries=2):
         self.init_query()
         #
         should_call_in_transaction = self.random_choice(0.1)
         if force_query_type!="random" and (force_query_type=="CALLS IN TRANSACTION"  or should_call_in_transaction): # call in transaction requires a different query pattern than the others.
             query= self.call_in_transaction_generator()
+            self.query_type = "CALLS IN TRANSACTION"
             return query
         
         self.match_generator()
@@ -764,13 +884,15 @@ class RandomCypherGenerator_subqueries_with_graph():
         self.return_generator()
         self.other_generator()
         
-        query = self.cypher_query_pattern.format(
-            _match = self._match,
-            _path = self._path,
-            _predicate = self._predicate,
-            _return = self._return,
-            _other = self._other
+        # the whole query is rendered from its tree in one pass, the mutators get the tree too
+        self.last_query_ir = Query(
+            Match([self._path_ir], optional=self._match == "OPTIONAL MATCH"),
+            self._where,
+            self._calls,
+            self._return_ir,
+            self._other.strip()
         )
+        query = self.last_query_ir.cypher()
         # query = re.sub(' +', ' ', query).strip(' ')
         # query = re.sub('[*]+', '*', query).strip(' ')
         return query
@@ -778,164 +900,19 @@ class RandomCypherGenerator_subqueries_with_graph():
 
 
 
-class VisitorResult():
-    def __init__(self) -> None:
-        self.final_path = []
-    
-class VisitorExample(gt.DFSVisitor):
-
-    def __init__(self,properties,visitorResult:VisitorResult,path_min=1,path_max=5):
-        self.properties = properties
-        self.finished_paths = []
-        self.path_max = path_max
-        self.path_min = path_min
-        self.visitorResult = visitorResult
-        
-    def start_vertex(self, u):
-        
-        number_of_childs = u.out_degree()
-        # print("Starting with:",u, " with ",number_of_childs," childs")
-        self.current_path = [[u] for _ in range(number_of_childs)]
-        # print("Initial Current path:",self.current_path)
-        
-        
-    # def discover_vertex(self, u):
-    #     self.current_path.append(u)
-    
-    def examine_edge(self, e):
-        # print("examine_edge",e.source(),e.target())
-        # print("current path:",self.current_path)
-        for path in self.current_path[::-1]:
-            # print(e.source(),path)
-            if e.source() == path[-1]:
-                # print("YAY")
-                path.append(e.target())
-                number_of_childs = e.target().out_degree()
-                for _ in range(number_of_childs-1):
-                    self.current_path.append(path.copy())
-                    if len(path) >= self.path_max:
-                        self.visitorResult.final_path = path
-                        raise gt.StopSearch()
-                
-                break
-        else:
-            print("NOOO")
-            print(e.source()), print(path[-1])
-
-    def finish_vertex(self, u):
-        # print("finish vertex")
-
-        for path in self.current_path[::-1]:
-            # print(type(u))
-            # print(type(path[-1]))
-            if u == path[-1]:
-                self.finished_paths.append(path)
-                self.visitorResult.final_path = self.finished_paths
-                
-                break
-                
-        # print("FINAL PATH:",[self.properties[u]["id"] for u in self.current_path[-1]])
-        # print(len(self.current_path))
-        # print("Finished paths:",self.finished_paths)
-        # print("==")
-
-
 class RandomCypherGenerator_subqueries_nested(RandomCypherGenerator_subqueries_with_graph):
-    def __init__(self, node_labels, edge_labels, node_properties, connectivity_matrix, property_types_dict,recursion_level,graph_full,graph_full_view ):
-        config = configparser.ConfigParser()
-        config.read('graphgenie.ini')
-        self.graphdb = config['default']['graphdb']
-        self.language = config['default']['language']
-        self._node_num = int(config['testing_configs']['_node_num'])
-        self.min_node_num = int(config['query_generation_args']['min_node_num'])
-        self.max_node_num = int(config['query_generation_args']['max_node_num'])
-        self.variable_pathlen_rate = float(config['query_generation_args']['variable_pathlen_rate'])
-        self.node_symbol_rate = float(config['query_generation_args']['node_symbol_rate'])
-        self.edge_symbol_rate = float(config['query_generation_args']['edge_symbol_rate'])
-        self.node_label_rate = float(config['query_generation_args']['node_label_rate'])
-        self.edge_label_rate = float(config['query_generation_args']['edge_label_rate'])
-        self.multi_node_label_rate = float(config['query_generation_args']['multi_node_label_rate'])
-        self.multi_edge_label_rate = float(config['query_generation_args']['multi_edge_label_rate'])
-        self.cyclic_rate = float(config['query_generation_args']['cyclic_rate'])
-        self.random_symbol_len = int(config['query_generation_args']['random_symbol_len'])
-        self.cyclic_symbol = config['query_generation_args']['cyclic_symbol']
-        self.multi_node_labels = int(config['query_generation_args']['multi_node_labels'])
-        self.multi_edge_labels = int(config['query_generation_args']['multi_edge_labels'])
-        self.node_labels = node_labels
-        self.edge_labels = edge_labels
-        self.node_properties = node_properties
-        self.connectivity_matrix = connectivity_matrix
-        self.property_types_dict = property_types_dict
-        # print(f"INIT:{node_labels}, edge_labels{edge_labels},connectivity_matrix{connectivity_matrix},property_types_dict{property_types_dict},")
-        self.recursion_level = recursion_level
-
-        self.graph_full = graph_full
-        # We create a view with only vertices with at least one edge.
-        self.graph_full_view = graph_full_view
+    def __init__(self, parent, depth):
+        self.use_context(parent.context)
+        # random stream, path sampler, fragment pool and level generators of the top level one
+        self.rng = parent.rng
+        self.path_sampler = parent.path_sampler
+        self.fragment_pool = parent.fragment_pool
+        self.level_builders = parent.level_builders
+        self.depth = depth
+        self.recursion_level = 0
+        self.number_nested_predicates = 0
         self.subquery_max_branching = 1 #TODO: Add a parameter for this
     
-    def generate_condition(self):
-        
-        ## Properties tests
-        # should_test_propertyQ = self.random_choice(0.5) # For later, when 
-    
-        ### New code based on the graph
-        # number_of_test = randint(0,4)
-        id_to_test = choice(self.symbolsids) if len(self.symbolsids)>0 else ""
-
-        conditions = []
-        for symbol in  self.symbolsids:
-            predicate_test = self.predicate_generator_property_test(id_to_test=symbol)
-            conditions.append(predicate_test)
-                
-        predicate = " AND ".join(conditions) if len(conditions)>0 else "True"
-    
-        return predicate
-
-       # TODO: add more predicate
-
-    def simple_predicate_generator(self):
-        
-        pattern = "WHERE {}"
-        
-        # should_test_propertyQ = self.random_choice(0.5) # For later, when 
-        should_test_propertyQ = True
-        if should_test_propertyQ:
-
-            id_to_test = choice(self.symbolsids) if len(self.symbolsids)>0 else ""
-
-            conditions = []
-            for symbol in  self.symbolsids:
-                
-                id_to_test= symbol
-                if id_to_test != "":
-                    id_int  = int(id_to_test[2:]) #id1 -> 1
-
-                    predicate_placeholder = "( {id}.{property} {operator} {value} )"
-
-                    property_to_test = "id"
-                    value = id_int
-                    # Fancier way to do it but may cause problem with urls or other stuff... Let's keep it simple for now with only ids
-
-                    # node = self.graph_full.vertex(id_int)
-                    # property_to_test = choice(list(self.graph_full.vertex_properties["properties"][node].keys()))
-                    
-                    # value = self.graph_full.vertex_properties["properties"][node][property_to_test]
-                    predicate = predicate_placeholder.format(id=id_to_test,property=property_to_test,operator="=",value=value)
-                    # print("COUCOU: ",predicate)
-                   
-
-                else:
-                    predicate = "True"
-                conditions.append(predicate)
-                # print("FOR LOOP CONDITIONS: ",conditions)
-        predicate = " AND ".join(conditions) if len(conditions)>0 else "True"
-        condition = predicate
-        
-        self._predicate = pattern.format(condition)
-        return self._predicate
-        
-      
     def predicate_generator_recursiv(self, iterations_left:int,needs_return=False,return_name="") -> str:
         # print("ITERATIONS LEFT: ",iterations_left)
         self.init_query()
@@ -994,78 +971,3 @@ class RandomCypherGenerator_subqueries_nested(RandomCypherGenerator_subqueries_w
         # query = re.sub('[*]+', '*', query).strip(' ')
         # print("Iteration LEFT:",str(iterations_left),"Returning query:",query)
         return query
-    
-    
-    
-    
-    
-    def predicate_generator_recursiv_old(self, iterations_left:int,needs_return=False,return_name="") -> str:
-        # print("ITERATIONS LEFT: ",iterations_left)
-        self.init_query()
-        self.match_generator()
-        self.path_generator_graph()
-        if needs_return:
-            self.return_generator() #  Disabled return in subqueries for now
-            ret = self._return
-            # Adding name to return
-            if return_name != "":
-                ret = ret+ " AS {}".format(return_name)
-        else:
-            ret = ""
-            
-
-        
-        
-        self.other_generator()
-        match = self._match
-        path = self._path
-        predicate = self._predicate
-
-        other = self._other
-        # print("INSIDE:",match,path,predicate,ret,other,iterations_left)
-        if iterations_left <= 0: 
-            sub_query = "MATCH {_path} {_predicate} {_return}"
-            self.predicate_generator()
-            predicate = self._predicate
-
-            query = sub_query.format(
-                _match = match,
-                _path = path,
-                _predicate = predicate,
-                _return = ret
-                # _other = other
-            )
-
-            # print("QUERY INSIDE NEsted =",query)
-            
-        elif iterations_left > 0:
-            condition = self.generate_condition()
-            if condition != "":
-                condition_text = "{} AND".format(condition)
-            else: condition_text = ""
-            sub_query = " {_match} {_path} WHERE {_condition} EXISTS  {_predicate}  {_return} "
-            predicates = []
-            for _ in range(0,randint(1,self.subquery_max_branching)):
-                predicate =  self.predicate_generator_recursiv(iterations_left-1)
-                if predicate[0] != "{": #To avoid double brackets, we add them only if they are not already there, th
-                    predicate = "{{ {} }}".format(predicate)
-                predicates.append(predicate)
-                # print("Iteration LEFT::",str(iterations_left)," PREDICATE added to the list: ",predicate)
-            predicate = " AND EXISTS ".join(predicates)
-            # print("Iteration LEFT:",str(iterations_left), "final PREDICATE: ",predicate)
-            
-        
-            query = sub_query.format(
-                _match = match,
-                _path = path,
-                _predicate = predicate,
-                _condition = condition_text,
-                _return = ret
-                # _other = other
-            )
-        # print("QUERY INSIDE NEsted =",query)
-        
-        # query = re.sub(' +', ' ', query).strip(' ')
-        # query = re.sub('[*]+', '*', query).strip(' ')
-        # print("Iteration LEFT:",str(iterations_left),"Returning query:",query)
-        return query
\ No newline at end of file
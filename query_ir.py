@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+
+# Tree of the queries generated by RandomCypherGenerator_subqueries_with_graph, e.g.
+#   MATCH (id3:User)-[:RATED]->(id150:Movie) WHERE ( id3.id = 3 ) AND EXISTS { ... } RETURN id3
+# is
+#   Query(Match([PathPattern([NodePattern("id3", ["User"]), NodePattern("id150", ["Movie"])],
+#                            [RelationshipPattern(None, ["RATED"], ">")])]),
+#         Where(["( id3.id = 3 )", Subquery("EXISTS", Query(...))]),
+#         ret=Return(["id3"]))
+# The generators build it and render it once (cypher()), the mutators read and edit it
+# instead of splitting the query text again. Predicates, return items and subquery bodies the
+# tree does not model (UNION, WITH) are kept as Cypher text.
+# Parts are shared between queries (fragments of the pool, parses of cypher_parser), an edit
+# replaces the node it changes instead of modifying it (see Query.replace).
+
+
+class NodePattern():
+    __slots__ = ("symbol", "labels")
+
+    def __init__(self, symbol="", labels=()):
+        self.symbol = symbol
+        self.labels = list(labels)
+
+    def render(self, out, labels=True):
+        out.append("(")
+        out.append(self.symbol or "")
+        if labels:
+            for label in self.labels:
+                out.append(":")
+                out.append(label)
+        out.append(")")
+
+
+class RelationshipPattern():
+    __slots__ = ("symbol", "types", "direction", "length")
+
+    # direction: ">" left to right, "<" right to left, "-" both
+    # length: variable length as written, e.g. "*0..1" ("" for a single hop)
+    def __init__(self, symbol="", types=(), direction=">", length=""):
+        self.symbol = symbol
+        self.types = list(types)
+        self.direction = direction
+        self.length = length
+
+    def render(self, out, labels=True):
+        out.append("<-[" if self.direction == "<" else "-[")
+        out.append(self.symbol or "")
+        if labels and len(self.types) > 0:
+            out.append(":")
+            out.append("|".join(self.types))
+        out.append(self.length)
+        out.append("]->" if self.direction == ">" else "]-")
+
+    def reversed(self):
+        direction = {">": "<", "<": ">"}.get(self.direction, self.direction)
+        return RelationshipPattern(self.symbol, self.types, direction, self.length)
+
+
+class PathPattern():
+    __slots__ = ("nodes", "relationships")
+
+    # len(nodes) == len(relationships) + 1
+    def __init__(self, nodes, relationships):
+        self.nodes = list(nodes)
+        self.relationships = list(relationships)
+
+    def render(self, out, labels=True):
+        for node, relationship in zip(self.nodes, self.relationships):
+            node.render(out, labels)
+            relationship.render(out, labels)
+        self.nodes[-1].render(out, labels)
+
+    def reversed(self):
+        # the same pattern written right to left
+        return PathPattern(self.nodes[::-1], [relationship.reversed() for relationship in self.relationships[::-1]])
+
+    def node_symbols(self):
+        return [node.symbol for node in self.nodes if node.symbol]
+
+    def edge_symbols(self):
+        return [relationship.symbol for relationship in self.relationships if relationship.symbol]
+
+
+class Match():
+    __slots__ = ("paths", "optional")
+
+    def __init__(self, paths, optional=False):
+        self.paths = list(paths)
+        self.optional = optional
+
+    def render(self, out, labels=True):
+        out.append("OPTIONAL MATCH " if self.optional else "MATCH ")
+        for index, path in enumerate(self.paths):
+            if index > 0:
+                out.append(", ")
+            path.render(out, labels)
+
+
+class Subquery():
+    __slots__ = ("kind", "body")
+
+    # kind: EXISTS, COUNT, COLLECT (predicates) or CALL (clause after WHERE)
+    # body: Query, or Cypher text for UNION/WITH bodies
+    def __init__(self, kind, body):
+        self.kind = kind
+        self.body = body
+
+    def render(self, out):
+        out.append({"EXISTS": "EXISTS { ", "COUNT": "COUNT { ", "COLLECT": "NOT isEmpty( COLLECT { ", "CALL": "CALL { "}[self.kind])
+        if isinstance(self.body, Query):
+            self.body.render(out)
+        else:
+            out.append(self.body)
+        out.append({"EXISTS": " }", "COUNT": " } > 0", "COLLECT": " } )", "CALL": " }"}[self.kind])
+
+
+class Where():
+    __slots__ = ("terms",)
+
+    # terms joined by AND: Cypher text or Subquery (EXISTS, COUNT, COLLECT)
+    def __init__(self, terms):
+        self.terms = list(terms)
+
+    def render(self, out):
+        out.append("WHERE ")
+        for index, term in enumerate(self.terms):
+            if index > 0:
+                out.append(" AND ")
+            if isinstance(term, Subquery):
+                term.render(out)
+            else:
+                out.append(term)
+
+    def conditions(self):
+        return [term for term in self.terms if not isinstance(term, Subquery)]
+
+    def subqueries(self):
+        return [term for term in self.terms if isinstance(term, Subquery)]
+
+
+class Return():
+    __slots__ = ("items", "distinct")
+
+    # items: Cypher text, e.g. "id3", "count(id3)", "id3.name AS name"
+    def __init__(self, items, distinct=False):
+        self.items = list(items)
+        self.distinct = distinct
+
+    def render(self, out):
+        out.append("RETURN DISTINCT " if self.distinct else "RETURN ")
+        out.append(", ".join(self.items))
+
+
+class Query():
+    __slots__ = ("match", "where", "calls", "ret", "other")
+
+    # calls: CALL subqueries between WHERE and RETURN, other: ORDER BY/SKIP/LIMIT text
+    def __init__(self, match, where=None, calls=(), ret=None, other=""):
+        self.match = match
+        self.where = where
+        self.calls = list(calls)
+        self.ret = ret
+        self.other = other
+
+    def render(self, out, labels=True):
+        self.match.render(out, labels)
+        if self.where is not None and len(self.where.terms) > 0:
+            out.append(" ")
+            self.where.render(out)
+        for call in self.calls:
+            out.append(" ")
+            call.render(out)
+        if self.ret is not None:
+            out.append(" ")
+            self.ret.render(out)
+        if self.other:
+            out.append(" ")
+            out.append(self.other)
+
+    def cypher(self):
+        out = []
+        self.render(out)
+        return "".join(out)
+
+    def replace(self, **parts):
+        # copy with some parts replaced, the others are shared
+        query = Query(self.match, self.where, self.calls, self.ret, self.other)
+        for name, value in parts.items():
+            setattr(query, name, value)
+        return query
+
+    def subqueries(self):
+        # Subquery nodes of this level, predicates first
+        return (self.where.subqueries() if self.where is not None else []) + self.calls
+
+    def without_subqueries(self):
+        # this level alone: the subquery predicates and the CALL clauses are left out
+        where = Where(self.where.conditions()) if self.where is not None else None
+        return self.replace(where=where, calls=[])
+
+    def levels(self):
+        # this query and the first nested Query below each level, outermost first
+        levels = [self]
+        query = self
+        while True:
+            nested = [subquery.body for subquery in query.subqueries() if isinstance(subquery.body, Query)]
+            if len(nested) == 0:
+                return levels
+            query = nested[0]
+            levels.append(query)
+
+    def symbols(self):
+        # node and relationship symbols of the MATCH of this level
+        symbols = []
+        for path in self.match.paths:
+            symbols += path.node_symbols() + path.edge_symbols()
+        return symbols
@@ -4,6 +4,11 @@ import string
 import configparser
 from random import choice, randint
 
+from cypher_parser import parse_query, parse_pattern, rename_symbols
+from query_canonicalizer import canonical_key
+
+SPACES = re.compile(" +")
+
 class CypherQueryMutator:
     cypher_query_pattern = "{_match} {_path} {_predicate} {_return} {_other}"
 
@@ -14,38 +19,64 @@ class CypherQueryMutator:
         self.language = config['default']['language']
         self.random_symbol_len = int(config['query_generation_args']['random_symbol_len'])
         self.graph_pattern_mutation = int(config['testing_strategy']['graph_pattern_mutation'])
+        self.mutant_dedup = int(config['testing_strategy']['mutant_dedup'])
+        self.mutant_dedup_base = int(config['testing_strategy']['mutant_dedup_base'])
         self.mutated_query_num = int(config['testing_configs']['mutated_query_num'])
         self.cyclic_symbol = config['query_generation_args']['cyclic_symbol']
         self.node_labels = node_labels
         self.edge_labels = edge_labels
         self.node_properties = node_properties
         self.connectivity_matrix = connectivity_matrix
-        pass
+        # (symbol:Label) or [symbol:TYPE] of the path, for generate_equivalent_move_label_predicate
+        self.labelled_symbol_pattern = re.compile(r"[(,\[][a-z]{{{}}}:[\w]*[),\]]".format(self.random_symbol_len))
 
+    # All the rules read the parts of one parse of the base query (cypher_parser.parse_query,
+    # cached by query text): generate_equivalent_queries and generate_restricted_queries of
+    # the same base query parse it once.
     def cypher_query_parser(self, query):
-        _match = "OPTIONAL MATCH" if "OPTIONAL" in query else "MATCH"
-        _path = query.split("MATCH ")[1].split(' ')[0].strip(' ')
-        if "WHERE " not in query:
-            _predicate = ""
-        else:
-            _predicate = "WHERE " + query.split("WHERE")[1].split("RETURN")[0].strip(' ')
-        return_symbol = "RETURN DISTINCT " if "RETURN DISTINCT" in query else "RETURN "
-        _return = return_symbol + query.split(return_symbol)[1].split(')')[0]+')'
-        _other = ')'.join(query.split(return_symbol)[1].split(')')[1:])
-        return _match, _path, _predicate, _return, _other
+        return self.query_parts(parse_query(query))
+
+    def query_parts(self, query):
+        # _match, _path, _predicate, _return, _other of a query_ir.Query
+        _match = "OPTIONAL MATCH" if query.match.optional else "MATCH"
+        _path = self.render_paths(query.match.paths)
+        _predicate = ""
+        if query.where is not None:
+            out = []
+            query.where.render(out)
+            _predicate = "".join(out)
+        _return = ""
+        if query.ret is not None:
+            out = []
+            query.ret.render(out)
+            _return = "".join(out)
+        return _match, _path, _predicate, _return, query.other
+
+    def render_paths(self, paths):
+        # the paths of a MATCH written as one word, e.g. (a)-[]->(b),(b)-[]->(c)
+        out = []
+        for index, path in enumerate(paths):
+            if index > 0:
+                out.append(",")
+            path.render(out)
+        return "".join(out)
 
     def path_parser(self, path):
+        return self.path_symbols(parse_pattern(path))
+
+    def path_symbols(self, paths):
+        # symbols, node symbols and edge symbols of PathPatterns in the order they are written
         symbols = []
         node_symbols = []
         edge_symbols = []
-        symbol_list = re.findall("[(,\[][a-z]{{{sym_len}}}".format(sym_len=self.random_symbol_len), path)
-        for each_symbol in symbol_list:
-            symbol_name = each_symbol[1:]
-            symbols.append(symbol_name)
-            if each_symbol[0]=="(":
-                node_symbols.append(symbol_name)
-            elif each_symbol[0]=="[":
-                edge_symbols.append(symbol_name)
+        for each_path in paths:
+            for node, relationship in zip(each_path.nodes, each_path.relationships + [None]):
+                if node.symbol:
+                    symbols.append(node.symbol)
+                    node_symbols.append(node.symbol)
+                if relationship is not None and relationship.symbol:
+                    symbols.append(relationship.symbol)
+                    edge_symbols.append(relationship.symbol)
         return symbols, node_symbols, edge_symbols
 
     def init_for_each_base_query(self, base_query):
@@ -84,7 +115,7 @@ class CypherQueryMutator:
         self.restricted_queries_eval = []
 
     def strip_spaces(self, query):
-        return re.sub(" +", " ", query)
+        return SPACES.sub(" ", query)
 
     # This is a random choice wrapper for a given rate
     # E.g., if given_rate = 0.3, then 30% returns True and 70% return False
@@ -100,10 +131,14 @@ class CypherQueryMutator:
 
     def query_parser(self, base_query):
         self.init_for_each_base_query(base_query)
-        self.base_match, self.base_path, self.base_predicate, self.base_return, self.base_other = self.cypher_query_parser(base_query)
-        self.base_symbols, self.base_node_symbols, self.base_edge_symbols = self.path_parser(self.base_path)
-        self.mutated_match, self.mutated_path, self.mutated_predicate, self.mutated_return, self.mutated_other = self.cypher_query_parser(base_query)
-        self.mutated_symbols, self.mutated_node_symbols, self.mutated_edge_symbols = self.path_parser(self.mutated_path)
+        self.base_query_ir = parse_query(base_query)
+        self.base_match, self.base_path, self.base_predicate, self.base_return, self.base_other = self.query_parts(self.base_query_ir)
+        self.base_symbols, self.base_node_symbols, self.base_edge_symbols = self.path_symbols(self.base_query_ir.match.paths)
+        # the renamed and reversed mutants have the base form, they are kept unless mutant_dedup_base
+        self.base_key = canonical_key(base_query) if self.mutant_dedup and self.mutant_dedup_base else None
+        self.equivalent_keys = []
+        self.mutated_match, self.mutated_path, self.mutated_predicate, self.mutated_return, self.mutated_other = self.base_match, self.base_path, self.base_predicate, self.base_return, self.base_other
+        self.mutated_symbols, self.mutated_node_symbols, self.mutated_edge_symbols = list(self.base_symbols), list(self.base_node_symbols), list(self.base_edge_symbols)
 
     def generate_restricted_queries(self, base_query):
         self.query_parser(base_query)
@@ -112,8 +147,30 @@ class CypherQueryMutator:
             self.generate_restricted_add_edge_label()
             self.generate_restricted_add_node_label()
             self.generate_restricted_add_node()
+        if self.mutant_dedup:
+            self.restricted_queries, self.restricted_queries_eval = self.deduplicate(self.restricted_queries, self.restricted_queries_eval)
         return self.restricted_queries, self.restricted_queries_eval
 
+    # Mutants with the canonical form (query_canonicalizer) of an earlier mutant, or of the base
+    # query with mutant_dedup_base, only differ by names, path directions or term order: they are
+    # dropped instead of being executed again. Canonicalizing costs about 10 ms per base query.
+    def deduplicate(self, queries, queries_eval):
+        seen = {self.base_key}
+        kept, kept_eval = [], []
+        for query, query_eval in zip(queries, queries_eval):
+            key = canonical_key(query)
+            if key not in seen:
+                seen.add(key)
+                kept.append(query)
+                kept_eval.append(query_eval)
+        return kept, kept_eval
+
+    def distinct_equivalent_num(self):
+        # number of equivalent queries so far with a canonical form of their own
+        for query in self.equivalent_queries[len(self.equivalent_keys):]:
+            self.equivalent_keys.append(canonical_key(query))
+        return len(set(self.equivalent_keys) - {self.base_key})
+
     def generate_restricted_add_node_label(self, mode=0):
         if self.graph_pattern_mutation==0:
             return
@@ -241,9 +298,15 @@ class CypherQueryMutator:
                     "generate_equivalent_move_label_predicate",
                     "generate_equivalent_predicate_intersect"
                 ]
+                # with mutant_dedup, until mutated_query_num distinct queries or, as the rules
+                # may keep producing known forms, after 10 times as many attempts
+                attempts = 0
                 while True:
                     getattr(self, choice(recursive_mutation_rules))(1)
-                    if len(self.equivalent_queries)==self.mutated_query_num:
+                    attempts += 1
+                    if not self.mutant_dedup and len(self.equivalent_queries)==self.mutated_query_num:
+                        break
+                    if self.mutant_dedup and (self.distinct_equivalent_num()>=self.mutated_query_num or attempts>=10*self.mutated_query_num):
                         break
 
             """
@@ -261,6 +324,8 @@ class CypherQueryMutator:
             self.generate_equivalent_queries_adding_redundant_predicate_b()
             self.generate_equivalent_rename_symbols_up()
             """
+        if self.mutant_dedup:
+            self.equivalent_queries, self.equivalent_queries_eval = self.deduplicate(self.equivalent_queries, self.equivalent_queries_eval)
         return self.equivalent_queries, self.equivalent_queries_eval
 
     def generate_equivalent_count_other_symbol(self, mode=0):
@@ -547,15 +612,8 @@ class CypherQueryMutator:
         if self.graph_pattern_mutation==0:
             return
         if mode==0:
-            path = self.base_path.split('-')
-            path.reverse()
-            for i in range(len(path)):
-                if path[i]!='':
-                    if path[i][0]=='>' and path[i][-1]!='<':
-                        path[i] = path[i][1:] + '<'
-                    elif path[i][0]!='>' and path[i][-1]=='<':
-                        path[i] = '>' + path[i][:-1]
-            new_path = '-'.join(path)
+            # the same pattern written right to left, from the parse of the base query
+            new_path = self.render_paths([each_path.reversed() for each_path in reversed(self.base_query_ir.match.paths)])
             pattern = self.cypher_query_pattern
             mutated_query = pattern.format(
                 _match = self.base_match,
@@ -665,7 +723,7 @@ class CypherQueryMutator:
             return
         if mode==0:
             path = self.base_path
-            node_label_list = re.findall("[(,\[][a-z]{{{}}}:[\w]*[),\]]".format(self.random_symbol_len), path)
+            node_label_list = self.labelled_symbol_pattern.findall(path)
             if len(node_label_list)==0:
                 return
             target_label = choice(node_label_list)
@@ -690,7 +748,7 @@ class CypherQueryMutator:
             )
         else:
             path = self.mutated_path
-            node_label_list = re.findall("[(,\[][a-z]{{{}}}:[\w]*[),\]]".format(self.random_symbol_len), path)
+            node_label_list = self.labelled_symbol_pattern.findall(path)
             if len(node_label_list)==0:
                 return
             target_label = choice(node_label_list)
@@ -726,21 +784,15 @@ class CypherQueryMutator:
 
     # not combinable
     def generate_equivalent_rename_symbols_down(self):
-        base_query = self.base_query
-        count = 0
-        targets = set(re.findall("[(,\[][a-z]{"+str(self.random_symbol_len)+"}", base_query))
-        for each_sym in targets:
-            base_query = re.sub(each_sym[1:], "s{}".format(count), base_query)
-            count = count+1
-        equivalent_query = base_query
+        targets = dict.fromkeys(self.base_symbols)
+        names = {each_sym: "s{}".format(count) for count, each_sym in enumerate(targets)}
+        equivalent_query = rename_symbols(self.base_query, names)
         self.equivalent_queries.append(equivalent_query)
         self.equivalent_queries_eval.append(self.Non_GQT)
 
     def generate_equivalent_rename_symbols_up(self):
-        base_query = self.base_query
-        targets = set(re.findall("[(,\[][a-z]{"+str(self.random_symbol_len)+"}", base_query))
-        for each_sym in targets:
-            base_query = re.sub(each_sym[1:], self.random_symbol_up(), base_query)
-        equivalent_query = base_query
+        targets = dict.fromkeys(self.base_symbols)
+        names = {each_sym: self.random_symbol_up() for each_sym in targets}
+        equivalent_query = rename_symbols(self.base_query, names)
         self.equivalent_queries.append(equivalent_query)
         self.equivalent_queries_eval.append(self.Non_GQT)
\ No newline at end of file
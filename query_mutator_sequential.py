@@ -4,6 +4,9 @@ import string
 import configparser
 from random import choice, randint
 
+from query_ir import NodePattern, PathPattern
+from cypher_parser import parse_query
+
 class CypherQueryMutatorSequential:
     cypher_query_pattern = "{_match} {_path} {_predicate} {_return} {_other}"
 
@@ -229,6 +232,35 @@ class CypherQueryMutatorSequential:
         self.transactions_create = transactions
         return transactions
     
+    def get_all_transactions_create_ir(self, query_ir):
+        # get_all_transactions_create on the tree of the query (query_ir.Query): one view per
+        # level, the view of a level is matched from the view of the level above
+        transactions = []
+        for view_id, level in enumerate(query_ir.levels()):
+            path = level.match.paths[0]
+            out = ["MATCH "]
+            if view_id > 0:
+                out.append("({})-[:contains]->() (()-[]->()){{0,1000}} ".format(self.views_ids[-1]))
+            path.render(out)
+            conditions = level.where.conditions() if level.where is not None else []
+            if len(conditions) > 0:
+                out.append(" WHERE ")
+                out.append(" AND ".join(conditions))
+            curr_view = "view"+str(view_id)
+            # labels removed from the nodes for the creation, otherwise gives error
+            out.append(" \n CREATE ({view}:{view})-[:contains]->".format(view=curr_view))
+            PathPattern([NodePattern(node.symbol) for node in path.nodes], path.relationships).render(out)
+            transactions.append("".join(out))
+            self.views_ids.append(curr_view)
+        self.transactions_create = transactions
+        return transactions
+
+    @staticmethod
+    def ir_levels_only(query_ir):
+        # True when every subquery met on the way down is a Query, UNION/WITH/CALL bodies are
+        # only known as text and go through the text parser
+        return all(not isinstance(subquery.body, str) for level in query_ir.levels() for subquery in level.subqueries())
+
     def delete_view(self,view_name):
         return f"MATCH (view:{view_name}) DETACH DELETE view"
     
@@ -243,13 +275,24 @@ class CypherQueryMutatorSequential:
         #TODO: How to actually get the wanted match transaction?
         return ''
     
-    def generate_equivalent_queries(self, base_query):
+    def generate_equivalent_queries(self, base_query, query_ir=None):
         '''This function generates equivalent queries for a given base query. This is the expected
         main function to be called from outside the class. It returns a list of equivalent queries
         sequentialised by the order of the subqueries in the base query.
+        query_ir is the tree of the base query given by the generator (query_ir.Query), without
+        it the query is parsed (cypher_parser); the subqueries are read from the tree instead of
+        splitting the text.
         '''
         self.init_for_each_base_query(base_query)
-        transactions_create = self.get_all_transactions_create(base_query)
+        if query_ir is None:
+            try:
+                query_ir = parse_query(base_query)
+            except ValueError:
+                query_ir = None
+        if query_ir is not None and self.ir_levels_only(query_ir):
+            transactions_create = self.get_all_transactions_create_ir(query_ir)
+        else:
+            transactions_create = self.get_all_transactions_create(base_query)
         transaction_match = self.get_match_transactions(base_query)
         transactions_delete = self.get_all_transactions_delete()
         
@@ -2,6 +2,10 @@
 
 import os
 import time
+import json
+import hashlib
+import configparser
+from concurrent.futures import ThreadPoolExecutor
 
 from neo4j import GraphDatabase,unit_of_work
 import numpy as np
@@ -10,6 +14,9 @@ import graph_tool.all as gt
 # currently we only support neo4j
 from tqdm import tqdm
 
+from property_store import PropertyStore, ObjectPropertyStore, ColumnarPropertyStore
+from graph_index import SparseAdjacency, degree_statistics
+
 class SchemaScanner:
     node_count = 0
     edge_count = 0
@@ -17,13 +24,63 @@ class SchemaScanner:
     edge_labels = []
     node_properties = {}
     connectivity_matrix = []
+    # {(source label, edge type, target label): number of edges}
+    connectivity_counts = {}
+    # {label: {property: [value types]}}, types of a property name are not merged across labels
+    label_properties_types = {}
+    # id watermarks and mirrored entity counts of graph_full, used by refresh()
+    largest_node_id = -1
+    largest_edge_id = -1
+    mirror_node_count = 0
+    mirror_edge_count = 0
+    # sorted vp["neo4j_id"] cache of the read-only scan
+    sorted_neo4j_ids = None
+    # degree distribution of graph_full, see scan_degree_statistics
+    degree_stats = {}
 
     def __init__(self, ip, port, username, password):
         self.ip = ip
         self.port = port
         self.username = username
         self.password = password
-        pass
+        self.init_scanning_configs()
+
+    def init_scanning_configs(self):
+        config = configparser.ConfigParser()
+        config.read('graphgenie.ini')
+        # pairwise: one count query per label pair (old behaviour)
+        # aggregate: one pass over all relationships grouped by (label, type, label)
+        # catalog: db.schema.visualization() + count store, no pattern scan at all
+        self.connectivity_mode = config['schema_scanning']['connectivity_mode']
+        # number of nodes/relationships fetched per page when mirroring the graph
+        self.scan_batch_size = int(config['schema_scanning']['scan_batch_size'])
+        # batched: keys and value types of all labels in a few concurrent queries
+        # per_property: one keys query per label and one valueType() query per property
+        self.property_scan_mode = config['schema_scanning']['property_scan_mode']
+        self.scan_sessions = int(config['schema_scanning']['scan_sessions'])
+        # 1: no writes at all, vertices get dense indices mapped to elementId() on the client
+        # 0: `set n.id = id(n)` on every node and vertex index == id(n)
+        self.read_only_scan = int(config['schema_scanning']['read_only_scan'])
+        # node level connectivity (sparse adjacency per edge type) in connectivity_per_edge_label
+        self.node_connectivity = int(config['schema_scanning']['node_connectivity'])
+        # full: mirror the whole database, sample: bounded sample (see scan_graph_sample)
+        self.graph_fill_mode = config['schema_scanning']['graph_fill_mode']
+        self.sample_strategy = config['schema_scanning']['sample_strategy']
+        self.sample_max_vertices = int(config['schema_scanning']['sample_max_vertices'])
+        self.sample_max_edges = int(config['schema_scanning']['sample_max_edges'])
+        self.sample_seeds = int(config['schema_scanning']['sample_seeds'])
+        self.sample_seed_rounds = int(config['schema_scanning']['sample_seed_rounds'])
+        self.sample_fanout = int(config['schema_scanning']['sample_fanout'])
+        self.sample_scan_limit = int(config['schema_scanning']['sample_scan_limit'])
+        if self.graph_fill_mode == "sample":
+            # sampled vertices need the dense id mapping
+            self.read_only_scan = 1
+        # object: python dict/list per vertex, columnar: typed columns (see property_store.py)
+        self.property_storage = config['schema_scanning']['property_storage']
+        # reuse the last scan when the database fingerprint did not change
+        self.use_snapshot = int(config['schema_scanning']['use_snapshot'])
+        self.snapshot_dir = config['schema_scanning']['snapshot_dir']
+        self.verbose = int(config['default']['verbose'])
 
     def scan(self):
         pass
@@ -34,6 +91,15 @@ class SchemaScanner:
         print("Node labels: {}".format(str(self.node_labels)))
         print("Edge labels: {}".format(str(self.edge_labels)))
 
+    def scan_degree_statistics(self):
+        # Degree distribution of graph_full (mean, max, percentiles of out/in/total degree).
+        # Kept in gp["degree_stats"] so it is saved with snapshots; PathSampler reads its
+        # supernode threshold from it.
+        self.degree_stats = degree_statistics(self.graph_full)
+        self.graph_full.gp["degree_stats"] = self.graph_full.new_graph_property("object")
+        self.graph_full.gp["degree_stats"] = self.degree_stats
+        print("Degree statistics: {}".format(self.degree_stats["total"]))
+
     def print_connectivity(self):
         for i in self.node_labels:
             print(i[0], end=" ")
@@ -56,6 +122,8 @@ class Neo4jSchemaScanner(SchemaScanner):
         self.graph_full = graph_full
 
         self.neo4j_init()
+        if self.use_snapshot and self.load_snapshot(self.fingerprint()):
+            return self.node_labels, self.edge_labels, self.node_properties, self.connectivity_matrix, self.properties_types, self.graph_full
         get_node_count_query = "MATCH (n) RETURN count(n)"
         self.node_count = (list(self.execute_query(get_node_count_query)[0].values())[0])
         get_edge_count_query = "MATCH ()-[n]-() RETURN count(n)"
@@ -81,13 +149,145 @@ class Neo4jSchemaScanner(SchemaScanner):
         for i in query_result:
             self.edge_labels.append(i['label'])
         self.print_schema_info()
-        self.scan_properties()
-        self.scan_keys_types()
+        if self.property_scan_mode == "batched":
+            self.scan_properties_types_batched()
+        else:
+            self.scan_properties()
+            self.scan_keys_types()
         self.scan_connectivity()
-        # self.scan_connectivity_matrix()
-        self.scan_graph_fill()
+        if self.graph_fill_mode == "sample":
+            self.scan_graph_sample()
+        else:
+            self.scan_graph_fill()
+        if self.node_connectivity:
+            self.scan_connectivity_matrix()
+        self.scan_degree_statistics()
+        if self.use_snapshot:
+            # fingerprint taken after the scan, scan_graph_fill writes n.id unless read_only_scan
+            self.save_snapshot(self.fingerprint())
         return self.node_labels, self.edge_labels, self.node_properties, self.connectivity_matrix, self.properties_types, self.graph_full
 
+    def fingerprint(self):
+        # Cheap description of the database: every query here is answered by the count store
+        # or the token store. Any write moves the last committed transaction id.
+        get_node_count_query = "MATCH (n) RETURN count(n) AS count"
+        get_edge_count_query = "MATCH ()-[r]->() RETURN count(r) AS count"
+        get_node_labels_query = "CALL db.labels() YIELD label RETURN collect(label) AS labels"
+        get_edge_labels_query = "CALL db.relationshipTypes() YIELD relationshipType RETURN collect(relationshipType) AS labels"
+        fingerprint = {
+            "address": "{}:{}".format(self.ip, self.port),
+            # every setting that changes graph_full, its maps or the schema outputs
+            "settings": self.scan_settings(),
+            "node_count": self.execute_query(get_node_count_query)[0]["count"],
+            "edge_count": self.execute_query(get_edge_count_query)[0]["count"],
+            "node_labels": sorted(self.execute_query(get_node_labels_query)[0]["labels"]),
+            "edge_labels": sorted(self.execute_query(get_edge_labels_query)[0]["labels"]),
+            "last_committed_tx": None,
+        }
+        try:
+            get_last_tx_query = "SHOW DATABASES YIELD name, currentStatus, lastCommittedTxn WHERE name = $name RETURN lastCommittedTxn"
+            with self.driver.session(database="system") as session:
+                result = session.run(get_last_tx_query, {"name": "neo4j"}).data()
+            if len(result) > 0:
+                fingerprint["last_committed_tx"] = result[0]["lastCommittedTxn"]
+        except Exception as e:
+            # Older servers do not expose lastCommittedTxn, counts and labels are used alone
+            print("Could not read last committed transaction id: {}".format(str(e)))
+        return fingerprint
+
+    def scan_settings(self):
+        settings = {
+            "connectivity_mode": self.connectivity_mode,
+            "property_scan_mode": self.property_scan_mode,
+            "read_only_scan": self.read_only_scan,
+            "node_connectivity": self.node_connectivity,
+            "graph_fill_mode": self.graph_fill_mode,
+            "property_storage": self.property_storage,
+        }
+        if self.graph_fill_mode == "sample":
+            settings.update({
+                "sample_strategy": self.sample_strategy,
+                "sample_max_vertices": self.sample_max_vertices,
+                "sample_max_edges": self.sample_max_edges,
+                "sample_seeds": self.sample_seeds,
+                "sample_seed_rounds": self.sample_seed_rounds,
+                "sample_fanout": self.sample_fanout,
+                "sample_scan_limit": self.sample_scan_limit,
+            })
+        return settings
+
+    def snapshot_path(self, fingerprint):
+        key = hashlib.sha1(json.dumps(fingerprint, sort_keys=True).encode()).hexdigest()
+        return os.path.join(self.snapshot_dir, "schema-{}".format(key))
+
+    def save_snapshot(self, fingerprint):
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        path = self.snapshot_path(fingerprint)
+        schema = {
+            "fingerprint": fingerprint,
+            "node_count": self.node_count,
+            "edge_count": self.edge_count,
+            "node_labels": self.node_labels,
+            "edge_labels": self.edge_labels,
+            "node_properties": self.node_properties,
+            "properties_types": self.properties_types,
+            "label_properties_types": self.label_properties_types,
+            "connectivity_matrix": self.connectivity_matrix,
+            "connectivity_counts": [[k[0], k[1], k[2], v] for k, v in self.connectivity_counts.items()],
+            # watermarks for refresh()
+            "largest_node_id": self.largest_node_id,
+            "largest_edge_id": self.largest_edge_id,
+            "mirror_node_count": self.mirror_node_count,
+            "mirror_edge_count": self.mirror_edge_count,
+        }
+        # graph first: a schema file without its graph is never considered valid
+        self.graph_full.save(path + ".gt")
+        with open(path + ".json", "w") as f:
+            json.dump(schema, f)
+        print("Saved schema snapshot: {}".format(path))
+
+    def load_snapshot(self, fingerprint):
+        path = self.snapshot_path(fingerprint)
+        if not os.path.exists(path + ".json") or not os.path.exists(path + ".gt"):
+            return False
+        with open(path + ".json") as f:
+            schema = json.load(f)
+        if schema["fingerprint"] != fingerprint:
+            return False
+        print("Loading schema snapshot: {}".format(path))
+        self.node_count = schema["node_count"]
+        self.edge_count = schema["edge_count"]
+        self.node_labels = schema["node_labels"]
+        self.edge_labels = schema["edge_labels"]
+        self.node_properties = schema["node_properties"]
+        self.properties_types = schema["properties_types"]
+        self.label_properties_types = schema["label_properties_types"]
+        self.connectivity_matrix = schema["connectivity_matrix"]
+        self.connectivity_counts = {(i[0], i[1], i[2]): i[3] for i in schema["connectivity_counts"]}
+        self.largest_node_id = schema["largest_node_id"]
+        self.largest_edge_id = schema["largest_edge_id"]
+        self.mirror_node_count = schema["mirror_node_count"]
+        self.mirror_edge_count = schema["mirror_edge_count"]
+        self.graph_full = gt.load_graph(path + ".gt")
+        self.property_store = PropertyStore.from_graph(self.graph_full)
+        self.label_set_index = {}
+        if "label_set" not in self.graph_full.vertex_properties:
+            # snapshot saved before the label sets were kept, refresh() needs them
+            self.graph_full.vp["label_set"] = self.graph_full.new_vertex_property("int64_t")
+            self.graph_full.gp["label_sets"] = self.graph_full.new_graph_property("object")
+            self.graph_full.gp["label_sets"] = []
+            vertices = np.arange(self.graph_full.num_vertices())
+            self.graph_full.vp["label_set"].a[vertices] = self.label_set_ids([self.property_store.labels(vertice) for vertice in vertices])
+        if "degree_stats" in self.graph_full.graph_properties:
+            self.degree_stats = self.graph_full.gp["degree_stats"]
+        else:
+            self.scan_degree_statistics()
+        if self.node_connectivity:
+            # rebuilt from the edges of graph_full, nothing is read from the database
+            self.scan_connectivity_matrix()
+        self.print_schema_info()
+        return True
+
     def scan_properties(self):
         get_properties_query = """
             MATCH (n:{})
@@ -103,6 +303,11 @@ class Neo4jSchemaScanner(SchemaScanner):
             self.node_properties[each_node_label] = properties
 
     def scan_connectivity(self):
+        if self.connectivity_mode == "aggregate":
+            return self.scan_connectivity_aggregated()
+        if self.connectivity_mode == "catalog":
+            return self.scan_connectivity_catalog()
+        self.connectivity_matrix = []
         for each_node_label in self.node_labels:
             matrix_row = []
             for each_test_node_label in self.node_labels:
@@ -118,10 +323,66 @@ class Neo4jSchemaScanner(SchemaScanner):
             self.connectivity_matrix.append(matrix_row)
         self.print_connectivity()
 
+    def scan_connectivity_aggregated(self):
+        # One aggregated pass over all relationships instead of O(L^2) pattern scans.
+        # A node with several labels contributes to every (label, type, label) combination.
+        get_connectivity_query = """
+            MATCH (a)-[r]->(b)
+            WITH labels(a) AS source_labels, type(r) AS edge_type, labels(b) AS target_labels, count(*) AS edge_count
+            UNWIND source_labels AS source_label
+            UNWIND target_labels AS target_label
+            RETURN source_label, edge_type, target_label, sum(edge_count) AS edge_count;
+        """
+        query_result = self.execute_query(get_connectivity_query)
+        connectivity_counts = {}
+        for i in query_result:
+            connectivity_counts[(i['source_label'], i['edge_type'], i['target_label'])] = i['edge_count']
+        self.fill_connectivity(connectivity_counts)
+
+    def scan_connectivity_catalog(self):
+        # The schema procedure only reads the count store, so it is cheap on any graph size.
+        # The count store has no exact (label, type, label) counts, we take the tighter of
+        # count((:a)-[:t]->()) and count(()-[:t]->(:b)) which is an upper bound of the real value.
+        get_schema_query = """
+            CALL db.schema.visualization() YIELD relationships
+            UNWIND relationships AS r
+            RETURN labels(startNode(r))[0] AS source_label, type(r) AS edge_type, labels(endNode(r))[0] AS target_label;
+        """
+        query_result = self.execute_query(get_schema_query)
+        outgoing_counts = {}
+        incoming_counts = {}
+        connectivity_counts = {}
+        for i in query_result:
+            source_label, edge_type, target_label = i['source_label'], i['edge_type'], i['target_label']
+            if (source_label, edge_type) not in outgoing_counts:
+                test_query = "MATCH (:`{}`)-[r:`{}`]->() RETURN count(r) AS edge_count".format(source_label, edge_type)
+                outgoing_counts[(source_label, edge_type)] = self.execute_query(test_query)[0]['edge_count']
+            if (edge_type, target_label) not in incoming_counts:
+                test_query = "MATCH ()-[r:`{}`]->(:`{}`) RETURN count(r) AS edge_count".format(edge_type, target_label)
+                incoming_counts[(edge_type, target_label)] = self.execute_query(test_query)[0]['edge_count']
+            connectivity_counts[(source_label, edge_type, target_label)] = min(
+                outgoing_counts[(source_label, edge_type)],
+                incoming_counts[(edge_type, target_label)]
+            )
+        self.fill_connectivity(connectivity_counts)
+
+    def fill_connectivity(self, connectivity_counts):
+        # connectivity_counts: {(source label, edge type, target label): number of edges}
+        # connectivity_matrix keeps its old 0/1 semantics (no self connection) for the generators
+        self.connectivity_counts = {k: v for k, v in connectivity_counts.items() if v > 0}
+        label_index = {label: index for index, label in enumerate(self.node_labels)}
+        self.connectivity_matrix = [[0 for _ in self.node_labels] for _ in self.node_labels]
+        for (source_label, edge_type, target_label) in self.connectivity_counts:
+            if source_label not in label_index or target_label not in label_index:
+                continue
+            if source_label != target_label:
+                self.connectivity_matrix[label_index[source_label]][label_index[target_label]] = 1
+        self.print_connectivity()
+
     @unit_of_work(timeout=60*1000)
-    def execute_query(self, query):
+    def execute_query(self, query, parameters=None):
         with self.driver.session() as session:
-            query_result = session.execute_write(self._new_execute, query)
+            query_result = session.execute_write(self._new_execute, query, parameters)
             return query_result
         
     def scan_keys_types(self):
@@ -142,110 +403,557 @@ class Neo4jSchemaScanner(SchemaScanner):
                 
                 for i in query_result:
                     properties_types.update(query_result[0]) 
-        print(f"properties_types:{properties_types}")
+        if self.verbose:
+            print(f"properties_types:{properties_types}")
         self.properties_types = properties_types
         
+    def scan_properties_types_batched(self):
+        # Labels are split into scan_sessions chunks, each chunk is one query (a UNION of label
+        # scans) run on its own session. Returns the same node_properties/properties_types as
+        # scan_properties + scan_keys_types and the per-label typed catalog label_properties_types.
+        get_properties_types_branch = """
+            MATCH (n:`{node_label}`)
+            UNWIND keys(n) AS key
+            RETURN "{node_label}" AS label, key, valueType(n[key]) AS value_type
+        """
+        get_properties_types_query = """
+            CALL {{ {branches} }}
+            RETURN label, key, collect(DISTINCT value_type) AS types
+            ORDER BY label, key;
+        """
+        chunks = [self.node_labels[i::self.scan_sessions] for i in range(self.scan_sessions)]
+        queries = [
+            get_properties_types_query.format(branches=" UNION ".join(
+                get_properties_types_branch.format(node_label=node_label) for node_label in chunk
+            ))
+            for chunk in chunks if len(chunk) > 0
+        ]
+        with ThreadPoolExecutor(max_workers=self.scan_sessions) as executor:
+            query_results = list(executor.map(self.execute_query, queries))
+
+        label_properties_types = {node_label: {} for node_label in self.node_labels}
+        for query_result in query_results:
+            for i in query_result:
+                # collect() keeps the types in the order the scan met them
+                label_properties_types[i['label']][i['key']] = list(i['types'])
+        self.set_properties_types(label_properties_types)
+
+    def set_properties_types(self, label_properties_types):
+        # label_properties_types: {label: {key: [value types in the order they were seen]}}
+        # Sets it with node_properties and the flat properties_types of the generators, where a
+        # property name keeps the first type seen (labels in node_labels order).
+        self.label_properties_types = label_properties_types
+        properties_types = {}
+        for node_label in self.node_labels:
+            self.node_properties[node_label] = list(label_properties_types[node_label].keys())
+            for key, types in label_properties_types[node_label].items():
+                properties_types.setdefault(key, types[0])
+        if self.verbose:
+            print(f"properties_types:{properties_types}")
+        self.properties_types = properties_types
+
     def scan_connectivity_matrix(self):
-        # Deprecated: This was old approach using a connectivity matrix
+        # Node level connectivity: one sparse CSR adjacency per edge type (see graph_index.py)
+        # instead of a dense (largest_id+1)^2 matrix per edge type, built from the edges of
+        # graph_full (rows and columns are vertex indices). Nothing is read from the database.
         print("CALCULATING REAL CONNECTIVITY")
-        # We want to scan for each label the connection matrix.
-        
-        # Set an ID to each node:
-        set_id_query = "match (n) set n.id = id(n)"
-        self.execute_query(set_id_query)
-        # Gather list of all ids
-        get_all_ids_query = "match (n) Return n.id order BY n.id desc"
-        all_ids = self.execute_query(get_all_ids_query)
-        print("all_ids",all_ids[0:5])
-        largest_id = all_ids[0]["n.id"]
-        # print("largest_id",largest_id,type(largest_id))
-        # input()
-        # Init matrices:
-        self.connectivity_nparray_per_edge_label_dict ={
-            edge_label:np.zeros((largest_id+1,largest_id+1),dtype=np.uint32) for edge_label in self.edge_labels # +1 for testing with updates later. Dtype of uint32 for 0-4294967295
-        }
-        # fill matrices
-        for edge_label in self.edge_labels:
-            query= f"match (n)-[r:{edge_label}]->(n2) Return n.id,n2.id order BY n.id"
-            result = self.execute_query(query=query)
-            # print("RESULT:",result[0:5])
-            matrix = self.connectivity_nparray_per_edge_label_dict[edge_label]
-            for line in result:
-                # print("LINE:",line)
-                # input()
-                nid,n2id = int(line["n.id"]), int(line["n2.id"])
-                matrix[nid,n2id] +=1
-            
-                
+        self.connectivity_per_edge_label = SparseAdjacency.from_graph(self.graph_full)
+        return self.connectivity_per_edge_label
+
     def scan_graph_fill(self):
         # Beginning to fill the graph
+        # Nodes and relationships are streamed in id-range pages of scan_batch_size, so the peak
+        # memory is bounded by one page and not by the size of the graph.
         print("===FILLING GRAPH (Can take a while)===")
-        # Setting ids to each node
-        print("Setting ids to each node")
-        set_id_query = "match (n) set n.id = id(n)"
-        self.execute_query(set_id_query)
-        # Gather list of all ids
-        print("Gather list of all ids")
-        get_all_ids_query = "match (n) Return n.id order BY n.id desc"
-        all_ids = self.execute_query(get_all_ids_query)
-        print("all_ids",all_ids[0:5])
-        largest_id = all_ids[0]["n.id"]
-        self.graph_full_vertices = [self.graph_full.add_vertex() for _ in range(largest_id+1)] 
-        self.graph_nodes_dicts = {}   
-        self.graph_edges_dicts = {}
-        #Properties
-        node_properties = self.graph_full.new_vertex_property("object")
-        edge_properties = self.graph_full.new_edge_property("object")
-        self.graph_full.vp["properties"] = node_properties
-        self.graph_full.ep["properties"] = edge_properties
-
-        node_labels = self.graph_full.new_vertex_property("object")
-        self.graph_full.vp["labels"] = node_labels
-        #Query and add labels:
-        query = "match(n) Return n.id,Labels(n)"
-        labels = self.execute_query(query)
-        for label in tqdm(labels):
-            nid = int(label["n.id"])
-            vertice = self.graph_full.vertex(nid)
-            self.graph_full.vertex_properties["labels"][vertice]= label["Labels(n)"]
-
-        # Adding edges
-        print("Querying vertices and edges (Can take a while))") 
-        query = "match (n)-[r]->(n2) Return n,r,n2 order BY n.id"
-        relations = self.execute_query(query)
-        print("Adding vertices and edges (with their properties) (Can take a while))")
-        for relation in tqdm(relations):
-            n1_id = int(relation["n"]["id"])
-            n2_id = int(relation["n2"]["id"])
-            vertice1 = self.graph_full.vertex(n1_id)
-            vertice2 = self.graph_full.vertex(n2_id)
-            edge =self.graph_full.add_edge(vertice1,vertice2)
-            # Here we can add properties to the edges:
-            # https://graph-tool.skewed.de/static/doc/quickstart.html#sec-property-maps
-            self.graph_full.vertex_properties["properties"][vertice1]= relation["n"]
-            self.graph_full.vertex_properties["properties"][vertice2]= relation["n2"]
-            self.graph_full.edge_properties["properties"][edge] = relation["r"][1]
-
-
-
-            
+        if not self.read_only_scan:
+            # Setting ids to each node
+            print("Setting ids to each node")
+            set_id_query = "match (n) set n.id = id(n)"
+            self.execute_query(set_id_query)
+        largest_id = self.largest_id(self.get_largest_node_id_query)
+        self.init_graph_maps(largest_id)
+
+        print("Querying vertices with their labels and properties")
+        # `id(n) IN range()` is planned as a NodeByIdSeek, so each page only touches its own nodes
+        for lower in tqdm(range(0, largest_id+1, self.scan_batch_size)):
+            nodes = self.execute_query(self.get_nodes_page_query, {"lower": lower, "upper": lower+self.scan_batch_size})
+            self.add_nodes(nodes)
+
+        print("Querying and adding edges (Can take a while)")
+        largest_edge_id = self.largest_id(self.get_largest_edge_id_query)
+        self.largest_edge_id = largest_edge_id
+        for lower in tqdm(range(0, largest_edge_id+1, self.scan_batch_size)):
+            relations = self.execute_query(self.get_edges_page_query, {"lower": lower, "upper": lower+self.scan_batch_size})
+            self.add_relations(relations)
 
         print("Graph filled")
         print("===============")
 
+    def init_graph_maps(self, largest_id):
+        # property maps of graph_full shared by the full and the sampled fill
+        if self.read_only_scan:
+            # dense vertex indices, mapped back to the database by vp["neo4j_id"]/vp["element_id"]
+            self.graph_full.vp["neo4j_id"] = self.graph_full.new_vertex_property("int64_t")
+            self.graph_full.vp["element_id"] = self.graph_full.new_vertex_property("string")
+            self.sorted_neo4j_ids = None
+        elif largest_id >= 0:
+            # All vertices in one allocation, vertex index == id(n)
+            self.graph_full.add_vertex(largest_id+1)
 
-        
-                
-    def scan_graph_fill_edges(self):
-        pass
-    
-            
-        
+        #Properties
+        if self.property_storage == "columnar":
+            self.property_store = ColumnarPropertyStore(self.graph_full)
+        else:
+            self.property_store = ObjectPropertyStore(self.graph_full)
+        self.property_store.init_maps(self.label_properties_types)
+        # Edge types are interned: ep["type_id"] indexes gp["edge_types"]
+        edge_type_ids = self.graph_full.new_edge_property("int32_t")
+        self.graph_full.ep["type_id"] = edge_type_ids
+        self.graph_full.gp["edge_types"] = self.graph_full.new_graph_property("object")
+        self.graph_full.gp["edge_types"] = list(self.edge_labels)
+        # id(r) of each edge, needed to find deleted relationships in refresh()
+        self.graph_full.ep["rel_id"] = self.graph_full.new_edge_property("int64_t")
+        # labels of each mirrored vertex as an index into gp["label_sets"] (the distinct label
+        # lists), the per label counts and vertices of the mirror are numpy operations on it
+        self.graph_full.vp["label_set"] = self.graph_full.new_vertex_property("int64_t")
+        self.graph_full.gp["label_sets"] = self.graph_full.new_graph_property("object")
+        self.graph_full.gp["label_sets"] = []
+        self.label_set_index = {}
+        self.largest_node_id = largest_id
+        self.mirror_node_count = 0
+        self.mirror_edge_count = 0
+
+    def scan_graph_sample(self):
+        # Bounded-memory mirror: graph_full is built from a sample of the database that never
+        # exceeds sample_max_vertices/sample_max_edges. Schema statistics (labels, properties,
+        # connectivity) come from the other scans and stay exact.
+        # random_walk: walkers follow one random outgoing edge per step, restart on a new seed
+        # expansion: every discovered vertex contributes up to sample_fanout random edges
+        print("===SAMPLING GRAPH (max {} vertices, {} edges)===".format(self.sample_max_vertices, self.sample_max_edges))
+        largest_id = self.largest_id(self.get_largest_node_id_query)
+        self.init_graph_maps(largest_id)
+        self.largest_edge_id = self.largest_id(self.get_largest_edge_id_query)
+
+        node_count = self.execute_query(self.get_node_count_query)[0]["count"]
+        get_seeds_query = """
+            MATCH (n) WHERE rand() < $probability
+            RETURN id(n) AS id LIMIT $limit
+        """
+        # Each node scans at most sample_scan_limit of its edges, supernodes cost the same as the others
+        get_neighbours_query = """
+            UNWIND $ids AS node_id
+            MATCH (n) WHERE id(n) = node_id
+            CALL {
+                WITH n
+                MATCH (n)-[r]->(m)
+                RETURN r, m LIMIT $scan_limit
+            }
+            WITH node_id, r, m ORDER BY rand()
+            WITH node_id, collect([id(r), type(r), id(m)])[..$fanout] AS edges
+            UNWIND edges AS edge
+            RETURN node_id AS source, edge[2] AS target, edge[1] AS type, edge[0] AS id
+        """
+        fanout = 1 if self.sample_strategy == "random_walk" else self.sample_fanout
+        sampled_nodes = set()
+        sampled_relations = {}
+        frontier = []
+        seed_rounds = 0
+        while len(sampled_nodes) < self.sample_max_vertices and len(sampled_relations) < self.sample_max_edges:
+            if len(frontier) == 0:
+                if seed_rounds >= self.sample_seed_rounds or node_count == 0:
+                    break
+                seed_rounds += 1
+                probability = min(1.0, 2.0 * self.sample_seeds / node_count)
+                seeds = self.execute_query(get_seeds_query, {"probability": probability, "limit": self.sample_seeds})
+                frontier = [row["id"] for row in seeds if row["id"] not in sampled_nodes]
+                frontier = frontier[:self.sample_max_vertices - len(sampled_nodes)]
+                sampled_nodes.update(frontier)
+                continue
+            relations = self.execute_query(get_neighbours_query, {"ids": frontier, "scan_limit": self.sample_scan_limit, "fanout": fanout})
+            next_frontier = []
+            added = 0
+            for relation in relations:
+                if len(sampled_relations) >= self.sample_max_edges:
+                    break
+                if relation["target"] not in sampled_nodes:
+                    if len(sampled_nodes) >= self.sample_max_vertices:
+                        continue
+                    sampled_nodes.add(relation["target"])
+                    next_frontier.append(relation["target"])
+                elif self.sample_strategy == "random_walk":
+                    # walkers keep walking through already sampled vertices
+                    next_frontier.append(relation["target"])
+                if relation["id"] not in sampled_relations:
+                    sampled_relations[relation["id"]] = relation
+                    added += 1
+            # walkers going in circles inside the sample restart from new seeds
+            frontier = next_frontier if added > 0 else []
+        print("Sampled {} vertices and {} edges".format(len(sampled_nodes), len(sampled_relations)))
+
+        get_nodes_query = """
+            MATCH (n) WHERE id(n) IN $ids
+            RETURN id(n) AS id, elementId(n) AS element_id, labels(n) AS labels, properties(n) AS properties
+        """
+        sampled_nodes = sorted(sampled_nodes)
+        for lower in tqdm(range(0, len(sampled_nodes), self.scan_batch_size)):
+            nodes = self.execute_query(get_nodes_query, {"ids": sampled_nodes[lower:lower+self.scan_batch_size]})
+            self.add_nodes(nodes)
+        sampled_relations = list(sampled_relations.values())
+        for lower in range(0, len(sampled_relations), self.scan_batch_size):
+            self.add_relations(sampled_relations[lower:lower+self.scan_batch_size])
+        print("Graph sampled")
+        print("===============")
+
+    get_node_count_query = "MATCH (n) RETURN count(n) AS count"
+    get_edge_count_query = "MATCH ()-[r]->() RETURN count(r) AS count"
+    get_largest_node_id_query = "MATCH (n) RETURN max(id(n)) AS largest_id"
+    get_largest_edge_id_query = "MATCH ()-[r]->() RETURN max(id(r)) AS largest_id"
+    get_nodes_page_query = """
+        MATCH (n) WHERE id(n) IN range($lower, $upper - 1)
+        RETURN id(n) AS id, elementId(n) AS element_id, labels(n) AS labels, properties(n) AS properties
+    """
+    get_edges_page_query = """
+        MATCH (n)-[r]->(n2) WHERE id(r) IN range($lower, $upper - 1)
+        RETURN id(n) AS source, id(n2) AS target, type(r) AS type, id(r) AS id
+    """
+    # refresh(): same pages with the value types of the properties (patch_schema)
+    get_typed_nodes_page_query = """
+        MATCH (n) WHERE id(n) IN range($lower, $upper - 1)
+        RETURN id(n) AS id, elementId(n) AS element_id, labels(n) AS labels, properties(n) AS properties,
+            [key IN keys(n) | [key, valueType(n[key])]] AS types
+    """
+    set_ids_page_query = "MATCH (n) WHERE id(n) IN range($lower, $upper - 1) SET n.id = id(n)"
+    # reconcile_nodes()/reconcile_relations(): count store lookups and label/type scans
+    get_label_count_query = "MATCH (n:`{}`) RETURN count(n) AS count"
+    get_label_ids_query = "MATCH (n:`{}`) RETURN id(n) AS id"
+    get_unlabeled_ids_query = "MATCH (n) WHERE size(labels(n)) = 0 RETURN id(n) AS id"
+    get_type_count_query = "MATCH ()-[r:`{}`]->() RETURN count(r) AS count"
+    get_type_ids_query = "MATCH ()-[r:`{}`]->() RETURN id(r) AS id"
+    get_typed_nodes_query = """
+        MATCH (n) WHERE id(n) IN $ids
+        RETURN id(n) AS id, elementId(n) AS element_id, labels(n) AS labels, properties(n) AS properties,
+            [key IN keys(n) | [key, valueType(n[key])]] AS types
+    """
+    set_ids_query = "MATCH (n) WHERE id(n) IN $ids SET n.id = id(n)"
+    get_edges_query = """
+        MATCH (n)-[r]->(n2) WHERE id(r) IN $ids
+        RETURN id(n) AS source, id(n2) AS target, type(r) AS type, id(r) AS id
+    """
+
+    def largest_id(self, query):
+        # max(id()) of one of the get_largest_*_id queries, -1 on an empty database
+        largest_id = self.execute_query(query)[0]["largest_id"]
+        return -1 if largest_id is None else largest_id
+
+    def node_vertices(self, node_ids, create=False):
+        # vertex index of each id(n), with create=True unknown ids get a vertex
+        # default scan: vertex index == id(n), the graph grows up to the largest id
+        # read-only scan: dense indices in order of discovery, vp["neo4j_id"] maps them back
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        if not self.read_only_scan:
+            if create and len(node_ids) > 0 and node_ids.max() >= self.graph_full.num_vertices():
+                self.graph_full.add_vertex(int(node_ids.max()) + 1 - self.graph_full.num_vertices())
+            return node_ids
+        if self.sorted_neo4j_ids is None:
+            known = self.graph_full.vp["neo4j_id"].a
+            self.neo4j_id_order = np.argsort(known, kind="stable")
+            self.sorted_neo4j_ids = known[self.neo4j_id_order]
+        vertices = np.full(len(node_ids), -1, dtype=np.int64)
+        found = np.zeros(len(node_ids), dtype=bool)
+        if len(self.sorted_neo4j_ids) > 0:
+            positions = np.minimum(np.searchsorted(self.sorted_neo4j_ids, node_ids), len(self.sorted_neo4j_ids) - 1)
+            found = self.sorted_neo4j_ids[positions] == node_ids
+            vertices[found] = self.neo4j_id_order[positions[found]]
+        if create and not found.all():
+            new_ids = np.unique(node_ids[~found])
+            first = self.graph_full.num_vertices()
+            self.graph_full.add_vertex(len(new_ids))
+            self.graph_full.vp["neo4j_id"].a[first:] = new_ids
+            vertices[~found] = first + np.searchsorted(new_ids, node_ids[~found])
+            self.sorted_neo4j_ids = None
+        return vertices
+
+    def add_nodes(self, nodes):
+        # nodes: rows with id, element_id, labels, properties
+        if len(nodes) == 0:
+            return
+        vertices = self.node_vertices([node["id"] for node in nodes], create=True)
+        for node, vertice in zip(nodes, vertices):
+            node["vertex"] = int(vertice)
+        self.property_store.add_nodes(nodes)
+        self.graph_full.vp["label_set"].a[vertices] = self.label_set_ids([node["labels"] for node in nodes])
+        if self.read_only_scan:
+            element_ids = self.graph_full.vp["element_id"]
+            for node in nodes:
+                element_ids[self.graph_full.vertex(node["vertex"])] = node["element_id"]
+        self.mirror_node_count += len(nodes)
+
+    def label_set_ids(self, labels):
+        # index of each label list in gp["label_sets"], new label sets are appended
+        label_sets = self.graph_full.gp["label_sets"]
+        if len(self.label_set_index) != len(label_sets):
+            # graph_full was loaded from a snapshot
+            self.label_set_index = {label_set: index for index, label_set in enumerate(label_sets)}
+        ids = np.empty(len(labels), dtype=np.int64)
+        for row, node_labels in enumerate(labels):
+            key = tuple(node_labels)
+            if key not in self.label_set_index:
+                self.label_set_index[key] = len(label_sets)
+                label_sets.append(key)
+            ids[row] = self.label_set_index[key]
+        return ids
+
+    def mirror_label_vertices(self, label):
+        # mirrored vertices with the label, None: the vertices without any label
+        label_sets = self.graph_full.gp["label_sets"]
+        set_ids = [index for index, label_set in enumerate(label_sets) if (label in label_set if label is not None else len(label_set) == 0)]
+        mirrored = self.graph_full.vp["mirrored"].a.astype(bool)
+        return np.flatnonzero(mirrored & np.isin(self.graph_full.vp["label_set"].a, set_ids))
+
+    def mirror_label_counts(self):
+        # {label: number of mirrored vertices with it}, one bincount over the label sets
+        label_sets = self.graph_full.gp["label_sets"]
+        mirrored = self.graph_full.vp["mirrored"].a.astype(bool)
+        set_counts = np.bincount(self.graph_full.vp["label_set"].a[mirrored], minlength=len(label_sets))
+        counts = {}
+        for label_set, count in zip(label_sets, set_counts):
+            for label in label_set:
+                counts[label] = counts.get(label, 0) + int(count)
+        return counts
+
+    def vertex_node_ids(self, vertices):
+        # id(n) of each vertex, the inverse of node_vertices
+        if self.read_only_scan:
+            return self.graph_full.vp["neo4j_id"].a[vertices]
+        return np.asarray(vertices, dtype=np.int64)
+
+    def add_relations(self, relations, limit=None):
+        # relations: rows with source, target, type, id. Inserted with one add_edge_list call.
+        # Relationships with an endpoint that is not mirrored (a sampled graph_full) are left
+        # out, and the ones after the first `limit`. Returns the ones added.
+        if len(relations) == 0:
+            return []
+        edge_types = self.graph_full.gp["edge_types"]
+        edge_type_index = {edge_label: index for index, edge_label in enumerate(edge_types)}
+        for relation in relations:
+            if relation["type"] not in edge_type_index:
+                edge_type_index[relation["type"]] = len(edge_types)
+                edge_types.append(relation["type"])
+        sources = self.node_vertices([relation["source"] for relation in relations])
+        targets = self.node_vertices([relation["target"] for relation in relations])
+        known = (sources >= 0) & (targets >= 0)
+        if limit is not None:
+            known &= np.cumsum(known) <= limit
+        if not known.all():
+            relations = [relation for relation, is_known in zip(relations, known) if is_known]
+            sources, targets = sources[known], targets[known]
+            if len(relations) == 0:
+                return []
+        for relation, source, target in zip(relations, sources, targets):
+            relation["source_vertex"] = int(source)
+            relation["target_vertex"] = int(target)
+        edge_list = np.array(
+            [(relation["source_vertex"], relation["target_vertex"], edge_type_index[relation["type"]], relation["id"]) for relation in relations],
+            dtype=np.int64
+        )
+        # array-based insertion, the extra columns go to ep["type_id"] and ep["rel_id"]
+        self.graph_full.add_edge_list(edge_list, eprops=[self.graph_full.ep["type_id"], self.graph_full.ep["rel_id"]])
+        self.mirror_edge_count += len(relations)
+        return relations
+
+    def refresh(self, path_sampler=None):
+        # Incremental update of the scan outputs after the graph was changed (e.g. the fakeperson
+        # nodes of call_in_transaction_generator or the view nodes of CypherQueryMutatorSequential).
+        # New nodes and relationships are read above the id watermarks of the last scan up to the
+        # current largest id, in id-range pages of scan_batch_size (NodeByIdSeek and
+        # RelationshipByIdSeek, like scan_graph_fill), so the cost follows the id range added
+        # since the last scan. In sample mode they are only read while the sample is below
+        # sample_max_vertices/sample_max_edges.
+        # Deleted ones show up as a count difference. The count store then gives the labels and
+        # relationship types whose counts differ from the mirror, only those are scanned again
+        # (see reconcile_nodes and reconcile_relations).
+        # The indexes derived from graph_full are rebuilt: connectivity_per_edge_label, the
+        # degree statistics and, when given, path_sampler (PathSampler.rebuild, forks taken
+        # before keep the old graph).
+        # Note: SET on an already mirrored node is not detected, nor a deleted node whose id
+        # was reused by a node with the same labels.
+        print("===REFRESHING SCHEMA===")
+        sample = self.graph_fill_mode == "sample"
+        new_nodes = []
+        largest_id = self.largest_id(self.get_largest_node_id_query)
+        for lower in range(self.largest_node_id + 1, largest_id + 1, self.scan_batch_size):
+            if sample and self.mirror_node_count >= self.sample_max_vertices:
+                break
+            page = {"lower": lower, "upper": lower + self.scan_batch_size}
+            if not self.read_only_scan:
+                # same ids as scan_graph_fill, the predicates of the generators read n.id
+                self.execute_query(self.set_ids_page_query, page)
+            nodes = self.execute_query(self.get_typed_nodes_page_query, page)
+            if sample:
+                nodes = nodes[:self.sample_max_vertices - self.mirror_node_count]
+            self.add_nodes(nodes)
+            self.patch_schema(nodes)
+            new_nodes += nodes
+        self.largest_node_id = max(self.largest_node_id, largest_id)
+
+        # in sample mode only the relationships between sampled nodes are mirrored and counted
+        new_relations = []
+        largest_edge_id = self.largest_id(self.get_largest_edge_id_query)
+        for lower in range(self.largest_edge_id + 1, largest_edge_id + 1, self.scan_batch_size):
+            if sample and self.mirror_edge_count >= self.sample_max_edges:
+                break
+            relations = self.execute_query(self.get_edges_page_query, {"lower": lower, "upper": lower + self.scan_batch_size})
+            new_relations += self.add_relations(relations, self.sample_max_edges - self.mirror_edge_count if sample else None)
+        self.largest_edge_id = max(self.largest_edge_id, largest_edge_id)
+        self.patch_connectivity(new_relations, 1)
+
+        # ids of deleted entities can be reused, so count mismatches are reconciled by ids. The
+        # counts are compared per label and per type, a deletion and an addition of another
+        # type can leave the totals unchanged.
+        # (a sampled mirror never matches the database counts, it only gets the additions)
+        if not sample:
+            self.reconcile_nodes(self.execute_query(self.get_node_count_query)[0]["count"])
+            self.reconcile_relations()
+        print("Refreshed: {} new nodes, {} new relationships".format(len(new_nodes), len(new_relations)))
+        if self.node_connectivity:
+            self.scan_connectivity_matrix()
+        self.scan_degree_statistics()
+        if path_sampler is not None:
+            path_sampler.rebuild()
+        if self.use_snapshot:
+            self.save_snapshot(self.fingerprint())
+        return self.node_labels, self.edge_labels, self.node_properties, self.connectivity_matrix, self.properties_types, self.graph_full
+
+    def patch_schema(self, nodes):
+        for node in nodes:
+            for label in node["labels"]:
+                if label not in self.node_labels:
+                    self.node_labels.append(label)
+                    self.node_properties[label] = []
+                    for row in self.connectivity_matrix:
+                        row.append(0)
+                    self.connectivity_matrix.append([0 for _ in self.node_labels])
+                for key, key_type in node["types"]:
+                    if key not in self.node_properties[label]:
+                        self.node_properties[label].append(key)
+                    if key not in self.properties_types:
+                        self.properties_types[key] = key_type
+                    label_types = self.label_properties_types.setdefault(label, {}).setdefault(key, [])
+                    if key_type not in label_types:
+                        label_types.append(key_type)
+
+    def patch_connectivity(self, relations, sign):
+        # sign is 1 for added relationships and -1 for deleted ones
+        if len(relations) == 0:
+            return
+        for relation in relations:
+            if relation["type"] not in self.edge_labels:
+                self.edge_labels.append(relation["type"])
+            for source_label in self.property_store.labels(self.graph_full.vertex(relation["source_vertex"])):
+                for target_label in self.property_store.labels(self.graph_full.vertex(relation["target_vertex"])):
+                    key = (source_label, relation["type"], target_label)
+                    self.connectivity_counts[key] = self.connectivity_counts.get(key, 0) + sign
+        self.fill_connectivity(self.connectivity_counts)
+
+    def reconcile_nodes(self, node_count):
+        # Deleted and reused node ids. Only the labels whose count (count store) differs from
+        # the mirror are scanned, nodes without labels are not in the count store and are only
+        # scanned when the labels do not explain the difference.
+        mirror_counts = self.mirror_label_counts()
+        labels = sorted(set(self.node_labels) | set(mirror_counts))
+        changed = [
+            label for label in labels
+            if self.execute_query(self.get_label_count_query.format(label))[0]["count"] != mirror_counts.get(label, 0)
+        ]
+        self.reconcile_label_nodes(changed)
+        if self.mirror_node_count != node_count:
+            self.reconcile_label_nodes([None])
+
+    def reconcile_label_nodes(self, labels):
+        # ids of the nodes with each label (None: without labels) against the mirrored ones
+        deleted = [np.zeros(0, dtype=np.int64)]
+        reused = [np.zeros(0, dtype=np.int64)]
+        for label in labels:
+            query = self.get_label_ids_query.format(label) if label is not None else self.get_unlabeled_ids_query
+            present = np.array([row["id"] for row in self.execute_query(query)], dtype=np.int64)
+            vertices = self.mirror_label_vertices(label)
+            node_ids = self.vertex_node_ids(vertices)
+            deleted.append(vertices[~np.isin(node_ids, present)])
+            reused.append(present[~np.isin(present, node_ids)])
+        deleted = np.unique(np.concatenate(deleted))
+        reused = np.unique(np.concatenate(reused))
+        if len(reused) > 0:
+            # an id mirrored under other labels is a label change, which is not detected, unless
+            # its node is deleted here (the id was reused by a node with other labels)
+            vertices = self.node_vertices(reused)
+            mirrored = self.graph_full.vp["mirrored"].a.astype(bool)
+            mirrored[deleted] = False
+            reused = reused[(vertices < 0) | ~mirrored[np.maximum(vertices, 0)]]
+        # the relationships of a deleted node are gone too, they are counted out while the labels
+        # of both endpoints are still known
+        edge_types = self.graph_full.gp["edge_types"]
+        type_ids = self.graph_full.ep["type_id"]
+        rel_ids = self.graph_full.ep["rel_id"]
+        deleted_relations = {}
+        for vertice in deleted:
+            for edge in self.graph_full.vertex(int(vertice)).all_edges():
+                deleted_relations[int(rel_ids[edge])] = {
+                    "source_vertex": int(edge.source()), "target_vertex": int(edge.target()),
+                    "type": edge_types[type_ids[edge]], "id": int(rel_ids[edge])
+                }
+        self.patch_connectivity(list(deleted_relations.values()), -1)
+        for vertice in deleted:
+            # Vertices are never removed, that would shift the vertex <-> id(n) mapping
+            self.graph_full.clear_vertex(self.graph_full.vertex(int(vertice)))
+            self.property_store.clear_node(self.graph_full.vertex(int(vertice)))
+        self.mirror_node_count -= len(deleted)
+        self.mirror_edge_count -= len(deleted_relations)
+        if len(reused) > 0:
+            reused = [int(node_id) for node_id in reused]
+            if not self.read_only_scan:
+                self.execute_query(self.set_ids_query, {"ids": reused})
+            nodes = self.execute_query(self.get_typed_nodes_query, {"ids": reused})
+            self.add_nodes(nodes)
+            self.patch_schema(nodes)
+
+    def reconcile_relations(self):
+        # Deleted and reused relationship ids. Only the types whose count (count store) differs
+        # from the mirror are scanned, the mirrored side is numpy operations on the edge arrays.
+        edge_types = self.graph_full.gp["edge_types"]
+        edges = self.graph_full.get_edges([self.graph_full.edge_index, self.graph_full.ep["type_id"], self.graph_full.ep["rel_id"]]).astype(np.int64, copy=False)
+        type_counts = np.bincount(edges[:, 3], minlength=len(edge_types))
+        deleted = [np.zeros((0, 5), dtype=np.int64)]
+        reused = []
+        for edge_type in sorted(set(self.edge_labels) | set(edge_types)):
+            type_id = list(edge_types).index(edge_type) if edge_type in edge_types else -1
+            mirror_count = int(type_counts[type_id]) if type_id >= 0 else 0
+            if self.execute_query(self.get_type_count_query.format(edge_type))[0]["count"] == mirror_count:
+                continue
+            present = np.array([row["id"] for row in self.execute_query(self.get_type_ids_query.format(edge_type))], dtype=np.int64)
+            mirrored = edges[edges[:, 3] == type_id]
+            deleted.append(mirrored[~np.isin(mirrored[:, 4], present)])
+            reused += present[~np.isin(present, mirrored[:, 4])].tolist()
+        deleted = np.concatenate(deleted)
+        if len(deleted) > 0:
+            self.patch_connectivity([
+                {"source_vertex": int(source), "target_vertex": int(target), "type": edge_types[type_id], "id": int(rel_id)}
+                for source, target, _, type_id, rel_id in deleted
+            ], -1)
+            # removed in one pass: the deleted edges are filtered out and purged
+            removed = self.graph_full.new_edge_property("bool")
+            removed.a[deleted[:, 2]] = True
+            self.graph_full.set_edge_filter(removed, inverted=True)
+            self.graph_full.purge_edges()
+            self.graph_full.clear_filters()
+            self.mirror_edge_count -= len(deleted)
+        if len(reused) > 0:
+            relations = self.add_relations(self.execute_query(self.get_edges_query, {"ids": reused}))
+            self.patch_connectivity(relations, 1)
 
     @staticmethod
     @unit_of_work(timeout=60*1000)
-    def _new_execute(tx, query):
+    def _new_execute(tx, query, parameters=None):
         query_result = -1
-        query_execute = tx.run(query)
+        query_execute = tx.run(query, parameters)
         query_data = query_execute.data()
         return query_data
@@ -1,17 +1,26 @@
 import os
 import time
 import json
+import queue
+import random
 import threading
 import configparser
 import datetime
+import multiprocessing
 from neo4j import GraphDatabase
 
+from generation_context import RandomStream
+
 class Testing:
     def init_testing_configs(self):
         config = configparser.ConfigParser()
         config.read('graphgenie.ini')
         self.threads = []
         self.prev_results = []
+        # the executor threads of the pipeline update the counters concurrently
+        self.counter_lock = threading.Lock()
+        # and write to the log files, one line at a time
+        self.log_lock = threading.Lock()
         self.bug_rules_eval = [0, 0, 0]
         self.variant = int(config['testing_configs']['variant'])
         self.multi_threading = int(config['testing_configs']['multi_threading'])
@@ -31,6 +40,14 @@ class Testing:
         self.testing_times = int(config['testing_configs']['testing_times'])
         self.statistics = int(config['testing_configs']['statistics'])
         self.logging_stop = int(config['testing_configs']['logging_stop'])
+        self.pipeline = int(config['testing_configs']['pipeline'])
+        self.pipeline_generators = int(config['testing_configs']['pipeline_generators'])
+        self.pipeline_mutators = int(config['testing_configs']['pipeline_mutators'])
+        self.pipeline_executors = int(config['testing_configs']['pipeline_executors'])
+        self.pipeline_queue_size = int(config['testing_configs']['pipeline_queue_size'])
+        self.pipeline_max_failures = int(config['testing_configs']['pipeline_max_failures'])
+        seed = config['testing_configs']['pipeline_seed']
+        self.pipeline_seed = int(seed) if seed else None
 
     def init_log(self):
         if os.path.exists(self.logpath) and os.path.getsize(self.logpath)>self.min_save_log_size:
@@ -40,26 +57,29 @@ class Testing:
         if os.path.exists(self.exception_logpath):
             os.system("mv {} ./logs/exception.log-{}".format(self.exception_logpath, str(time.time())))
 
-    # TODO: multi-thread sync
+    # log, bug_log and except_log are called from the executor threads of the pipeline
 
     def log(self, text):
         #TODO: Return this to normal
-        print(text)
-        # f = open(self.logpath, "a+")
-        # f.write(text)
-        # f.close()
+        with self.log_lock:
+            print(text)
+            # f = open(self.logpath, "a+")
+            # f.write(text)
+            # f.close()
 
     def bug_log(self, text):
-        f = open(self.bug_logpath, "a+")
-        f.write(text)
-        f.close()
+        with self.log_lock:
+            f = open(self.bug_logpath, "a+")
+            f.write(text)
+            f.close()
 
     def except_log(self, text):
         if "imeout" in text:
             return
-        f = open(self.exception_logpath, "a+")
-        f.write(text)
-        f.close()
+        with self.log_lock:
+            f = open(self.exception_logpath, "a+")
+            f.write(text)
+            f.close()
 
     def print_testing_results(self):
         self.log("number of tested base queries: {}\n".format(self.executed_base_query_num))
@@ -69,9 +89,10 @@ class Testing:
         diff = max(base_time, testing_time)/min(base_time, testing_time)
         if diff>self.threshold and testing_time>50.0 and testing_time<base_time:
             self.log("[***** Potential Performance Bug: DIFF={:.2f}times *****]\n".format(diff))
-            self.bug_rules_eval[0] += self.current_rules_eval[0]
-            self.bug_rules_eval[1] += self.current_rules_eval[1]
-            self.bug_rules_eval[2] += self.current_rules_eval[2]
+            with self.counter_lock:
+                self.bug_rules_eval[0] += self.current_rules_eval[0]
+                self.bug_rules_eval[1] += self.current_rules_eval[1]
+                self.bug_rules_eval[2] += self.current_rules_eval[2]
             return 1
         return 0
 
@@ -88,16 +109,17 @@ class Testing:
             if base_result==None or test_result==None:
                 self.log("[***** None Check *****]\n")
             else:
-                # remove reduplicate bugs in one testing case
-                if test_result in self.prev_results:
-                    return
-                self.detected_bug_num += 1
-                self.bug_rules_eval[0] += self.current_rules_eval[0]
-                self.bug_rules_eval[1] += self.current_rules_eval[1]
-                self.bug_rules_eval[2] += self.current_rules_eval[2]
-                self.log("[***** No.{} Potential Logic Bug: {} {} *****]\n".format(self.detected_bug_num, base_result, test_result))
-                self.bug_log("{}\n[***** No.{} Potential Logic Bug:\n\tbase_query={}\n\ttest_query={}\n\tbase_result={}\ttest_result={}\n*****]\n".format(datetime.datetime.now(), self.detected_bug_num, base_query, test_query, base_result, test_result))
-                self.prev_results.append(test_result)
+                with self.counter_lock:
+                    # remove reduplicate bugs in one testing case
+                    if test_result in self.prev_results:
+                        return
+                    self.detected_bug_num += 1
+                    self.bug_rules_eval[0] += self.current_rules_eval[0]
+                    self.bug_rules_eval[1] += self.current_rules_eval[1]
+                    self.bug_rules_eval[2] += self.current_rules_eval[2]
+                    self.log("[***** No.{} Potential Logic Bug: {} {} *****]\n".format(self.detected_bug_num, base_result, test_result))
+                    self.bug_log("{}\n[***** No.{} Potential Logic Bug:\n\tbase_query={}\n\ttest_query={}\n\tbase_result={}\ttest_result={}\n*****]\n".format(datetime.datetime.now(), self.detected_bug_num, base_query, test_query, base_result, test_result))
+                    self.prev_results.append(test_result)
 
 
     def performance_verification(self, base_query, testing_query, version):
@@ -115,6 +137,8 @@ class Testing:
 
     # only for testing single version single instance, no index testing
     def testing(self, random_cypher_generator, cypher_query_mutator):
+        if self.pipeline==1:
+            return self.pipeline_testing(random_cypher_generator, cypher_query_mutator)
         for i in range(self.testing_times):
             print("{} round testing".format(i+1))
             self.current_rules_eval = [0, 0, 0]
@@ -135,7 +159,7 @@ class Testing:
                 base_query_result = -1
                 base_query_time = -1
                 base_query_result, base_query_time = self.execute_ret_result_time(query=base_query, log_str="[BASE QUERY]")
-                equivalent_queries_transactions_create,equivalent_queries_transaction_match,equivalent_queries_transactions_delete  = cypher_query_mutator.generate_equivalent_queries(base_query)
+                equivalent_queries_transactions_create,equivalent_queries_transaction_match,equivalent_queries_transactions_delete  = cypher_query_mutator.generate_equivalent_queries(base_query, random_cypher_generator.last_query_metadata["ir"])
 
                 if base_query_time>0:
                     #Sequentially execute equivalent queries
@@ -157,6 +181,136 @@ class Testing:
                 if a=="q":
                     break
 
+    # Streaming version of testing(), each stage feeds the next through a bounded queue:
+    #   generation (pipeline_generators processes) -> mutation (pipeline_mutators processes)
+    #   -> execution (pipeline_executors threads) -> checking (this thread)
+    # A full queue blocks the stage before it, so the generators run at most
+    # pipeline_queue_size queries ahead of the database, which always has queries waiting.
+    # Worker processes are forked: they inherit the generator, the mutator and graph_full
+    # without pickling them. A round stops after max_testing_query_num base queries.
+    def pipeline_testing(self, random_cypher_generator, cypher_query_mutator):
+        processes = multiprocessing.get_context("fork")
+        for i in range(self.testing_times):
+            print("{} round pipeline testing".format(i+1))
+            self.current_rules_eval = [0, 0, 0]
+            self.executed_allquery = 0
+            self.executed_query_num = 0
+            self.executed_base_query_num = 0
+            self.detected_bug_num = 0
+            random_cypher_generator.init()
+            seed = self.pipeline_seed + i if self.pipeline_seed is not None else None
+            streams = RandomStream.spawn(seed, self.pipeline_generators + self.pipeline_mutators)
+            stop = processes.Event()
+            generated = processes.Queue(self.pipeline_queue_size)
+            mutated = processes.Queue(self.pipeline_queue_size)
+            executed = queue.Queue(self.pipeline_queue_size)
+            workers = [
+                processes.Process(target=self.generation_stage, args=(random_cypher_generator, streams[w], generated, stop, self.pipeline_max_failures, seed is not None), daemon=True)
+                for w in range(self.pipeline_generators)
+            ] + [
+                processes.Process(target=self.mutation_stage, args=(cypher_query_mutator, streams[self.pipeline_generators + w], generated, mutated, stop), daemon=True)
+                for w in range(self.pipeline_mutators)
+            ]
+            for worker in workers:
+                worker.start()
+            executors = [threading.Thread(target=self.execution_stage, args=(mutated, executed, stop), daemon=True) for _ in range(self.pipeline_executors)]
+            for executor in executors:
+                executor.start()
+            started = time.time()
+            try:
+                self.checking_stage(executed, stop)
+            finally:
+                stop.set()
+                for worker in workers:
+                    worker.terminate()
+                    worker.join()
+                # unblock the executors waiting on a full queue
+                while any(executor.is_alive() for executor in executors):
+                    try:
+                        executed.get(timeout=1)
+                    except queue.Empty:
+                        pass
+            elapsed = time.time() - started
+            self.log("{} base queries in {:.1f}s ({:.2f} base queries/s, {} queries executed)\n".format(self.executed_base_query_num, elapsed, self.executed_base_query_num / max(elapsed, 1e-9), self.executed_query_num))
+            self.print_testing_results()
+
+    @staticmethod
+    def generation_stage(random_cypher_generator, stream, generated, stop, max_failures, seeded):
+        # worker process: base queries and their metadata from a fork of the generator,
+        # a seeded round does not use the fragment pool so that it replays exactly
+        generator = random_cypher_generator.fork(stream, fragment_pool=not seeded)
+        failures = 0
+        while not stop.is_set():
+            try:
+                base_query = generator.random_query_generator()
+            except Exception as e:
+                failures += 1
+                print("Generation failed: {}".format(str(e)))
+                if failures >= max_failures:
+                    # the generator keeps failing, the round is stopped instead of spinning
+                    print("Generation failed {} times in a row, stopping the round".format(failures))
+                    stop.set()
+                    return
+                time.sleep(min(0.01 * 2 ** failures, 1.0))
+                continue
+            failures = 0
+            generated.put((base_query, dict(generator.last_query_metadata or {}, cost=generator.last_query_cost)))
+
+    @staticmethod
+    def mutation_stage(cypher_query_mutator, stream, generated, mutated, stop):
+        # worker process: sequentialised equivalent queries of each base query
+        # the mutators use the random module, its state was copied by the fork
+        random.seed(int(stream.generate_state(1)[0]))
+        while not stop.is_set():
+            try:
+                base_query, metadata = generated.get(timeout=1)
+            except queue.Empty:
+                continue
+            try:
+                create_queries, match_query, delete_queries = cypher_query_mutator.generate_equivalent_queries(base_query, metadata.get("ir"))
+            except Exception as e:
+                print("Mutation failed: {}\nQuery:{}\n".format(str(e), base_query))
+                continue
+            mutated.put((base_query, metadata, create_queries, match_query, delete_queries))
+
+    def execution_stage(self, mutated, executed, stop):
+        # executor thread: the base query, then the equivalent one between its create and
+        # delete queries, exactly as testing() does
+        while not stop.is_set():
+            try:
+                base_query, metadata, create_queries, match_query, delete_queries = mutated.get(timeout=1)
+            except queue.Empty:
+                continue
+            base_query_result, base_query_time = self.execute_ret_result_time(query=base_query, log_str="[BASE QUERY]")
+            eq_query_result, eq_query_time = None, -1
+            if base_query_time>0:
+                for create_query in create_queries:
+                    self.execute_no_log(create_query)
+                eq_query_result, eq_query_time = self.execute_ret_result_time(query=match_query, log_str="[Equivalent]")
+                for delete_query in delete_queries:
+                    self.execute_no_log(delete_query)
+            executed.put((base_query, base_query_result, base_query_time, match_query, eq_query_result, eq_query_time))
+
+    def checking_stage(self, executed, stop):
+        # test oracles on the executed pairs, in this thread only
+        while self.executed_base_query_num < self.max_testing_query_num:
+            try:
+                base_query, base_query_result, base_query_time, match_query, eq_query_result, eq_query_time = executed.get(timeout=1)
+            except queue.Empty:
+                if stop.is_set():
+                    return
+                continue
+            if self.executed_base_query_num % self.logging_stop == 0:
+                self.log("{} executed. Rules evaluation statitics: {}\n".format(self.executed_base_query_num, str(self.bug_rules_eval)))
+            self.prev_results.clear()
+            self.executed_base_query_num += 1
+            self.log("=================================\n")
+            self.log("No.{} Base Query: {} \n".format(self.executed_base_query_num, base_query))
+            if base_query_time>0:
+                self.result_checking(base_query_result, eq_query_result, base_query, match_query)
+                if self.perf_issue==1 and base_query_time>self.minimum_test_ms:
+                    self.time_checking(base_query_time, eq_query_time)
+
 
 class Neo4jTesting(Testing):
     # Neo4j Config
@@ -209,9 +363,11 @@ class Neo4jTesting(Testing):
                 print('\nQuery:{}\nInfo:{}\n'.format(query, str(e)))
                 # self.except_log('\nQuery:{}\nInfo:{}\n'.format(query, str(e)))
                 return None, -1
-            self.executed_allquery += 1
-            self.log("No.{} {} Query=\"{}\"\n\tQuery Result={}\n\tQuery Time={}\n".format(self.executed_allquery, log_str, query, query_result, query_time))
-        self.executed_query_num += 1
+            with self.counter_lock:
+                self.executed_allquery += 1
+                self.executed_query_num += 1
+                executed_allquery = self.executed_allquery
+            self.log("No.{} {} Query=\"{}\"\n\tQuery Result={}\n\tQuery Time={}\n".format(executed_allquery, log_str, query, query_result, query_time))
         return query_result, query_time
 
     @staticmethod
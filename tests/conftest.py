@@ -0,0 +1,6 @@
+import os
+import sys
+
+# the modules of the repository are top level modules, see main.py
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+gt = pytest.importorskip("graph_tool.all")
+
+from graph_index import PathSampler
+from property_store import ObjectPropertyStore
+
+
+def labelled_graph(labels, edges):
+    graph = gt.Graph(directed=True)
+    graph.add_vertex(len(labels))
+    store = ObjectPropertyStore(graph)
+    store.init_maps()
+    store.add_nodes([{"vertex": vertice, "labels": [label], "properties": {}} for vertice, label in enumerate(labels)])
+    graph.add_edge_list(np.array(edges, dtype=np.int64))
+    return graph, store
+
+
+def test_sample_pattern_weights_the_neighbours_not_their_offsets():
+    # (:A)-->(:B)-->(:C) where the start vertex 0 has 40 dead end B neighbours and two that
+    # complete the pattern: the low degree vertex 1 and the supernode 42. The probes mostly
+    # miss, so the weighted fallback picks the hop. Vertex 1 is at offset 0 of the neighbour
+    # list (whose vertex, 0, has a high degree) and vertex 42 at offset 41 (a degree one dead
+    # end), weighting the offsets would prefer the supernode.
+    dead_ends = list(range(2, 42))
+    supernode_targets = list(range(44, 244))
+    labels = ["A", "B"] + ["B"] * len(dead_ends) + ["B", "C"] + ["C"] * len(supernode_targets)
+    edges = [(0, 1), (0, 42), (1, 43)] + [(0, vertice) for vertice in dead_ends] + [(42, vertice) for vertice in supernode_targets]
+    graph, store = labelled_graph(labels, edges)
+    sampler = PathSampler(graph, max_attempts=1, seed=0, property_store=store, supernode_mode="weight", supernode_degree=5)
+
+    endpoints = {int(edge): (int(source), int(target)) for source, target, edge in graph.get_edges([graph.edge_index])}
+    hops = []
+    for _ in range(200):
+        path, path_edges = sampler.sample_pattern(["A", "B", "C"], [(None, ">"), (None, ">")])
+        assert len(path) == 3
+        assert [endpoints[edge] for edge in path_edges] == list(zip(path[:-1], path[1:]))
+        hops.append(path[1])
+    # acceptance of the supernode is 5/201, of vertex 1 it is 1
+    assert hops.count(1) >= 180
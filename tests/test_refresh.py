@@ -0,0 +1,232 @@
+import os
+
+import numpy as np
+import pytest
+
+gt = pytest.importorskip("graph_tool.all")
+pytest.importorskip("neo4j")
+
+from schema_scanner import Neo4jSchemaScanner
+from graph_index import PathSampler
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+VALUE_TYPES = {int: "INTEGER NOT NULL", str: "STRING NOT NULL"}
+
+
+class FakeDatabase():
+    # nodes {id: (labels, properties)} and relationships {id: (source, target, type)}
+    def __init__(self):
+        self.nodes = {}
+        self.relations = {}
+
+    def add_node(self, node_id, labels, **properties):
+        self.nodes[node_id] = (list(labels), properties)
+
+    def add_relation(self, rel_id, source, target, edge_type):
+        self.relations[rel_id] = (source, target, edge_type)
+
+    def delete_node(self, node_id):
+        del self.nodes[node_id]
+        for rel_id in [rel_id for rel_id, (source, target, _) in self.relations.items() if node_id in (source, target)]:
+            del self.relations[rel_id]
+
+    def connectivity_counts(self):
+        counts = {}
+        for source, target, edge_type in self.relations.values():
+            for source_label in self.nodes[source][0]:
+                for target_label in self.nodes[target][0]:
+                    key = (source_label, edge_type, target_label)
+                    counts[key] = counts.get(key, 0) + 1
+        return counts
+
+
+class FakeScanner(Neo4jSchemaScanner):
+    # answers the queries of scan_graph_fill and refresh from a FakeDatabase
+    def __init__(self, db, **settings):
+        super().__init__("", 0, "", "")
+        self.db = db
+        self.use_snapshot = 0
+        self.scan_batch_size = 3
+        self.node_connectivity = 1
+        for key, value in settings.items():
+            setattr(self, key, value)
+        self.node_labels = sorted({label for labels, _ in db.nodes.values() for label in labels})
+        self.edge_labels = sorted({edge_type for _, _, edge_type in db.relations.values()})
+        self.node_properties = {label: [] for label in self.node_labels}
+        self.properties_types = {}
+        self.label_properties_types = {label: {} for label in self.node_labels}
+        self.patch_schema([self.node_row(node_id) for node_id in db.nodes])
+        self.connectivity_counts = {}
+        self.connectivity_matrix = []
+
+    def scan_fake(self):
+        self.graph_full = gt.Graph(directed=True)
+        self.scan_graph_fill()
+        self.fill_connectivity(self.db.connectivity_counts())
+        self.scan_connectivity_matrix()
+        self.scan_degree_statistics()
+
+    def node_row(self, node_id):
+        labels, properties = self.db.nodes[node_id]
+        return {
+            "id": node_id, "element_id": "4:x:{}".format(node_id), "labels": list(labels), "properties": dict(properties),
+            "types": [[key, VALUE_TYPES[type(value)]] for key, value in properties.items()],
+        }
+
+    def relation_row(self, rel_id):
+        source, target, edge_type = self.db.relations[rel_id]
+        return {"source": source, "target": target, "type": edge_type, "id": rel_id}
+
+    def execute_query(self, query, parameters=None):
+        db = self.db
+        parameters = parameters or {}
+        if query == self.get_largest_node_id_query:
+            return [{"largest_id": max(db.nodes) if db.nodes else None}]
+        if query == self.get_largest_edge_id_query:
+            return [{"largest_id": max(db.relations) if db.relations else None}]
+        if query == self.get_node_count_query:
+            return [{"count": len(db.nodes)}]
+        if query == self.get_edge_count_query:
+            return [{"count": len(db.relations)}]
+        if query in (self.get_nodes_page_query, self.get_typed_nodes_page_query):
+            return [self.node_row(node_id) for node_id in sorted(db.nodes) if parameters["lower"] <= node_id < parameters["upper"]]
+        if query == self.get_edges_page_query:
+            return [self.relation_row(rel_id) for rel_id in sorted(db.relations) if parameters["lower"] <= rel_id < parameters["upper"]]
+        if query == self.get_typed_nodes_query:
+            return [self.node_row(node_id) for node_id in parameters["ids"] if node_id in db.nodes]
+        if query == self.get_edges_query:
+            return [self.relation_row(rel_id) for rel_id in parameters["ids"] if rel_id in db.relations]
+        if query in (self.set_ids_page_query, self.set_ids_query, "match (n) set n.id = id(n)"):
+            for node_id, (_, properties) in db.nodes.items():
+                if "ids" in parameters and node_id not in parameters["ids"]:
+                    continue
+                if "lower" in parameters and not parameters["lower"] <= node_id < parameters["upper"]:
+                    continue
+                properties["id"] = node_id
+            return []
+        if query == self.get_unlabeled_ids_query:
+            return [{"id": node_id} for node_id, (labels, _) in db.nodes.items() if len(labels) == 0]
+        labels = {label for labels, _ in db.nodes.values() for label in labels} | set(self.node_labels)
+        for label in labels:
+            if query == self.get_label_count_query.format(label):
+                return [{"count": sum(label in labels for labels, _ in db.nodes.values())}]
+            if query == self.get_label_ids_query.format(label):
+                return [{"id": node_id} for node_id, (labels, _) in db.nodes.items() if label in labels]
+        edge_types = {edge_type for _, _, edge_type in db.relations.values()} | set(self.edge_labels)
+        for edge_type in edge_types:
+            if query == self.get_type_count_query.format(edge_type):
+                return [{"count": sum(edge_type == other for _, _, other in db.relations.values())}]
+            if query == self.get_type_ids_query.format(edge_type):
+                return [{"id": rel_id} for rel_id, (_, _, other) in db.relations.items() if edge_type == other]
+        raise AssertionError("unexpected query: {}".format(query))
+
+
+def movie_database():
+    db = FakeDatabase()
+    for node_id in range(6):
+        db.add_node(node_id, ["Person"], name="p{}".format(node_id))
+    for node_id in range(6, 10):
+        db.add_node(node_id, ["Movie"], year=2000 + node_id)
+    rel_id = 0
+    for source in range(6):
+        for target in (6 + source % 4, 6 + (source + 1) % 4):
+            db.add_relation(rel_id, source, target, "RATED")
+            rel_id += 1
+    db.add_relation(rel_id, 0, 1, "KNOWS")
+    db.add_relation(rel_id + 1, 1, 2, "KNOWS")
+    return db
+
+
+def mirrored_relations(scanner):
+    # {rel id: (source id, target id, type)} of graph_full
+    graph = scanner.graph_full
+    edges = graph.get_edges([graph.ep["type_id"], graph.ep["rel_id"]]).astype(np.int64)
+    sources = scanner.vertex_node_ids(edges[:, 0])
+    targets = scanner.vertex_node_ids(edges[:, 1])
+    edge_types = graph.gp["edge_types"]
+    return {int(rel_id): (int(source), int(target), edge_types[type_id]) for source, target, type_id, rel_id in zip(sources, targets, edges[:, 2], edges[:, 3])}
+
+
+def mirrored_nodes(scanner):
+    # {id: labels} of the mirrored vertices
+    vertices = np.flatnonzero(scanner.graph_full.vp["mirrored"].a)
+    return {int(node_id): scanner.property_store.labels(int(vertice)) for vertice, node_id in zip(vertices, scanner.vertex_node_ids(vertices))}
+
+
+def change_database(db):
+    # new nodes and relationships, a deleted node (with its relationships), a deleted
+    # relationship and a deleted id reused by a node with another label
+    db.add_node(10, ["Person"], name="p10")
+    db.add_node(11, ["Genre"], name="drama")
+    db.add_relation(20, 10, 6, "RATED")
+    db.add_relation(21, 6, 11, "IN_GENRE")
+    db.add_relation(22, 7, 11, "IN_GENRE")
+    db.delete_node(3)
+    del db.relations[0]
+    db.delete_node(9)
+    db.add_node(9, ["Genre"], name="comedy")
+    db.add_relation(23, 8, 9, "IN_GENRE")
+
+
+@pytest.mark.parametrize("read_only_scan", [1, 0])
+def test_refresh_matches_a_new_scan(monkeypatch, read_only_scan):
+    monkeypatch.chdir(ROOT)
+    db = movie_database()
+    scanner = FakeScanner(db, read_only_scan=read_only_scan)
+    scanner.scan_fake()
+    sampler = PathSampler(scanner.graph_full, seed=0, property_store=scanner.property_store)
+    sampler.sample(2)
+    sampler.label_vertices()
+    sampler.typed_csr("RATED", ">", "Movie")
+
+    change_database(db)
+    scanner.refresh(sampler)
+
+    assert mirrored_nodes(scanner) == {node_id: labels for node_id, (labels, _) in db.nodes.items()}
+    assert mirrored_relations(scanner) == db.relations
+    assert scanner.mirror_node_count == len(db.nodes)
+    assert scanner.mirror_edge_count == len(db.relations)
+    assert scanner.connectivity_counts == db.connectivity_counts()
+    assert "Genre" in scanner.node_labels and "IN_GENRE" in scanner.edge_labels
+    assert scanner.connectivity_per_edge_label.edge_count(
+        scanner.node_vertices([8])[0], scanner.node_vertices([9])[0], "IN_GENRE") == 1
+
+    # the sampler answers from the refreshed graph, like one built after the change
+    fresh = PathSampler(scanner.graph_full, seed=0, property_store=scanner.property_store)
+    for refreshed, expected in zip(sampler.csr(">"), fresh.csr(">")):
+        assert np.array_equal(refreshed, expected)
+    assert sampler.label_vertices().keys() == fresh.label_vertices().keys()
+    for label, vertices in fresh.label_vertices().items():
+        assert np.array_equal(sampler.label_vertices()[label], vertices)
+    for refreshed, expected in zip(sampler.typed_csr("IN_GENRE", ">", "Genre"), fresh.typed_csr("IN_GENRE", ">", "Genre")):
+        assert np.array_equal(refreshed, expected)
+    pairs = {(source, target) for source, target, _ in db.relations.values()}
+    for _ in range(20):
+        path = scanner.vertex_node_ids(np.asarray(sampler.sample(2, 3), dtype=np.int64))
+        for source, target in zip(path[:-1], path[1:]):
+            assert (source, target) in pairs
+
+
+def test_refresh_respects_the_sample_budget(monkeypatch):
+    monkeypatch.chdir(ROOT)
+    db = movie_database()
+    scanner = FakeScanner(db, read_only_scan=1)
+    scanner.scan_fake()
+    scanner.graph_fill_mode = "sample"
+    scanner.sample_max_vertices = len(db.nodes) + 2
+    scanner.sample_max_edges = len(db.relations) + 1
+    for node_id in range(10, 20):
+        db.add_node(node_id, ["Person"], name="p{}".format(node_id))
+    for rel_id in range(20, 26):
+        db.add_relation(rel_id, 10 + rel_id % 3, 6, "RATED")
+
+    scanner.refresh()
+
+    assert scanner.mirror_node_count == scanner.sample_max_vertices
+    assert scanner.graph_full.num_vertices() == scanner.sample_max_vertices
+    assert scanner.mirror_edge_count == scanner.sample_max_edges
+    nodes = mirrored_nodes(scanner)
+    for rel_id, (source, target, edge_type) in mirrored_relations(scanner).items():
+        assert db.relations[rel_id] == (source, target, edge_type)
+        assert source in nodes and target in nodes